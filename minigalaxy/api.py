@@ -1,17 +1,42 @@
 import os
+import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlencode
 import requests
 import xml.etree.ElementTree as ET
+from minigalaxy.catalog import Catalog
 from minigalaxy.game import Game
-from minigalaxy.constants import IGNORE_GAME_IDS, SESSION
+from minigalaxy.constants import IGNORE_GAME_IDS, MAX_PARALLEL_API_REQUESTS, SESSION
 from minigalaxy.config import Config
+from minigalaxy.http_cache import HttpCache
+from minigalaxy.rate_limiter import RateLimiter
+from minigalaxy.request_trace import RequestTrace
+
+
+# Tokens are refreshed in the background this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+
+
+# The fields of the products of the library which are kept in the catalog
+CATALOG_PRODUCT_FIELDS = ["id", "title", "url", "image", "worksOn"]
+
+
+# The sections of the product info which are only included when they're asked for
+PRODUCT_INFO_SECTIONS = ["downloads", "expanded_dlcs", "description", "screenshots", "videos", "related_products",
+                         "changelog"]
 
 
 class NoDownloadLinkFound(BaseException):
     pass
 
 
+# GOG kept throttling the request or answered it with a server error
+class ApiError(requests.exceptions.HTTPError):
+    pass
+
+
 class Api:
     def __init__(self):
         self.login_success_url = "https://embed.gog.com/on_login_success"
@@ -21,16 +46,27 @@ class Api:
         self.debug = os.environ.get("MG_DEBUG")
         self.active_token = False
         self.active_token_expiration_time = time.time()
+        # Maps the requests which are being made to their result, so the same request isn't made twice at once
+        self.__in_flight = {}
+        self.__in_flight_lock = threading.Lock()
+        # Maps (game id, section) to the time it was retrieved and the section of the product info
+        self.__info = {}
+        self.__info_lock = threading.Lock()
+        # Only one thread refreshes the token at a time
+        self.__token_lock = threading.Lock()
+        self.__token_refresh_timer = None
 
     # use a method to authenticate, based on the information we have
     # Returns an empty string if no information was entered
     def authenticate(self, login_code: str = None, refresh_token: str = None) -> str:
-        if refresh_token:
-            return self.__refresh_token(refresh_token)
-        elif login_code:
-            return self.__get_token(login_code)
-        else:
-            return ''
+        # Requests which find the token expired wait for this token instead of refreshing it at the same time
+        with self.__token_lock:
+            if refresh_token:
+                return self.__refresh_token(refresh_token)
+            elif login_code:
+                return self.__get_token(login_code)
+            else:
+                return ''
 
     # Get a new token with the refresh token received when authenticating the last time
     def __refresh_token(self, refresh_token: str) -> str:
@@ -64,53 +100,108 @@ class Api:
             expires_in = response_params["expires_in"]
             self.active_token_expiration_time = time.time() + int(expires_in)
             refresh_token = response_params["refresh_token"]
+            self.__schedule_token_refresh(int(expires_in))
         else:
             refresh_token = ""
         return refresh_token
 
-    # Get all Linux games in the library of the user. Ignore other platforms and movies
-    def get_library(self):
-        err_msg = ""
+    # Only retrieve the library when the owned products changed since the last time, or the catalog is outdated.
+    # Returns a dict with the games which were added, removed and changed since the last time, and an error message.
+    def sync_library(self, owned_ids=None, page_func=None, max_parallel_requests=MAX_PARALLEL_API_REQUESTS):
+        changes = {"added": [], "removed": [], "changed": []}
+        if not self.active_token:
+            return changes, "Couldn't connect to GOG servers"
+        if owned_ids is None:
+            owned_ids = self.get_owned_products_ids()
+        if owned_ids is None:
+            return changes, "Couldn't connect to GOG servers"
+        if Catalog.is_current(owned_ids):
+            return changes, ""
+        previous_products = Catalog.get_products()
+        try:
+            products = self.__get_library_products(page_func, max_parallel_requests)
+        except requests.exceptions.RequestException as e:
+            # The games from the catalog are still shown
+            print(e)
+            return changes, "Couldn't connect to GOG servers"
+        Catalog.save(owned_ids, products)
+        return self.get_library_changes(previous_products, products), ""
+
+    # The games of the library from the last time it was retrieved, without making any requests
+    def get_cached_library(self):
+        return self.get_games(Catalog.get_products())
+
+    # The first page tells how many pages there are, the others are requested at the same time. page_func is called
+    # with the games of every page as soon as it arrives, which isn't necessarily in the order of the pages.
+    def __get_library_products(self, page_func, max_parallel_requests):
+        response = self.__get_library_page(1)
+        pages = {1: self.__get_catalog_products(response["products"])}
+        if page_func:
+            page_func(self.get_games(pages[1]))
+        with ThreadPoolExecutor(max_workers=max_parallel_requests) as executor:
+            futures = {executor.submit(self.__get_library_page, page): page
+                       for page in range(2, response["totalPages"] + 1)}
+            for future in as_completed(futures):
+                pages[futures[future]] = self.__get_catalog_products(future.result()["products"])
+                if page_func:
+                    page_func(self.get_games(pages[futures[future]]))
+        products = []
+        for page in sorted(pages):
+            products.extend(pages[page])
+        return products
+
+    @staticmethod
+    def __get_catalog_products(products):
+        # Only keep what's needed to create the games, so changes to other fields don't count as changes
+        return [{key: product.get(key) for key in CATALOG_PRODUCT_FIELDS} for product in products]
+
+    @staticmethod
+    def get_library_changes(previous_products, products) -> dict:
+        previous = {product["id"]: product for product in previous_products}
+        current = {product["id"]: product for product in products}
+        return {
+            "added": Api.get_games([product for product in products if product["id"] not in previous]),
+            "removed": Api.get_games([product for product in previous_products if product["id"] not in current]),
+            "changed": Api.get_games([product for product in products
+                                      if product["id"] in previous and product != previous[product["id"]]])
+        }
+
+    def __get_library_page(self, page):
+        url = "https://embed.gog.com/account/getFilteredProducts"
+        params = {
+            'mediaType': 1,  # 1 means game
+            'page': page,
+        }
+        return self.__request(url, params=params)
+
+    @staticmethod
+    def get_games(products):
         games = []
-        if self.active_token:
-            current_page = 1
-            all_pages_processed = False
-            url = "https://embed.gog.com/account/getFilteredProducts"
-
-            while not all_pages_processed:
-                params = {
-                    'mediaType': 1,  # 1 means game
-                    'page': current_page,
-                }
-                response = self.__request(url, params=params)
-                total_pages = response["totalPages"]
-
-                for product in response["products"]:
-                    if product["id"] not in IGNORE_GAME_IDS:
-                        # Only support Linux unless the show_windows_games setting is enabled
-                        if product["worksOn"]["Linux"]:
-                            platform = "linux"
-                        elif Config.get("show_windows_games"):
-                            platform = "windows"
-                        else:
-                            continue
-                        if not product["url"]:
-                            print("{} ({}) has no store page url".format(product["title"], product['id']))
-                        game = Game(name=product["title"], url=product["url"], game_id=product["id"],
-                                    image_url=product["image"], platform=platform)
-                        games.append(game)
-                if current_page == total_pages:
-                    all_pages_processed = True
-                current_page += 1
-        else:
-            err_msg = "Couldn't connect to GOG servers"
-        return games, err_msg
+        for product in products:
+            if product["id"] not in IGNORE_GAME_IDS:
+                # Only support Linux unless the show_windows_games setting is enabled
+                if product["worksOn"]["Linux"]:
+                    platform = "linux"
+                elif Config.get("show_windows_games"):
+                    platform = "windows"
+                else:
+                    continue
+                if not product["url"]:
+                    print("{} ({}) has no store page url".format(product["title"], product['id']))
+                game = Game(name=product["title"], url=product["url"], game_id=product["id"],
+                            image_url=product["image"], platform=platform)
+                games.append(game)
+        return games
 
     def get_owned_products_ids(self):
         if not self.active_token:
             return
         url2 = "https://embed.gog.com/user/data/games"
-        response2 = self.__request(url2)
+        try:
+            response2 = self.__request(url2)
+        except requests.exceptions.RequestException as e:
+            print(e)
+            return
         return response2["owned"]
 
     # Generate the URL for the login page for GOG
@@ -126,19 +217,49 @@ class Api:
     def get_redirect_url(self) -> str:
         return self.redirect_uri
 
-    # Get Extrainfo about a game
-    def get_info(self, game: Game) -> dict:
-        request_url = "https://api.gog.com/products/{}?expand=downloads,expanded_dlcs,description,screenshots,videos," \
-                      "related_products,changelog ".format(str(game.id))
-        response = self.__request(request_url)
+    # Get Extrainfo about a game. The basic info, like the links, is always included, of the bigger sections only the
+    # ones which are asked for. Sections which were retrieved recently aren't requested again.
+    def get_info(self, game: Game, sections=PRODUCT_INFO_SECTIONS) -> dict:
+        info = self.__get_cached_info(game.id, sections)
+        missing_sections = sorted(section for section in sections if section not in info)
+        if missing_sections or None not in info:
+            request_url = "https://api.gog.com/products/{}".format(str(game.id))
+            params = {'expand': ",".join(missing_sections)} if missing_sections else None
+            response = self.__request(request_url, params=params, cached=True)
+            if "id" not in response:
+                # Errors aren't cached
+                return response
+            info.update(self.__cache_info(game.id, missing_sections, response))
+        response = dict(info.pop(None))
+        response.update(info)
         return response
 
+    def __get_cached_info(self, game_id, sections) -> dict:
+        # Returns the cached sections which haven't expired, the basic info has None as section
+        now = time.time()
+        ttl = Config.get("api_cache_ttl") or 0
+        with self.__info_lock:
+            info = {}
+            for section in [None] + list(sections):
+                if (game_id, section) in self.__info and now - self.__info[(game_id, section)][0] < ttl:
+                    info[section] = self.__info[(game_id, section)][1]
+            return info
+
+    def __cache_info(self, game_id, sections, response) -> dict:
+        info = {section: response.get(section) for section in sections}
+        info[None] = {key: value for key, value in response.items() if key not in PRODUCT_INFO_SECTIONS}
+        now = time.time()
+        with self.__info_lock:
+            for section, value in info.items():
+                self.__info[(game_id, section)] = (now, value)
+        return info
+
     # This returns a unique download url and a link to the checksum of the download
     def get_download_info(self, game: Game, operating_system="linux", dlc_installers="") -> dict:
         if dlc_installers:
             installers = dlc_installers
         else:
-            response = self.get_info(game)
+            response = self.get_info(game, ["downloads"])
             installers = response["downloads"]["installers"]
         possible_downloads = []
         for installer in installers:
@@ -165,17 +286,31 @@ class Api:
     def get_real_download_link(self, url):
         return self.__request(url)['downlink']
 
-    def get_download_file_md5(self, url):
-        xml_link = self.__request(url)['checksum']
-        xml_string = SESSION.get(xml_link).text
-        root = ET.fromstring(xml_string)
-        return root.attrib['md5']
+    # Get the real link and checksum info of all files of an installer at once, instead of one request after another.
+    # Returns a dict with the url, md5, size and chunks for every downlink, in the same order.
+    def get_download_files(self, downlinks) -> list:
+        # Refresh the token first, otherwise every request would do it
+        self.__refresh_token_if_expired()
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_API_REQUESTS) as executor:
+            return list(executor.map(self.__get_download_file, downlinks))
+
+    def __get_download_file(self, downlink) -> dict:
+        # The same response contains both the real link and the link to the checksum XML
+        response = self.__request(downlink)
+        download_file = {"url": response['downlink'], "md5": "", "size": 0, "chunks": []}
+        if response.get('checksum'):
+            download_file.update(self.__get_checksum_info(response['checksum']))
+        return download_file
 
-    def get_file_size(self, url):
-        xml_link = self.__request(url)['checksum']
-        xml_string = SESSION.get(xml_link).text
+    # The checksum XML contains the md5 and size of the whole file, as well as the md5 of every chunk of it
+    @staticmethod
+    def __get_checksum_info(xml_link) -> dict:
+        xml_string = Api.__check_status(xml_link, SESSION.get(xml_link)).text
         root = ET.fromstring(xml_string)
-        return root.attrib["total_size"]
+        chunks = []
+        for chunk in root.findall("chunk"):
+            chunks.append([int(chunk.attrib["from"]), int(chunk.attrib["to"]), chunk.text])
+        return {"md5": root.attrib["md5"], "size": int(root.attrib["total_size"]), "chunks": chunks}
 
     def get_user_info(self) -> str:
         username = Config.get("username")
@@ -188,7 +323,7 @@ class Api:
 
     def get_version(self, game: Game, gameinfo=None, dlc_name="") -> str:
         if gameinfo is None:
-            gameinfo = self.get_info(game)
+            gameinfo = self.get_info(game, ["downloads", "expanded_dlcs"] if dlc_name else ["downloads"])
         version = "0"
         if dlc_name:
             installers = {}
@@ -213,32 +348,125 @@ class Api:
             return False
         return True
 
-    # Make a request with the active token
-    def __request(self, url: str = None, params: dict = None) -> dict:
-        # Refresh the token if needed
-        if self.active_token_expiration_time < time.time():
-            print("Refreshing token")
-            refresh_token = Config.get("refresh_token")
-            Config.set("refresh_token", self.__refresh_token(refresh_token))
+    # Make a request with the active token, cached responses are only used if cached is True
+    # Callers making the same request while it's being made wait for it and get the same result
+    def __request(self, url: str = None, params: dict = None, cached=False) -> dict:
+        key = (url, urlencode(sorted((params or {}).items())), cached)
+        with self.__in_flight_lock:
+            flight = self.__in_flight.get(key)
+            first_caller = flight is None
+            if first_caller:
+                flight = self.__in_flight[key] = {"done": threading.Event()}
+        if not first_caller:
+            flight["done"].wait()
+            if "error" in flight:
+                raise flight["error"]
+            return flight["result"]
+        try:
+            flight["result"] = self.__make_request(url, params, cached)
+        except Exception as e:
+            flight["error"] = e
+            raise
+        finally:
+            with self.__in_flight_lock:
+                del self.__in_flight[key]
+            flight["done"].set()
+        return flight["result"]
+
+    def __make_request(self, url, params, cached):
+        start = time.monotonic()
+        responses = []
+        try:
+            if cached:
+                return HttpCache.request(url, params,
+                                         lambda headers: self.__send_authorized(url, params, headers, responses),
+                                         Config.get("api_cache_ttl"))
+            return self.__send_authorized(url, params, responses=responses).json()
+        finally:
+            self.__trace(url, responses, time.monotonic() - start, cached)
 
-        # Make the request
+    def __send_authorized(self, url, params=None, extra_headers=None, responses=None):
+        # Every response received is added to responses. The token is only refreshed when the request is sent, so cached
+        # responses can be used without a connection.
+        self.__refresh_token_if_expired()
+        responses = [] if responses is None else responses
+        token = self.active_token
+        response = self.__send(url, params, extra_headers, responses)
+        if response.status_code == 401:
+            # The token was rejected before it expired, get a new one and try once more
+            self.__refresh_token_if_expired(failed_token=token)
+            response = self.__send(url, params, extra_headers, responses)
+        return self.__check_status(url, response)
+
+    @staticmethod
+    def __check_status(url, response):
+        if response.status_code == 429 or response.status_code in range(500, 600):
+            raise ApiError("GOG answered {} with {}".format(url, response.status_code), response=response)
+        return response
+
+    def __send(self, url, params=None, extra_headers=None, responses=None):
         headers = {
             'Authorization': "Bearer {}".format(str(self.active_token)),
         }
-        response = SESSION.get(url, headers=headers, params=params)
+        headers.update(extra_headers or {})
+        return RateLimiter.request(url, lambda: SESSION.get(url, headers=headers, params=params), responses)
+
+    def __trace(self, url, responses, duration, cached):
+        response = responses[-1] if responses else None
+        cache = None
+        if cached:
+            cache = "hit" if response is None else "revalidated" if response.status_code == 304 else "miss"
+        status = size = time_to_first_byte = None
+        retries = max(0, len(responses) - 1)
+        if response is not None:
+            status = response.status_code
+            size = len(response.content)
+            time_to_first_byte = response.elapsed.total_seconds()
+            # Retries made by the transport adapter of SESSION
+            if response.raw.retries:
+                retries += len(response.raw.retries.history)
+        entry = RequestTrace.record("GET", url, status, size, time_to_first_byte, duration, cache, retries)
         if self.debug:
-            print("Request: {}".format(url))
-            print("Return code: {}".format(response.status_code))
-            print("Response body: {}".format(response.text))
-            print("")
-        return response.json()
+            print(json.dumps(entry))
+
+    # The token is refreshed when it expires within margin seconds, or when failed_token is given and still in use
+    def __refresh_token_if_expired(self, margin=0, failed_token=None):
+        with self.__token_lock:
+            if failed_token is not None:
+                refresh_needed = self.active_token == failed_token
+            else:
+                refresh_needed = self.active_token_expiration_time - margin < time.time()
+            if refresh_needed:
+                print("Refreshing token")
+                refresh_token = Config.get("refresh_token")
+                Config.set("refresh_token", self.__refresh_token(refresh_token))
+
+    def __schedule_token_refresh(self, expires_in):
+        if self.__token_refresh_timer:
+            self.__token_refresh_timer.cancel()
+        self.__token_refresh_timer = threading.Timer(max(0, expires_in - TOKEN_REFRESH_MARGIN),
+                                                     self.__refresh_token_in_background)
+        self.__token_refresh_timer.daemon = True
+        self.__token_refresh_timer.start()
+
+    def __refresh_token_in_background(self):
+        # Refresh the token before it expires, so requests don't have to wait for it
+        if not Config.get("refresh_token"):
+            return
+        try:
+            self.__refresh_token_if_expired(margin=TOKEN_REFRESH_MARGIN)
+        except requests.exceptions.RequestException as e:
+            # The token will be refreshed by the next request after it expires
+            print("Refreshing the token failed: {}".format(e))
 
     @staticmethod
     def __request_gamesdb(game: Game):
         request_url = "https://gamesdb.gog.com/platforms/gog/external_releases/{}".format(game.id)
         try:
-            response = SESSION.get(request_url)
-            respones_dict = response.json()
+            respones_dict = HttpCache.request(request_url, None,
+                                              lambda headers: RateLimiter.request(
+                                                  request_url, lambda: SESSION.get(request_url, headers=headers)),
+                                              Config.get("api_cache_ttl"))
         except (requests.exceptions.ConnectionError, ValueError):
             respones_dict = {}
         return respones_dict
@@ -0,0 +1,67 @@
+import threading
+import time
+from datetime import datetime
+from minigalaxy.config import Config
+
+# How long a download can go over its share of the bandwidth, for example after being paused
+MAXIMUM_BURST = 1  # seconds
+
+
+# Token bucket which spreads the configured speed limit over the active downloads.
+# Each priority level doubles the share of the bandwidth a download gets compared to the other downloads.
+class __BandwidthLimiter:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # Maps every active download to the time at which everything it has received so far would be allowed
+        self.__buckets = {}
+
+    def add(self, download):
+        with self.__lock:
+            self.__buckets[download] = time.monotonic()
+
+    def remove(self, download):
+        with self.__lock:
+            self.__buckets.pop(download, None)
+
+    def reset(self):
+        # Forget what was received so far, so a changed limit is used right away
+        with self.__lock:
+            now = time.monotonic()
+            for download in self.__buckets:
+                self.__buckets[download] = now
+
+    # Returns how many seconds the download has to wait before receiving more after receiving size bytes
+    def reserve(self, download, size) -> float:
+        limit = self.get_limit()
+        with self.__lock:
+            if not limit or download not in self.__buckets:
+                return 0
+            total_weight = sum(self.get_weight(d) for d in self.__buckets)
+            rate = limit * 1024 * self.get_weight(download) / total_weight
+            now = time.monotonic()
+            allowed_at = max(self.__buckets[download], now - MAXIMUM_BURST) + size / rate
+            self.__buckets[download] = allowed_at
+            return max(0, allowed_at - now)
+
+    @staticmethod
+    def get_weight(download):
+        return 2 ** download.priority
+
+    # Returns the speed limit in KiB/s which applies right now, 0 for unlimited
+    @staticmethod
+    def get_limit(now=None):
+        if now is None:
+            now = datetime.now()
+        current_time = now.strftime("%H:%M")
+        for start, end, limit in Config.get("download_speed_schedule") or []:
+            if start <= end:
+                active = start <= current_time < end
+            else:
+                # The period goes past midnight
+                active = current_time >= start or current_time < end
+            if active:
+                return limit
+        return Config.get("download_speed_limit") or 0
+
+
+BandwidthLimiter = __BandwidthLimiter()
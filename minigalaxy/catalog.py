@@ -0,0 +1,45 @@
+import os
+import time
+import threading
+from minigalaxy.json_file import load_json_file, save_json_file
+from minigalaxy.paths import CATALOG_PATH
+
+# The whole library is retrieved again after this long, even when no games were added or removed, so changes to the
+# names and images of games are picked up as well
+MAXIMUM_CATALOG_AGE = 24 * 60 * 60  # seconds
+
+
+# Snapshot of the products of the library of the user from the last time it was retrieved from GOG.
+# When the owned products haven't changed since, the library doesn't have to be retrieved again.
+class __Catalog:
+    def __init__(self, catalog_file):
+        self.__catalog_file = catalog_file
+        self.__lock = threading.Lock()
+
+    def save(self, owned_ids, products):
+        with self.__lock:
+            save_json_file(self.__catalog_file, {"time": time.time(), "owned_ids": sorted(owned_ids), "products": products})
+
+    def get_products(self) -> list:
+        with self.__lock:
+            return self.__load_catalog_file().get("products", [])
+
+    # Returns True if the catalog is recent and contains the same products as owned_ids
+    def is_current(self, owned_ids) -> bool:
+        with self.__lock:
+            catalog = self.__load_catalog_file()
+        if not catalog or time.time() - catalog["time"] > MAXIMUM_CATALOG_AGE:
+            return False
+        return catalog["owned_ids"] == sorted(owned_ids)
+
+    def remove(self):
+        with self.__lock:
+            if os.path.isfile(self.__catalog_file):
+                os.remove(self.__catalog_file)
+
+    def __load_catalog_file(self) -> dict:
+        return load_json_file(self.__catalog_file, {},
+                              "Reading {} failed, the library will be retrieved again.".format(self.__catalog_file))
+
+
+Catalog = __Catalog(CATALOG_PATH)
@@ -0,0 +1,181 @@
+import os
+import bisect
+import hashlib
+import threading
+from minigalaxy.json_file import load_json_file, save_json_file
+from minigalaxy.paths import DOWNLOAD_CHECKSUMS_PATH
+
+READ_SIZE = 1024**2
+
+
+# The md5 of a file which is being written, possibly out of order. Data written at the position the hash has
+# reached is hashed from memory, everything written further ahead is read back from the file once the hash gets there.
+class FileHash:
+    def __init__(self, location, position=0):
+        self.location = location
+        self.position = 0
+        self.__md5 = hashlib.md5()
+        self.__lock = threading.Lock()
+        # When resuming, the part which was already written has to be hashed first
+        if position > 0:
+            self.catch_up([[0, position - 1, position]])
+
+    def update(self, position, data):
+        with self.__lock:
+            if position == self.position:
+                self.__md5.update(data)
+                self.position += len(data)
+
+    def catch_up(self, segments):
+        # Hash whatever has been written from the current position, segments are [first byte, last byte, next byte] lists
+        with self.__lock:
+            for first_byte, last_byte, position in sorted(segments):
+                if first_byte <= self.position < position:
+                    self.__read_file(position)
+
+    def hexdigest(self):
+        with self.__lock:
+            return self.__md5.hexdigest()
+
+    def __read_file(self, end):
+        with open(self.location, 'rb') as file:
+            file.seek(self.position)
+            while self.position < end:
+                data = file.read(min(READ_SIZE, end - self.position))
+                if not data:
+                    break
+                self.__md5.update(data)
+                self.position += len(data)
+
+
+# Checks the chunks listed in the checksum XML of a file while it's written. Chunks which aren't written from start to end
+# in one go, like the one a resumed download continues in, are read back from the file by check_file.
+class ChunkVerifier:
+    def __init__(self, chunks):
+        self.chunks = chunks or []
+        self.verified = set()
+        self.damaged = set()
+        self.repaired = set()
+        self.__first_bytes = [first_byte for first_byte, last_byte, md5 in self.chunks]
+        # Maps the index of every chunk which is being written to its md5 and the next byte to hash
+        self.__hashes = {}
+        self.__lock = threading.Lock()
+
+    def update(self, position, data):
+        data = memoryview(data)
+        end = position + len(data)
+        index = max(0, bisect.bisect_right(self.__first_bytes, position) - 1)
+        with self.__lock:
+            while index < len(self.chunks) and self.chunks[index][0] < end:
+                self.__update_chunk(index, position, data)
+                index += 1
+
+    def check_file(self, location):
+        # Read back the chunks which couldn't be checked while they were written
+        for index, (first_byte, last_byte, md5) in enumerate(self.chunks):
+            if index not in self.verified and index not in self.damaged:
+                self.__set_result(index, get_file_md5(location, first_byte, last_byte + 1) == md5)
+
+    def get_damaged_ranges(self):
+        # Returns (first byte, last byte) tuples, with neighbouring damaged chunks merged
+        ranges = []
+        for index in sorted(self.damaged):
+            first_byte, last_byte, md5 = self.chunks[index]
+            if ranges and ranges[-1][1] + 1 == first_byte:
+                ranges[-1] = (ranges[-1][0], last_byte)
+            else:
+                ranges.append((first_byte, last_byte))
+        return ranges
+
+    def mark_repaired(self, first_byte, last_byte):
+        # The range was downloaded again, so its chunks have to be checked again
+        with self.__lock:
+            for index, (chunk_first_byte, chunk_last_byte, md5) in enumerate(self.chunks):
+                if first_byte <= chunk_first_byte and chunk_last_byte <= last_byte:
+                    self.damaged.discard(index)
+                    self.repaired.add(index)
+                    self.__hashes.pop(index, None)
+
+    def __update_chunk(self, index, position, data):
+        first_byte, last_byte, md5 = self.chunks[index]
+        start = max(position, first_byte)
+        if index not in self.__hashes and start == first_byte:
+            self.__hashes[index] = [hashlib.md5(), first_byte]
+        chunk_hash = self.__hashes.get(index)
+        if chunk_hash is None:
+            return
+        if chunk_hash[1] != start:
+            # Part of the chunk was skipped or written twice, so it has to be read back later
+            del self.__hashes[index]
+            return
+        stop = min(last_byte + 1, position + len(data))
+        chunk_hash[0].update(data[start - position:stop - position])
+        chunk_hash[1] = stop
+        if stop > last_byte:
+            del self.__hashes[index]
+            self.__set_result(index, chunk_hash[0].hexdigest() == md5)
+
+    def __set_result(self, index, correct):
+        if correct:
+            self.verified.add(index)
+        else:
+            self.damaged.add(index)
+
+
+def get_file_md5(location, first_byte=0, end=None):
+    # The md5 of the whole file, or of the bytes from first_byte up to end
+    hash_md5 = hashlib.md5()
+    with open(location, "rb") as file:
+        file.seek(first_byte)
+        position = first_byte
+        while end is None or position < end:
+            data = file.read(READ_SIZE if end is None else min(READ_SIZE, end - position))
+            if not data:
+                break
+            hash_md5.update(data)
+            position += len(data)
+    return hash_md5.hexdigest()
+
+
+# Stores the md5 of every downloaded file with its size and modification time, so the file only has to be read again
+# when it was changed after the download
+class __DownloadChecksums:
+    def __init__(self, checksums_file):
+        self.__checksums_file = checksums_file
+        self.__lock = threading.Lock()
+
+    def save(self, location, md5):
+        file_stat = os.stat(location)
+        with self.__lock:
+            checksums = self.__load_checksums_file()
+            checksums[os.path.abspath(location)] = {
+                "md5": md5,
+                "size": file_stat.st_size,
+                "mtime": file_stat.st_mtime_ns
+            }
+            save_json_file(self.__checksums_file, checksums)
+
+    def get(self, location):
+        try:
+            file_stat = os.stat(location)
+        except OSError:
+            return None
+        with self.__lock:
+            entry = self.__load_checksums_file().get(os.path.abspath(location))
+        if entry and entry["size"] == file_stat.st_size and entry["mtime"] == file_stat.st_mtime_ns:
+            return entry["md5"]
+        return None
+
+    def remove(self, locations):
+        with self.__lock:
+            checksums = self.__load_checksums_file()
+            removed = [checksums.pop(os.path.abspath(location), None) for location in locations]
+            if any(removed):
+                save_json_file(self.__checksums_file, checksums)
+
+    def __load_checksums_file(self) -> dict:
+        return load_json_file(self.__checksums_file, {},
+                              "Reading {} failed, downloaded files will be checked again.".format(self.__checksums_file))
+
+
+DownloadChecksums = __DownloadChecksums(DOWNLOAD_CHECKSUMS_PATH)
@@ -37,7 +37,17 @@ DEFAULT_CONFIGURATION = {
     "show_hidden_games": False,
     "show_windows_games": False,
     "keep_window_maximized": False,
-    "installed_filter": False
+    "installed_filter": False,
+    "download_segments": 4,
+    "max_parallel_downloads": 3,
+    "max_downloads_per_host": 2,
+    "small_downloads_first": True,
+    # In KiB/s, 0 means unlimited
+    "download_speed_limit": 0,
+    # List of [start, end, limit] entries like ["08:00", "18:00", 1024], which override download_speed_limit
+    "download_speed_schedule": [],
+    # How many seconds API responses are used without checking with the server, unless the server says otherwise
+    "api_cache_ttl": 3600
 }
 
 # Game IDs to ignore when received by the API
@@ -53,5 +63,14 @@ DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB
 # This is the file size needed for the download manager to consider resuming worthwhile
 MINIMUM_RESUME_SIZE = 50 * 1024**2  # 50 MB
 
+# Files are only split into segments which are downloaded in parallel when each segment is at least this big
+MINIMUM_SEGMENT_SIZE = 16 * 1024**2  # 16 MB
+
+# The number of requests to the GOG API which can be made at the same time, for example for the files of an installer
+MAX_PARALLEL_API_REQUESTS = 8
+
+# How many thumbnails are downloaded at the same time
+THUMBNAIL_WORKERS = 4
+
 SESSION = requests.Session()
 SESSION.headers.update({'User-Agent': 'Minigalaxy/{} (Linux {})'.format(VERSION, platform.machine())})
@@ -1,8 +1,11 @@
 from zipfile import BadZipFile
+from minigalaxy.download_progress import DownloadProgress
 
 
 class Download:
-    def __init__(self, url, save_location, finish_func=None, progress_func=None, cancel_func=None, number=1, out_of_amount=1):
+    def __init__(self, url, save_location, finish_func=None, progress_func=None, cancel_func=None, number=1,
+                 out_of_amount=1, size=0, priority=0, md5="", chunks=None, game_id=0, resume_info=None, url_resolver=None,
+                 progress=None):
         self.url = url
         self.save_location = save_location
         self.__finish_func = finish_func
@@ -10,6 +13,23 @@ class Download:
         self.__cancel_func = cancel_func
         self.number = number
         self.out_of_amount = out_of_amount
+        # The expected size in bytes, 0 if unknown
+        self.size = size
+        # Downloads with a higher priority are started first
+        self.priority = priority
+        self.md5 = md5
+        # [first byte, last byte, md5] lists from the checksum XML
+        self.chunks = [] if chunks is None else chunks
+        self.game_id = game_id
+        # Stored in the download journal, so the owner of the download can recreate it after a restart
+        self.resume_info = {} if resume_info is None else resume_info
+        # Returns a new url when the current one has expired
+        self.url_resolver = url_resolver
+        # Files of the same game can share their progress, so it's reported for the whole game by size
+        if progress is None:
+            progress = DownloadProgress(lambda percentage, bytes_per_second, seconds_left: self.set_progress(percentage))
+        self.progress = progress
+        self.progress.add(self)
 
     def set_progress(self, percentage: int) -> None:
         if self.__progress_func:
@@ -20,6 +40,15 @@ class Download:
                 percentage = int(percentage)
             self.__progress_func(percentage)
 
+    def take_callbacks(self, download):
+        # The owner of download, like a tile which was created again, gets the updates of this download from now on
+        self.__finish_func = download.__finish_func
+        self.__progress_func = download.__progress_func
+        self.__cancel_func = download.__cancel_func
+        self.url_resolver = download.url_resolver or self.url_resolver
+        download.progress.replace(download, self)
+        self.progress = download.progress
+
     def finish(self):
         if self.__finish_func:
             try:
@@ -0,0 +1,115 @@
+import os
+import hashlib
+import threading
+import time
+from minigalaxy.download import Download
+from minigalaxy.json_file import load_json_file, save_json_file
+from minigalaxy.paths import DOWNLOAD_JOURNAL_PATH
+
+# Progress is written at most this often, other changes are written right away
+JOURNAL_SAVE_INTERVAL = 2  # seconds
+
+
+# Keeps track of every queued and active download on disk, so the whole queue can be resumed after a restart.
+# Entries are stored by save location, in the order they were queued.
+class __DownloadJournal:
+    def __init__(self, journal_file):
+        self.__journal_file = journal_file
+        # The chunks from the checksum XML never change, so they're written once to a file per download instead of
+        # being written again with every change to the journal
+        self.__chunks_directory = os.path.join(os.path.dirname(journal_file), "chunks")
+        self.__entries = None
+        self.__lock = threading.RLock()
+        self.__last_save = 0
+
+    def add(self, downloads):
+        # Make sure we're always dealing with a list
+        if isinstance(downloads, Download):
+            downloads = [downloads]
+        with self.__lock:
+            entries = self.__get_entries()
+            for download in downloads:
+                entry = entries.get(download.save_location, {})
+                entry.update({
+                    "url": download.url,
+                    "game_id": download.game_id,
+                    "number": download.number,
+                    "out_of_amount": download.out_of_amount,
+                    "size": download.size,
+                    "priority": download.priority,
+                    "md5": download.md5,
+                    "resume_info": download.resume_info,
+                })
+                entries[download.save_location] = entry
+                self.__save_chunks(download)
+            self.__save()
+
+    def update(self, download, save_now=True, **values):
+        # Downloads which aren't in the journal, like thumbnails, are ignored
+        with self.__lock:
+            entry = self.__get_entries().get(download.save_location)
+            if entry is None:
+                return
+            entry.update(values)
+            if save_now:
+                self.__save()
+            elif time.time() - self.__last_save >= JOURNAL_SAVE_INTERVAL:
+                # Progress is checked against the chunks again after a crash, so it isn't synced to the disk
+                self.__save(sync=False)
+
+    def get(self, download, key):
+        with self.__lock:
+            entry = self.__get_entries().get(download.save_location, {})
+            return entry.get(key)
+
+    def remove(self, downloads):
+        with self.__lock:
+            entries = self.__get_entries()
+            for download in downloads:
+                entries.pop(download.save_location, None)
+                chunks_file = self.__get_chunks_file(download.save_location)
+                if os.path.isfile(chunks_file):
+                    os.remove(chunks_file)
+            self.__save()
+
+    def get_entries(self, game_id) -> list:
+        # Returns copies of the entries of a game, with the save location included
+        with self.__lock:
+            entries = []
+            for save_location, entry in self.__get_entries().items():
+                if entry["game_id"] == game_id:
+                    entries.append(dict(entry, save_location=save_location, chunks=self.__load_chunks(save_location)))
+            return entries
+
+    def __get_chunks_file(self, save_location):
+        return os.path.join(self.__chunks_directory,
+                            "{}.json".format(hashlib.sha256(save_location.encode()).hexdigest()))
+
+    def __save_chunks(self, download):
+        chunks_file = self.__get_chunks_file(download.save_location)
+        if not download.chunks:
+            if os.path.isfile(chunks_file):
+                os.remove(chunks_file)
+            return
+        save_json_file(chunks_file, download.chunks)
+
+    def __load_chunks(self, save_location) -> list:
+        chunks_file = self.__get_chunks_file(save_location)
+        return load_json_file(chunks_file, [],
+                              "Reading {} failed, the download will be checked after it finished.".format(chunks_file))
+
+    def __get_entries(self) -> dict:
+        if self.__entries is None:
+            self.__entries = self.__load_journal_file()
+        return self.__entries
+
+    def __load_journal_file(self) -> dict:
+        return load_json_file(self.__journal_file, {},
+                              "Reading {} failed, the download queue can't be restored.".format(self.__journal_file))
+
+    def __save(self, sync=True):
+        save_json_file(self.__journal_file, self.__entries, sync=sync)
+        self.__last_save = time.time()
+
+
+DownloadJournal = __DownloadJournal(DOWNLOAD_JOURNAL_PATH)
@@ -1,37 +1,82 @@
 import os
+import re
 import shutil
-import time
 import threading
-import queue
-from requests.exceptions import ConnectionError
+from collections import Counter
+from urllib.parse import urlparse
+from requests.exceptions import ConnectionError, HTTPError, RequestException
+from minigalaxy.bandwidth_limiter import BandwidthLimiter
+from minigalaxy.checksums import ChunkVerifier, DownloadChecksums, FileHash, get_file_md5
 from minigalaxy.config import Config
-from minigalaxy.constants import DOWNLOAD_CHUNK_SIZE, MINIMUM_RESUME_SIZE, SESSION
+from minigalaxy.constants import DOWNLOAD_CHUNK_SIZE, MINIMUM_RESUME_SIZE, MINIMUM_SEGMENT_SIZE, SESSION
 from minigalaxy.download import Download
+from minigalaxy.download_journal import DownloadJournal
+from minigalaxy.download_queue import DownloadQueue
+
+# How often damaged chunks are downloaded again before giving up on a file
+MAXIMUM_REPAIR_ATTEMPTS = 3
+# The priority of games the user wants next, which get four times the bandwidth of other downloads
+URGENT_PRIORITY = 2
+
+
+# The file on the server isn't the one the partial download was started with
+class DownloadChanged(ConnectionError):
+    pass
 
 
 class __DownloadManger:
     def __init__(self):
-        self.__queue = queue.Queue()
-        self.__current_download = None
-        self.__cancel = False
+        self.__queue = DownloadQueue()
         self.__paused = False
+        # Notified whenever the queue, the active downloads, a cancel or the paused state changes
+        self.__state_changed = threading.Condition()
+        self.__active_downloads = []
+        self.__cancelled = set()
+        # Active downloads which were paused, mapped to whether they should still be paused when they're queued again
+        self.__paused_downloads = {}
+        # Every download is mapped to the list of downloads it was queued with, which together make up one game
+        self.__groups = {}
+        self.__url_resolve_lock = threading.Lock()
+        # Changes when the bandwidth limit changes, so downloads waiting for bandwidth can start over
+        self.__limit_version = 0
 
         download_thread = threading.Thread(target=self.__download_thread)
         download_thread.daemon = True
         download_thread.start()
 
+    # Returns the downloads which are queued or active for the files. When any of them was queued before, for example by
+    # a tile which has been created again, nothing is queued and the downloads from before are returned. Their callbacks
+    # are the ones of the new downloads from then on.
     def download(self, download):
+        # Make sure we're always dealing with a list
         if isinstance(download, Download):
-            self.__queue.put(download)
-        else:
-            # Assume we've received a list of downloads
-            for d in download:
-                self.__queue.put(d)
+            download = [download]
+        group = list(download)
+        with self.__state_changed:
+            known_downloads = self.__take_over_known_downloads(group)
+        if known_downloads:
+            return known_downloads
+        # The whole game is written to the journal at once, without keeping the downloads waiting for the lock
+        DownloadJournal.add(group)
+        with self.__state_changed:
+            known_downloads = self.__take_over_known_downloads(group)
+            if known_downloads:
+                return known_downloads
+            for d in group:
+                self.__groups[d] = group
+                self.__queue.put(d, self.get_host(d), self.__get_queue_order(d))
+            self.__state_changed.notify_all()
+        return group
 
-    def download_now(self, download):
-        download_file_thread = threading.Thread(target=self.__download_file, args=(download,))
-        download_file_thread.daemon = True
-        download_file_thread.start()
+    def __take_over_known_downloads(self, downloads):
+        # Returns the queued and active downloads with the same save locations, in the order of downloads
+        known_downloads = {d.save_location: d for d in list(self.__queue) + self.__active_downloads}
+        taken_over = []
+        for download in downloads:
+            if download.save_location in known_downloads:
+                known_downloads[download.save_location].take_callbacks(download)
+                taken_over.append(known_downloads[download.save_location])
+        return taken_over
 
     def cancel_download(self, downloads):
         # Make sure we're always dealing with a list
@@ -39,44 +84,173 @@ class __DownloadManger:
             downloads = [downloads]
 
         for download in downloads:
-            if download == self.__current_download:
-                self.cancel_current_download()
-            else:
-                self.__paused = True
-                new_queue = queue.Queue()
-                while not self.__queue.empty():
-                    queued_download = self.__queue.get()
-                    if download == queued_download:
-                        download.cancel()
-                    else:
-                        new_queue.put(queued_download)
-                self.__queue = new_queue
-                self.__paused = False
+            with self.__state_changed:
+                if download in self.__active_downloads:
+                    self.__cancelled.add(download)
+                    self.__state_changed.notify_all()
+                    continue
+                if not self.__queue.remove(download):
+                    continue
+            self.__forget_group(download)
+            DownloadJournal.remove([download])
+            download.cancel()
 
     def cancel_current_download(self):
-        self.__cancel = True
+        with self.__state_changed:
+            self.__cancelled.update(self.__active_downloads)
+            self.__state_changed.notify_all()
 
     def cancel_all_downloads(self):
-        while not self.__queue.empty():
-            self.__queue.get()
+        with self.__state_changed:
+            queued_downloads = list(self.__queue)
+            for download in queued_downloads:
+                self.__groups.pop(download, None)
+            DownloadJournal.remove(queued_downloads)
+            self.__queue = DownloadQueue()
         self.cancel_current_download()
 
-        # wait for the download to be fully cancelled
-        while self.__current_download:
-            time.sleep(0.1)
+        # wait for the downloads to be fully cancelled
+        with self.__state_changed:
+            self.__state_changed.wait_for(lambda: not self.__active_downloads)
+
+    def pause(self):
+        # Active downloads stop after their current chunk and no new downloads are started
+        with self.__state_changed:
+            self.__paused = True
+            self.__state_changed.notify_all()
+
+    def resume(self):
+        with self.__state_changed:
+            self.__paused = False
+            self.__state_changed.notify_all()
+
+    def is_paused(self):
+        return self.__paused
+
+    def move_to_front(self, downloads):
+        # The downloads are started before any other queued download
+        with self.__state_changed:
+            self.__queue.move_to_front(downloads)
+            self.__state_changed.notify_all()
+
+    def download_next(self, downloads):
+        # The downloads are started before any other queued download and get most of the bandwidth once they're active
+        self.move_to_front(downloads)
+        self.set_priority(downloads, URGENT_PRIORITY)
+
+    def move_to_back(self, downloads):
+        with self.__state_changed:
+            self.__queue.move_to_back(downloads)
+
+    def set_priority(self, downloads, priority):
+        with self.__state_changed:
+            for download in downloads:
+                download.priority = priority
+                self.__queue.set_order(download, self.__get_queue_order(download))
+                DownloadJournal.update(download, priority=priority)
+            self.__state_changed.notify_all()
+
+    def pause_download(self, downloads):
+        # Paused downloads stay in the queue, but aren't started. Active ones stop and go back to the queue,
+        # they continue where they were when they're resumed.
+        with self.__state_changed:
+            for download in downloads:
+                if download in self.__active_downloads:
+                    self.__paused_downloads[download] = True
+                else:
+                    self.__queue.pause(download)
+            self.__state_changed.notify_all()
+
+    def resume_download(self, downloads):
+        with self.__state_changed:
+            for download in downloads:
+                if download in self.__paused_downloads:
+                    self.__paused_downloads[download] = False
+                self.__queue.resume(download)
+            self.__state_changed.notify_all()
+
+    def is_download_paused(self, download):
+        with self.__state_changed:
+            return self.__queue.is_paused(download) or self.__paused_downloads.get(download, False)
+
+    def bandwidth_limit_changed(self):
+        BandwidthLimiter.reset()
+        with self.__state_changed:
+            self.__limit_version += 1
+            self.__state_changed.notify_all()
+
+    def __limit_bandwidth(self, download, size):
+        delay = BandwidthLimiter.reserve(download, size)
+        if delay > 0:
+            limit_version = self.__limit_version
+            with self.__state_changed:
+                self.__state_changed.wait_for(
+                    lambda: self.__is_stopped(download) or self.__limit_version != limit_version, timeout=delay)
+
+    def __wait_while_paused(self, download):
+        if self.__paused:
+            with self.__state_changed:
+                self.__state_changed.wait_for(lambda: not self.__paused or self.__is_stopped(download))
+
+    def __is_stopped(self, download):
+        # Cancelled and paused downloads stop after their current chunk
+        return download in self.__cancelled or download in self.__paused_downloads
 
     def __download_thread(self):
         while True:
-            if not self.__queue.empty():
-                self.__current_download = self.__queue.get()
-                self.__download_file(self.__current_download)
-            time.sleep(0.1)
+            with self.__state_changed:
+                download = self.__state_changed.wait_for(self.__get_next_download)
+                self.__active_downloads.append(download)
+            download_file_thread = threading.Thread(target=self.__run_download, args=(download,))
+            download_file_thread.daemon = True
+            download_file_thread.start()
+
+    def __get_next_download(self):
+        # Take the queued download to start next out of the queue, without going over the global and per host limits
+        if self.__paused or not self.__queue:
+            return None
+        max_downloads = Config.get("max_parallel_downloads") or 1
+        max_downloads_per_host = Config.get("max_downloads_per_host") or max_downloads
+        if len(self.__active_downloads) >= max_downloads:
+            return None
+        active_hosts = Counter(self.get_host(d) for d in self.__active_downloads)
+        return self.__queue.pop(lambda host: active_hosts[host] < max_downloads_per_host)
+
+    def __get_queue_order(self, download):
+        # Higher priorities go first. Small games can go before big ones, so they aren't stuck behind them
+        group_size = 0
+        if Config.get("small_downloads_first"):
+            group_size = sum(d.size for d in self.__groups.get(download, [download]))
+        return -download.priority, group_size
+
+    @staticmethod
+    def get_host(download):
+        return urlparse(download.url).netloc
+
+    def __run_download(self, download):
+        BandwidthLimiter.add(download)
+        stopped_by_pause = False
+        try:
+            stopped_by_pause = self.__download_file(download)
+        finally:
+            BandwidthLimiter.remove(download)
+            with self.__state_changed:
+                self.__active_downloads.remove(download)
+                paused = self.__paused_downloads.pop(download, False)
+                if stopped_by_pause:
+                    # Paused downloads go back to the queue, their files are kept to continue later.
+                    # When it was cancelled in the meantime it has to run once more to be cleaned up.
+                    paused = paused and download not in self.__cancelled
+                    self.__queue.put(download, self.get_host(download), self.__get_queue_order(download), paused=paused)
+                self.__state_changed.notify_all()
 
     def __download_file(self, download):
+        # Returns True when the download was stopped because it was paused
         self.prepare_location(download.save_location)
         download_max_attempts = 5
         download_attempt = 0
         result = False
+        error = None
         while download_attempt < download_max_attempts:
             try:
                 start_point, download_mode = self.get_start_point_and_download_mode(download)
@@ -84,20 +258,68 @@ class __DownloadManger:
                 break
             except ConnectionError as e:
                 print(e)
+                error = e
                 download_attempt += 1
+            except HTTPError as e:
+                # Trying again won't help when the server refuses the request
+                print(e)
+                error = e
+                break
+            except RequestException as e:
+                # Like a connection which was dropped in the middle of the file
+                print(e)
+                error = e
+                download_attempt += 1
+        if not result and (self.__was_paused(download) or self.__pause_without_connection(download, error)):
+            return True
         # Successful downloads
         if result:
-            if download.number == download.out_of_amount:
+            finished_group = self.__finish_group_member(download)
+            if finished_group:
+                DownloadJournal.remove(finished_group)
                 finish_thread = threading.Thread(target=download.finish)
                 finish_thread.start()
-            if self.__queue.empty():
-                Config.unset("current_download")
         # Unsuccessful downloads and cancels
         else:
-            self.__cancel = False
+            self.__cancelled.discard(download)
             download.cancel()
-            self.__current_download = None
-            os.remove(download.save_location)
+            self.remove_download_files(download)
+            # The other files of the same game are useless without this one
+            group = self.__forget_group(download)
+            DownloadJournal.remove(group)
+            self.cancel_download([d for d in group if d is not download])
+        return False
+
+    def __pause_without_connection(self, download, error):
+        # Downloads which couldn't reach the server are paused, their files and journal entry are kept to continue later
+        if not isinstance(error, RequestException) or isinstance(error, (HTTPError, DownloadChanged)):
+            return False
+        with self.__state_changed:
+            if download in self.__cancelled:
+                return False
+            print("Pausing {}, the server can't be reached".format(download.save_location))
+            self.__paused_downloads[download] = True
+            return True
+
+    def __was_paused(self, download):
+        with self.__state_changed:
+            return download in self.__paused_downloads and download not in self.__cancelled
+
+    def __finish_group_member(self, download):
+        # Returns the group when this was the last download of it to finish, otherwise None
+        with self.__state_changed:
+            group = self.__groups.pop(download, None)
+            # The group is forgotten when another file of the same game was cancelled
+            if group is None or any(d in self.__groups for d in group):
+                return None
+            return group
+
+    def __forget_group(self, download):
+        with self.__state_changed:
+            group = self.__groups.get(download, [download])
+            for d in group:
+                self.__groups.pop(d, None)
+        return group
 
     def prepare_location(self, save_location):
         # Make sure the directory exists
@@ -110,56 +332,338 @@ class __DownloadManger:
             shutil.rmtree(save_location)
             print("{} is a directory. Will remove it, to make place for installer.".format(save_location))
 
+    @staticmethod
+    def get_part_location(download):
+        return "{}.part".format(download.save_location)
+
+    def remove_download_files(self, download):
+        for location in [download.save_location, self.get_part_location(download)]:
+            if os.path.isfile(location):
+                os.remove(location)
+        DownloadChecksums.remove([download.save_location])
+
     def get_start_point_and_download_mode(self, download):
         # Resume the previous download if possible
         start_point = 0
         download_mode = 'wb'
+        # Segmented downloads can only be resumed when the journal knows which parts were written
+        if os.path.isfile(self.get_part_location(download)) and not DownloadJournal.get(download, "segments"):
+            os.remove(self.get_part_location(download))
         if os.path.isfile(download.save_location):
-            if self.__is_same_download_as_before(download):
+            start_point = self.__get_resumable_size(download)
+            if start_point > 0:
                 print("Resuming download {}".format(download.save_location))
                 download_mode = 'ab'
-                start_point = os.stat(download.save_location).st_size
+                # Anything after the verified part could have been damaged when Minigalaxy stopped
+                os.truncate(download.save_location, start_point)
             else:
                 os.remove(download.save_location)
         return start_point, download_mode
 
+    def __get_resumable_size(self, download):
+        file_size = os.stat(download.save_location).st_size
+        # Don't resume for very small files
+        if file_size < MINIMUM_RESUME_SIZE:
+            return 0
+        # Without these there's no way to know if the server still has the same file
+        if not DownloadJournal.get(download, "validator") or file_size > (DownloadJournal.get(download, "file_size") or 0):
+            return 0
+        return self.get_verified_position(download.save_location, 0, file_size, download.chunks)
+
+    @staticmethod
+    def get_verified_position(location, first_byte, position, chunks):
+        # Check the last checksum chunks which were fully written between first_byte and position.
+        # Returns the position up to which the file can be kept.
+        if not chunks:
+            return position
+        written_chunks = [chunk for chunk in chunks if chunk[0] >= first_byte and chunk[1] < position]
+        # Damage is only expected at the end, so give up after a few chunks
+        for chunk_first_byte, chunk_last_byte, chunk_md5 in reversed(written_chunks[-3:]):
+            if get_file_md5(location, chunk_first_byte, chunk_last_byte + 1) == chunk_md5:
+                return chunk_last_byte + 1
+            print("{} is damaged after byte {}".format(location, chunk_first_byte))
+        return first_byte
+
+    @staticmethod
+    def get_validator(download_request):
+        # If-Range only accepts strong ETags
+        etag = download_request.headers.get('etag', '')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return download_request.headers.get('last-modified', '')
+
     def download_operation(self, download, start_point, download_mode):
-        # Download the file
+        # The chunks from the checksum XML are checked while downloading
+        chunk_verifier = ChunkVerifier(download.chunks)
+        if DownloadJournal.get(download, "segments") and os.path.isfile(self.get_part_location(download)):
+            return self.__resume_segmented(download, chunk_verifier)
+
+        # Download the file. When resuming, the server only sends the rest if the file didn't change
         resume_header = {'Range': 'bytes={}-'.format(start_point)}
-        download_request = SESSION.get(download.url, headers=resume_header, stream=True, timeout=30)
+        if start_point > 0:
+            resume_header['If-Range'] = DownloadJournal.get(download, "validator")
+        download_request = self.__request(download, resume_header)
+        # The file was already fully downloaded
+        if download_request.status_code == 416:
+            download_request.close()
+            return True
+        file_size = self.get_total_size(download_request)
+        DownloadJournal.update(download, file_size=file_size, validator=self.get_validator(download_request))
+        # Downloads which can be resumed by range are written to a preallocated part file, even with a single segment
+        if download_request.status_code == 206 and start_point == 0:
+            segments = self.get_segments(start_point, file_size)
+            return self.__download_segmented(download, download_request, file_size, segments, chunk_verifier)
+        if download_request.status_code != 206 and start_point > 0:
+            # The server ignored the range, so the whole file is being sent again
+            start_point = 0
+            download_mode = 'wb'
+        return self.__download_single(download, download_request, file_size, start_point, download_mode, chunk_verifier)
+
+    def __download_single(self, download, download_request, file_size, start_point, download_mode, chunk_verifier):
         downloaded_size = start_point
-        file_size = int(download_request.headers.get('content-length'))
         result = True
+        # The file is hashed while it's written, so the installer doesn't have to read it again
+        file_hash = FileHash(download.save_location, start_point)
         if downloaded_size < file_size:
-            with open(download.save_location, download_mode) as save_file:
-                for chunk in download_request.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
-                    # Pause if needed
-                    while self.__paused:
-                        time.sleep(0.1)
-                    save_file.write(chunk)
+            flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if download_mode == 'wb' else 0)
+            save_file = os.open(download.save_location, flags, 0o644)
+            try:
+                for chunk in self.iter_response(download_request):
+                    self.__wait_while_paused(download)
+                    self.write_at(save_file, chunk, downloaded_size)
+                    file_hash.update(downloaded_size, chunk)
+                    chunk_verifier.update(downloaded_size, chunk)
                     downloaded_size += len(chunk)
-                    if self.__cancel:
+                    self.__limit_bandwidth(download, len(chunk))
+                    if self.__is_stopped(download):
                         result = False
                         break
-                    if file_size > 0:
-                        progress = int(downloaded_size / file_size * 100)
-                        download.set_progress(progress)
-                save_file.close()
+                    download.progress.update(download, downloaded_size, file_size)
+            finally:
+                os.close(save_file)
+                # The rest of the response isn't read when the download was stopped
+                download_request.close()
+        if result:
+            result = self.__repair_damaged_chunks(download, download.save_location, chunk_verifier)
+        if result:
+            self.__save_checksum(download, file_hash, file_size, chunk_verifier)
         return result
 
-    def __is_same_download_as_before(self, download):
-        file_stats = os.stat(download.save_location)
-        # Don't resume for very small files
-        if file_stats.st_size < MINIMUM_RESUME_SIZE:
+    @staticmethod
+    def __save_checksum(download, file_hash, file_size, chunk_verifier):
+        # The hash doesn't match the file anymore when parts of it were downloaded again
+        if file_hash.position == file_size and not chunk_verifier.repaired:
+            DownloadChecksums.save(download.save_location, file_hash.hexdigest())
+
+    def __repair_damaged_chunks(self, download, location, chunk_verifier):
+        # Only the damaged chunks are downloaded again, instead of the whole file
+        chunk_verifier.check_file(location)
+        for attempt in range(MAXIMUM_REPAIR_ATTEMPTS):
+            damaged_ranges = chunk_verifier.get_damaged_ranges()
+            if not damaged_ranges:
+                break
+            for first_byte, last_byte in damaged_ranges:
+                print("Downloading bytes {}-{} of {} again, because they were damaged".format(
+                    first_byte, last_byte, download.save_location))
+                self.__repair_range(download, location, first_byte, last_byte, chunk_verifier)
+            chunk_verifier.check_file(location)
+        if chunk_verifier.damaged:
+            print("{} couldn't be repaired".format(download.save_location))
+            return False
+        return True
+
+    def __repair_range(self, download, location, first_byte, last_byte, chunk_verifier):
+        chunk_verifier.mark_repaired(first_byte, last_byte)
+        download_request = self.__request_segment(download, first_byte, last_byte)
+        position = first_byte
+        file = os.open(location, os.O_WRONLY)
+        try:
+            for chunk in self.iter_response(download_request):
+                chunk = chunk[:last_byte + 1 - position]
+                self.write_at(file, chunk, position)
+                chunk_verifier.update(position, chunk)
+                position += len(chunk)
+                if position > last_byte:
+                    break
+        finally:
+            os.close(file)
+            download_request.close()
+
+    @staticmethod
+    def iter_response(download_request):
+        # Slicing memoryviews of the chunks doesn't copy them. Reading into a buffer of our own would, since urllib3
+        # reads into a new bytes object first.
+        for chunk in download_request.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            yield memoryview(chunk)
+
+    @staticmethod
+    def write_at(file, data, position):
+        while data:
+            written = os.pwrite(file, data, position)
+            data = data[written:]
+            position += written
+
+    @staticmethod
+    def preallocate(file, size):
+        # Reserve the disk space up front, which keeps large installers from being fragmented.
+        # Not every file system supports this, so fall back to a sparse file.
+        try:
+            os.posix_fallocate(file, 0, size)
+        except (AttributeError, OSError):
+            os.ftruncate(file, size)
+
+    @staticmethod
+    def get_total_size(download_request):
+        # Partial responses contain the size of the whole file in the Content-Range header
+        content_range = download_request.headers.get('content-range', '')
+        match = re.match(r'bytes \d+-\d+/(\d+)', content_range)
+        if match:
+            return int(match.group(1))
+        return int(download_request.headers.get('content-length'))
+
+    def __request(self, download, headers):
+        requested_url = download.url
+        download_request = SESSION.get(requested_url, headers=headers, stream=True, timeout=30)
+        if download_request.status_code in [403, 404, 410] and download.url_resolver:
+            # The download link has expired, but other segments might have already asked for a new one
+            download_request.close()
+            with self.__url_resolve_lock:
+                if download.url == requested_url:
+                    try:
+                        download.url = download.url_resolver()
+                    except (RequestException, ValueError, KeyError) as e:
+                        raise ConnectionError("Couldn't get a new link for {}: {}".format(download.save_location, e))
+                    DownloadJournal.update(download, url=download.url)
+            download_request = SESSION.get(download.url, headers=headers, stream=True, timeout=30)
+        if download_request.status_code >= 400 and download_request.status_code != 416:
+            download_request.raise_for_status()
+        return download_request
+
+    @staticmethod
+    def get_segments(start_point, file_size):
+        # Returns a list of (first byte, last byte) tuples, one for each connection to use
+        segment_count = min(Config.get("download_segments") or 1, file_size // MINIMUM_SEGMENT_SIZE)
+        if start_point > 0 or segment_count < 2:
+            return [(start_point, file_size - 1)]
+        segment_size = file_size // segment_count
+        segments = []
+        for index in range(segment_count):
+            first_byte = index * segment_size
+            last_byte = file_size - 1 if index == segment_count - 1 else first_byte + segment_size - 1
+            segments.append((first_byte, last_byte))
+        return segments
+
+    def __download_segmented(self, download, first_request, file_size, segments, chunk_verifier):
+        # Segments are [first byte, last byte, next byte to write] lists, which are stored in the journal
+        part_location = self.get_part_location(download)
+        if first_request:
+            # Reserve the full size of the file, so every segment can be written at its own offset
+            with open(part_location, 'wb') as part_file:
+                self.preallocate(part_file.fileno(), file_size)
+            segments = [[first_byte, last_byte, first_byte] for first_byte, last_byte in segments]
+            DownloadJournal.update(download, segments=segments, file_size=file_size)
+
+        progress_lock = threading.Lock()
+        downloaded_size = [sum(position - first_byte for first_byte, last_byte, position in segments)]
+        errors = []
+        # Data is hashed from memory when it follows what was hashed before, the rest is read back when a segment ends
+        file_hash = FileHash(part_location)
+        file_hash.catch_up(segments)
+
+        def add_progress(position, chunk):
+            chunk_verifier.update(position, chunk)
+            file_hash.update(position, chunk)
+            file_hash.catch_up(segments)
+            with progress_lock:
+                downloaded_size[0] += len(chunk)
+                download.progress.update(download, downloaded_size[0], file_size)
+                DownloadJournal.update(download, save_now=False, segments=segments)
+
+        segment_threads = []
+        for index, segment in enumerate(segments):
+            # The request used to check for range support is reused for the first segment
+            download_request = first_request if index == 0 else None
+            segment_thread = threading.Thread(target=self.__download_segment,
+                                              args=(download, part_location, segment, download_request, add_progress,
+                                                    errors))
+            segment_thread.daemon = True
+            segment_thread.start()
+            segment_threads.append(segment_thread)
+        for segment_thread in segment_threads:
+            segment_thread.join()
+        DownloadJournal.update(download, segments=segments)
+
+        if errors:
+            if any(isinstance(e, DownloadChanged) for e in errors):
+                # The written segments are useless, so start over
+                DownloadJournal.update(download, segments=None)
+                os.remove(part_location)
+            if isinstance(errors[0], (HTTPError, DownloadChanged)):
+                raise errors[0]
+            raise ConnectionError(errors[0])
+        if self.__is_stopped(download):
             return False
+        file_hash.catch_up(segments)
+        if not self.__repair_damaged_chunks(download, part_location, chunk_verifier):
+            return False
+        os.replace(part_location, download.save_location)
+        DownloadJournal.update(download, segments=None)
+        self.__save_checksum(download, file_hash, file_size, chunk_verifier)
+        return True
+
+    def __resume_segmented(self, download, chunk_verifier):
+        print("Resuming download {}".format(download.save_location))
+        part_location = self.get_part_location(download)
+        segments = DownloadJournal.get(download, "segments")
+        for segment in segments:
+            segment[2] = self.get_verified_position(part_location, segment[0], segment[2], download.chunks)
+        return self.__download_segmented(download, None, DownloadJournal.get(download, "file_size"), segments,
+                                         chunk_verifier)
 
-        # Check if the first part of the file
-        download_request = SESSION.get(download.url, stream=True)
-        size_to_check = DOWNLOAD_CHUNK_SIZE * 5
-        for chunk in download_request.iter_content(chunk_size=size_to_check):
-            with open(download.save_location, "rb") as file:
-                file_content = file.read(size_to_check)
-                return file_content == chunk
+    def __request_segment(self, download, first_byte, last_byte):
+        # The server only sends the range if the file didn't change since the download started
+        range_header = {
+            'Range': 'bytes={}-{}'.format(first_byte, last_byte),
+            'If-Range': DownloadJournal.get(download, "validator") or None
+        }
+        download_request = self.__request(download, range_header)
+        if download_request.status_code == 200 and range_header['If-Range']:
+            raise DownloadChanged("{} changed on the server".format(download.url))
+        if download_request.status_code != 206:
+            raise ConnectionError("Range {}-{} of {} wasn't returned by the server".format(
+                first_byte, last_byte, download.url))
+        return download_request
+
+    def __download_segment(self, download, part_location, segment, download_request, add_progress, errors):
+        first_byte, last_byte, position = segment
+        try:
+            if position > last_byte:
+                return
+            if download_request is None:
+                download_request = self.__request_segment(download, position, last_byte)
+            # Write straight to the file, so the journal never claims more than what has been written
+            part_file = os.open(part_location, os.O_WRONLY)
+            try:
+                for chunk in self.iter_response(download_request):
+                    self.__wait_while_paused(download)
+                    if self.__is_stopped(download) or errors:
+                        break
+                    # The first request is open ended, so don't write past the end of the segment
+                    chunk = chunk[:last_byte + 1 - position]
+                    self.write_at(part_file, chunk, position)
+                    segment[2] = position + len(chunk)
+                    add_progress(position, chunk)
+                    position += len(chunk)
+                    self.__limit_bandwidth(download, len(chunk))
+                    if position > last_byte:
+                        break
+            finally:
+                os.close(part_file)
+            download_request.close()
+            if position <= last_byte and not (self.__is_stopped(download) or errors):
+                raise ConnectionError("Range {}-{} of {} ended early".format(first_byte, last_byte, download.url))
+        except (RequestException, OSError) as e:
+            errors.append(e)
 
 
 DownloadManager = __DownloadManger()
@@ -0,0 +1,65 @@
+import threading
+import time
+
+UPDATES_PER_SECOND = 5
+# How much the latest measurement counts in the download speed, the rest comes from the previous measurements
+SPEED_SMOOTHING = 0.3
+
+
+# Tracks the progress of all files of a download in bytes, so big files count for more than small ones.
+# progress_func is called with the percentage, the download speed in bytes per second and the number of seconds left,
+# at most UPDATES_PER_SECOND times a second however fast the download is going.
+class DownloadProgress:
+    def __init__(self, progress_func, clock=time.monotonic):
+        self.__progress_func = progress_func
+        self.__clock = clock
+        self.__lock = threading.Lock()
+        self.__sizes = {}
+        self.__downloaded = {}
+        self.__last_update = None
+        self.__downloaded_since_update = 0
+        self.__speed = 0
+
+    def add(self, download):
+        with self.__lock:
+            self.__sizes[download] = download.size
+            self.__downloaded.setdefault(download, None)
+
+    def replace(self, download, replacement):
+        # replacement reports the progress of the file of download from now on
+        with self.__lock:
+            size = self.__sizes.pop(download, 0)
+            self.__downloaded.pop(download, None)
+            self.__sizes[replacement] = replacement.size or size
+            self.__downloaded.setdefault(replacement, None)
+
+    def update(self, download, downloaded, file_size):
+        # downloaded is the number of bytes of the file which are done, including the ones from before a resume
+        with self.__lock:
+            previous = self.__downloaded.get(download)
+            if previous is not None:
+                self.__downloaded_since_update += max(0, downloaded - previous)
+            self.__downloaded[download] = downloaded
+            self.__sizes[download] = file_size or self.__sizes.get(download, 0)
+            now = self.__clock()
+            if self.__last_update is None:
+                self.__last_update = now
+            elapsed = now - self.__last_update
+            # A file being done is always reported, so the progress doesn't stop short of 100%
+            if elapsed < 1 / UPDATES_PER_SECOND and not (file_size and downloaded >= file_size):
+                return
+            if elapsed > 0:
+                speed = self.__downloaded_since_update / elapsed
+                self.__speed = speed if not self.__speed else SPEED_SMOOTHING * speed + (1 - SPEED_SMOOTHING) * self.__speed
+            self.__last_update = now
+            self.__downloaded_since_update = 0
+            progress = self.__get_progress()
+        self.__progress_func(*progress)
+
+    def __get_progress(self):
+        total_size = sum(self.__sizes.values())
+        downloaded = sum(min(d or 0, self.__sizes[download]) for download, d in self.__downloaded.items())
+        if total_size <= 0:
+            return 0, self.__speed, None
+        seconds_left = (total_size - downloaded) / self.__speed if self.__speed > 0 else None
+        return int(downloaded / total_size * 100), self.__speed, seconds_left
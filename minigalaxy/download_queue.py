@@ -0,0 +1,116 @@
+import heapq
+import itertools
+
+
+# The queued downloads, with a heap for every host. This way the next download for a host which isn't busy is found
+# without going through the whole queue, and downloads can be removed or moved by looking them up directly.
+# Entries which are removed or moved stay in the heaps until they come up, they're skipped then.
+# This class isn't thread safe, the download manager only uses it while holding its lock.
+class DownloadQueue:
+    def __init__(self):
+        # Maps every queued download to its [sort key, download, host] entry, the download is set to None on removal
+        self.__entries = {}
+        self.__heaps = {}
+        self.__paused = {}
+        self.__counter = itertools.count()
+        self.__moves = itertools.count(1)
+        self.__removed = 0
+
+    def __len__(self):
+        return len(self.__entries) + len(self.__paused)
+
+    def __contains__(self, download):
+        return download in self.__entries or download in self.__paused
+
+    def __iter__(self):
+        return iter(list(self.__entries) + list(self.__paused))
+
+    def put(self, download, host, order, paused=False):
+        # Downloads are sorted by order, a tuple, and then by the moment they were queued
+        self.__add_entry([(0, order, next(self.__counter)), download, host], paused)
+
+    def remove(self, download):
+        entry = self.__take_entry(download)
+        return entry is not None
+
+    def move_to_front(self, downloads):
+        # The downloads keep their order among each other and go before everything else, including previous moves
+        self.__move(downloads, -next(self.__moves))
+
+    def move_to_back(self, downloads):
+        self.__move(downloads, next(self.__moves))
+
+    def set_order(self, download, order):
+        self.__change_key(download, lambda move, old_order, number: (move, order, number))
+
+    def pause(self, download):
+        # Paused downloads stay in the queue, but are never returned by pop
+        entry = self.__take_entry(download)
+        if entry is not None:
+            self.__add_entry(entry, paused=True)
+
+    def resume(self, download):
+        entry = self.__paused.pop(download, None)
+        if entry is not None:
+            self.__add_entry(entry)
+
+    def is_paused(self, download):
+        return download in self.__paused
+
+    def pop(self, is_host_available):
+        # Remove and return the first download for a host is_host_available returns True for, or None
+        best_heap = None
+        for host, heap in self.__heaps.items():
+            while heap and heap[0][1] is None:
+                heapq.heappop(heap)
+                self.__removed -= 1
+            if heap and (best_heap is None or heap[0][0] < best_heap[0][0]) and is_host_available(host):
+                best_heap = heap
+        if best_heap is None:
+            return None
+        entry = heapq.heappop(best_heap)
+        del self.__entries[entry[1]]
+        return entry[1]
+
+    def __move(self, downloads, move):
+        for download in downloads:
+            self.__change_key(download, lambda old_move, order, number: (move, order, number))
+
+    def __change_key(self, download, get_key):
+        paused = download in self.__paused
+        entry = self.__take_entry(download)
+        if entry is not None:
+            self.__add_entry([get_key(*entry[0]), download, entry[2]], paused)
+
+    def __add_entry(self, entry, paused=False):
+        download = entry[1]
+        if paused:
+            self.__paused[download] = entry
+            return
+        self.__entries[download] = entry
+        heapq.heappush(self.__heaps.setdefault(entry[2], []), entry)
+
+    def __take_entry(self, download):
+        # Returns a copy of the entry of the download, which is left behind in its heap to be skipped
+        if download in self.__paused:
+            return self.__paused.pop(download)
+        entry = self.__entries.pop(download, None)
+        if entry is None:
+            return None
+        copy = list(entry)
+        entry[1] = None
+        self.__removed += 1
+        if self.__removed > len(self.__entries):
+            self.__compact()
+        return copy
+
+    def __compact(self):
+        # Drop the skipped entries once they make up most of the heaps
+        for host in list(self.__heaps):
+            heap = [entry for entry in self.__heaps[host] if entry[1] is not None]
+            heapq.heapify(heap)
+            if heap:
+                self.__heaps[host] = heap
+            else:
+                del self.__heaps[host]
+        self.__removed = 0
@@ -0,0 +1,154 @@
+import os
+import time
+import hashlib
+import threading
+from urllib.parse import urlencode
+from requests.exceptions import RequestException
+from minigalaxy.json_file import load_json_file, save_json_file
+from minigalaxy.paths import HTTP_CACHE_DIR
+
+# The least recently used responses are removed once the cache grows bigger than this
+MAXIMUM_CACHE_SIZE = 50 * 1024**2
+
+
+# Stores the JSON responses of the GOG API on disk, one file per url and parameters.
+# Responses are used without asking the server until they expire. After that they're revalidated with their ETag or
+# Last-Modified header, so an unchanged response doesn't have to be downloaded again.
+class __HttpCache:
+    def __init__(self, cache_dir, maximum_size=MAXIMUM_CACHE_SIZE):
+        self.__cache_dir = cache_dir
+        self.__maximum_size = maximum_size
+        self.__lock = threading.Lock()
+        # Maps the file name of every cached response to its size and the last time it was used
+        self.__index = None
+        self.__counters = {"hits": 0, "misses": 0, "revalidations": 0, "stale": 0}
+
+    # send is called with the headers to add to the request and returns the response.
+    # ttl is how many seconds a response can be used for when the server doesn't say.
+    def request(self, url, params, send, ttl) -> dict:
+        file_name = self.get_file_name(url, params)
+        entry = self.__load(file_name)
+        now = time.time()
+        if entry and entry["expires"] > now:
+            self.__count("hits")
+            self.__touch(file_name)
+            return entry["body"]
+        try:
+            response = send(self.get_validators(entry))
+        except RequestException as e:
+            if entry is None:
+                raise
+            # An outdated response is better than none when the server can't be reached
+            print("Using cached response for {}: {}".format(url, e))
+            self.__count("stale")
+            return entry["body"]
+        if entry and response.status_code == 304:
+            self.__count("revalidations")
+            entry["expires"] = self.get_expiry(response.headers, ttl, now) or now
+            self.__save(file_name, entry)
+            return entry["body"]
+        self.__count("misses")
+        body = response.json()
+        expires = self.get_expiry(response.headers, ttl, now)
+        if response.status_code == 200 and expires is not None:
+            self.__save(file_name, {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "expires": expires,
+                "body": body
+            })
+        return body
+
+    def get_counters(self) -> dict:
+        with self.__lock:
+            return dict(self.__counters)
+
+    @staticmethod
+    def get_file_name(url, params=None):
+        key = url
+        if params:
+            key = "{}?{}".format(url, urlencode(sorted(params.items())))
+        return "{}.json".format(hashlib.sha256(key.encode()).hexdigest())
+
+    @staticmethod
+    def get_validators(entry) -> dict:
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    # Returns when a response expires according to its Cache-Control header, or None if it mustn't be stored
+    @staticmethod
+    def get_expiry(headers, ttl, now):
+        directives = [directive.strip().lower() for directive in headers.get("Cache-Control", "").split(",")]
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            return now
+        for directive in directives:
+            if directive.startswith("max-age="):
+                try:
+                    return now + int(directive[len("max-age="):])
+                except ValueError:
+                    pass
+        return now + ttl
+
+    def __count(self, counter):
+        with self.__lock:
+            self.__counters[counter] += 1
+
+    def __load(self, file_name):
+        return load_json_file(os.path.join(self.__cache_dir, file_name))
+
+    def __touch(self, file_name):
+        now = time.time()
+        with self.__lock:
+            index = self.__get_index()
+            if file_name in index:
+                index[file_name][1] = now
+        try:
+            # The modification time keeps track of the last use between runs
+            os.utime(os.path.join(self.__cache_dir, file_name), (now, now))
+        except OSError:
+            pass
+
+    def __save(self, file_name, entry):
+        path = os.path.join(self.__cache_dir, file_name)
+        with self.__lock:
+            index = self.__get_index()
+            size = save_json_file(path, entry)
+            now = time.time()
+            os.utime(path, (now, now))
+            index[file_name] = [size, now]
+            self.__evict(index)
+
+    def __evict(self, index):
+        total_size = sum(size for size, last_used in index.values())
+        for file_name in sorted(index, key=lambda name: index[name][1]):
+            if total_size <= self.__maximum_size:
+                break
+            total_size -= index.pop(file_name)[0]
+            self.__remove(file_name)
+
+    def __remove(self, file_name):
+        try:
+            os.remove(os.path.join(self.__cache_dir, file_name))
+        except FileNotFoundError:
+            pass
+
+    def __get_index(self):
+        # The index is built from the cache directory the first time it's needed
+        if self.__index is None:
+            self.__index = {}
+            if os.path.isdir(self.__cache_dir):
+                for file_name in os.listdir(self.__cache_dir):
+                    if file_name.endswith(".json"):
+                        file_stat = os.stat(os.path.join(self.__cache_dir, file_name))
+                        self.__index[file_name] = [file_stat.st_size, file_stat.st_mtime]
+        return self.__index
+
+
+HttpCache = __HttpCache(HTTP_CACHE_DIR)
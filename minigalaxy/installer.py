@@ -1,10 +1,10 @@
 import os
 import shutil
 import subprocess
-import hashlib
 from minigalaxy.translation import _
 from minigalaxy.paths import CACHE_DIR, THUMBNAIL_DIR
 from minigalaxy.config import Config
+from minigalaxy.checksums import DownloadChecksums, get_file_md5
 
 
 def get_available_disk_space(location):
@@ -67,11 +67,9 @@ def verify_installer_integrity(game, installer):
         error_message = _("{} failed to download.").format(installer)
     if not error_message:
         for installer_file_name in os.listdir(os.path.dirname(installer)):
-            hash_md5 = hashlib.md5()
-            with open(os.path.join(os.path.dirname(installer), installer_file_name), "rb") as installer_file:
-                for chunk in iter(lambda: installer_file.read(4096), b""):
-                    hash_md5.update(chunk)
-            calculated_checksum = hash_md5.hexdigest()
+            installer_file = os.path.join(os.path.dirname(installer), installer_file_name)
+            # Files are hashed while they're downloaded, they only have to be read when they changed since then
+            calculated_checksum = DownloadChecksums.get(installer_file) or get_file_md5(installer_file)
             if installer_file_name in game.md5sum:
                 if game.md5sum[installer_file_name] == calculated_checksum:
                     print("{} integrity is preserved. MD5 is: {}".format(installer_file_name, calculated_checksum))
@@ -172,6 +170,7 @@ def remove_installer(installer):
     if not Config.get("keep_installers"):
         installer_directory = os.path.dirname(installer)
         if os.path.isdir(installer_directory):
+            DownloadChecksums.remove([os.path.join(installer_directory, file) for file in os.listdir(installer_directory)])
             shutil.rmtree(installer_directory, ignore_errors=True)
         else:
             error_message = "No installer directory is present: {}".format(installer_directory)
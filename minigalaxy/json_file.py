@@ -0,0 +1,32 @@
+import os
+import json
+
+
+# Returns the contents of a JSON file, or default when the file doesn't exist or can't be read.
+# error_message is printed when the file exists but isn't valid JSON.
+def load_json_file(path, default=None, error_message=None):
+    if os.path.isfile(path):
+        with open(path, "r") as file:
+            try:
+                return json.loads(file.read())
+            except json.decoder.JSONDecodeError:
+                if error_message:
+                    print(error_message)
+    return default
+
+
+# Writes data to a temporary file first and moves it in place, so a crash never leaves a half written file.
+# With sync the file is on the disk once this returns. Returns the size of the JSON which was written.
+def save_json_file(path, data, sync=False) -> int:
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, mode=0o755)
+    contents = json.dumps(data)
+    temporary_file = "{}.tmp".format(path)
+    with open(temporary_file, "w") as file:
+        file.write(contents)
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(temporary_file, path)
+    return len(contents)
@@ -11,6 +11,11 @@ CONFIG_FILE_PATH = os.path.join(CONFIG_DIR, "config.json")
 CACHE_DIR = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), "minigalaxy")
 
 THUMBNAIL_DIR = os.path.join(CACHE_DIR, "thumbnails")
+DOWNLOAD_JOURNAL_PATH = os.path.join(CACHE_DIR, "download", "journal.json")
+DOWNLOAD_CHECKSUMS_PATH = os.path.join(CACHE_DIR, "download", "checksums.json")
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, "http")
+CATALOG_PATH = os.path.join(CACHE_DIR, "catalog.json")
+REQUEST_TRACE_PATH = os.path.join(CACHE_DIR, "requests.jsonl")
 DEFAULT_INSTALL_DIR = os.path.expanduser("~/GOG Games")
 
 UI_DIR = os.path.abspath(os.path.join(LAUNCH_DIR, "../data/ui"))
@@ -0,0 +1,122 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# How many requests can be made to a host at the same time and how many can be started per second. Up to
+# MAX_IN_FLIGHT requests can be started at once after a quiet moment.
+MAX_IN_FLIGHT = 8
+REQUESTS_PER_SECOND = 20
+# Requests answered with these status codes are sent again after the host asked to wait, or after a growing delay
+THROTTLED_STATUS_CODES = [429]
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF = 1  # seconds
+MAXIMUM_RETRY_DELAY = 60  # seconds
+
+
+# Keeps the requests to every host of the GOG API within a limit, so GOG doesn't throttle Minigalaxy. When GOG does,
+# all requests to that host wait for as long as the Retry-After header asks, instead of only the throttled one.
+class __RateLimiter:
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, requests_per_second=REQUESTS_PER_SECOND,
+                 retries=RATE_LIMIT_RETRIES, backoff=RATE_LIMIT_BACKOFF):
+        self.__max_in_flight = max_in_flight
+        self.__requests_per_second = requests_per_second
+        self.__retries = retries
+        self.__backoff = backoff
+        self.__state_changed = threading.Condition()
+        self.__hosts = {}
+
+    # send is called without arguments and returns the response. It's called again when the response says the host is
+    # throttling requests, until it isn't or the retries run out. The last response is returned, every response received
+    # is added to responses as well.
+    def request(self, url, send, responses=None):
+        host = urlparse(url).netloc
+        attempt = 0
+        while True:
+            self.__acquire(host)
+            try:
+                response = send()
+            finally:
+                self.__release(host)
+            if responses is not None:
+                responses.append(response)
+            if response.status_code not in THROTTLED_STATUS_CODES:
+                return response
+            self.__count(host, "throttled")
+            if attempt == self.__retries:
+                return response
+            self.pause(url, self.get_retry_delay(response.headers.get("Retry-After"), attempt))
+            self.__count(host, "retries")
+            attempt += 1
+
+    # No requests are started to the host of url for the given number of seconds
+    def pause(self, url, seconds):
+        with self.__state_changed:
+            host = self.__get_host(urlparse(url).netloc)
+            host["paused_until"] = max(host["paused_until"], time.monotonic() + seconds)
+            self.__state_changed.notify_all()
+
+    def get_counters(self) -> dict:
+        with self.__state_changed:
+            return {name: {key: value for key, value in host.items() if key not in ["tokens", "updated", "paused_until"]}
+                    for name, host in self.__hosts.items()}
+
+    # Retry-After is either a number of seconds or a date. Without it, the delay doubles with every attempt. A random
+    # part is added, so requests throttled at the same time aren't sent again at the same time.
+    def get_retry_delay(self, retry_after, attempt) -> float:
+        delay = None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    pass
+        if delay is None:
+            delay = random.uniform(0, self.__backoff * 2 ** attempt)
+        else:
+            delay += random.uniform(0, self.__backoff)
+        return min(max(0, delay), MAXIMUM_RETRY_DELAY)
+
+    def __acquire(self, host_name):
+        start = time.monotonic()
+        with self.__state_changed:
+            host = self.__get_host(host_name)
+            while True:
+                now = time.monotonic()
+                # Every second adds tokens for that many requests, up to the maximum number in flight
+                host["tokens"] = min(self.__max_in_flight,
+                                     host["tokens"] + (now - host["updated"]) * self.__requests_per_second)
+                host["updated"] = now
+                wait = max(host["paused_until"] - now, (1 - host["tokens"]) / self.__requests_per_second)
+                if host["in_flight"] < self.__max_in_flight and wait <= 0:
+                    break
+                # Returned requests wake up waiting ones, otherwise they wait until there's a token
+                self.__state_changed.wait(wait if wait > 0 else None)
+            host["tokens"] -= 1
+            host["in_flight"] += 1
+            host["peak_in_flight"] = max(host["peak_in_flight"], host["in_flight"])
+            host["requests"] += 1
+            host["wait_seconds"] += time.monotonic() - start
+
+    def __release(self, host_name):
+        with self.__state_changed:
+            self.__hosts[host_name]["in_flight"] -= 1
+            self.__state_changed.notify_all()
+
+    def __count(self, host_name, counter):
+        with self.__state_changed:
+            self.__hosts[host_name][counter] += 1
+
+    def __get_host(self, host_name) -> dict:
+        if host_name not in self.__hosts:
+            self.__hosts[host_name] = {
+                "requests": 0, "in_flight": 0, "peak_in_flight": 0, "wait_seconds": 0, "throttled": 0, "retries": 0,
+                "tokens": self.__max_in_flight, "updated": time.monotonic(), "paused_until": 0
+            }
+        return self.__hosts[host_name]
+
+
+RateLimiter = __RateLimiter()
@@ -0,0 +1,76 @@
+import re
+import json
+import time
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+# How many of the latest requests are kept
+TRACE_SIZE = 1000
+
+
+# Keeps the timings of the latest requests to the GOG API, so slow endpoints can be found.
+# Requests are grouped by their url template, which is the url without the query and with every part of the path
+# containing a number replaced by {id}.
+class __RequestTrace:
+    def __init__(self, size=TRACE_SIZE):
+        self.__lock = threading.Lock()
+        self.__entries = deque(maxlen=size)
+
+    # Durations are in seconds, cache is None for requests which can't come from the cache and otherwise "hit",
+    # "miss" or "revalidated". retries is the number of times the request was sent again.
+    def record(self, method, url, status, size, time_to_first_byte, duration, cache=None, retries=0) -> dict:
+        entry = {
+            "time": time.time(),
+            "method": method,
+            "url": self.get_template(url),
+            "status": status,
+            "bytes": size,
+            "time_to_first_byte": time_to_first_byte,
+            "duration": duration,
+            "cache": cache,
+            "retries": retries
+        }
+        with self.__lock:
+            self.__entries.append(entry)
+        return entry
+
+    def get_entries(self) -> list:
+        with self.__lock:
+            return list(self.__entries)
+
+    def dump(self, file):
+        # Writes every entry as a line of JSON to the file object
+        for entry in self.get_entries():
+            file.write(json.dumps(entry))
+            file.write("\n")
+
+    # Returns the number of requests and the median and 95th percentile duration for every url template
+    def get_summary(self) -> dict:
+        durations = {}
+        for entry in self.get_entries():
+            durations.setdefault("{} {}".format(entry["method"], entry["url"]), []).append(entry["duration"])
+        summary = {}
+        for endpoint, endpoint_durations in durations.items():
+            endpoint_durations.sort()
+            summary[endpoint] = {
+                "count": len(endpoint_durations),
+                "p50": self.get_percentile(endpoint_durations, 50),
+                "p95": self.get_percentile(endpoint_durations, 95)
+            }
+        return summary
+
+    @staticmethod
+    def get_percentile(sorted_values, percentile):
+        # Nearest rank, so the result is always one of the values
+        rank = max(1, -(-len(sorted_values) * percentile // 100))
+        return sorted_values[rank - 1]
+
+    @staticmethod
+    def get_template(url):
+        parsed_url = urlparse(url)
+        path = "/".join("{id}" if re.search(r"\d", part) else part for part in parsed_url.path.split("/"))
+        return "{}://{}{}".format(parsed_url.scheme, parsed_url.netloc, path)
+
+
+RequestTrace = __RequestTrace()
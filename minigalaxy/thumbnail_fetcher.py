@@ -0,0 +1,89 @@
+import os
+import heapq
+import itertools
+import threading
+from requests.exceptions import RequestException
+from minigalaxy.constants import SESSION, THUMBNAIL_WORKERS
+
+
+# Downloads the thumbnails of the library on a few worker threads which share the connections of SESSION.
+# Thumbnails of tiles which are visible are downloaded first, the others in the order they were asked for.
+class __ThumbnailFetcher:
+    def __init__(self, workers=THUMBNAIL_WORKERS):
+        self.__workers = workers
+        self.__threads = []
+        self.__state_changed = threading.Condition()
+        # Maps the url of every thumbnail which hasn't been downloaded yet to its save location and finish functions
+        self.__pending = {}
+        # Entries are (not visible, counter, url), a url can be in here more than once after becoming visible
+        self.__heap = []
+        self.__visible = set()
+        self.__counter = itertools.count()
+
+    def fetch(self, url, save_location, finish_func):
+        # finish_func is called without arguments on a worker thread once the thumbnail is saved
+        with self.__state_changed:
+            if url in self.__pending:
+                # The thumbnail is already on its way
+                self.__pending[url][1].append(finish_func)
+                return
+            self.__pending[url] = (save_location, [finish_func])
+            heapq.heappush(self.__heap, (url not in self.__visible, next(self.__counter), url))
+            self.__start_workers()
+            self.__state_changed.notify()
+
+    def set_visible(self, urls):
+        # The thumbnails of the given urls go before the ones which haven't been visible, in the given order
+        with self.__state_changed:
+            for url in urls:
+                if url not in self.__visible and url in self.__pending:
+                    heapq.heappush(self.__heap, (False, next(self.__counter), url))
+            self.__visible = set(urls)
+
+    def __start_workers(self):
+        while len(self.__threads) < self.__workers:
+            worker = threading.Thread(target=self.__work)
+            worker.daemon = True
+            worker.start()
+            self.__threads.append(worker)
+
+    def __work(self):
+        while True:
+            url, save_location, finish_funcs = self.__get_next()
+            # The worker keeps going for the other thumbnails when one of them fails
+            try:
+                if self.__download(url, save_location):
+                    for finish_func in finish_funcs:
+                        finish_func()
+            except Exception as e:
+                print("Couldn't save thumbnail {}: {}".format(url, e))
+
+    def __get_next(self):
+        with self.__state_changed:
+            while True:
+                while not self.__heap:
+                    self.__state_changed.wait()
+                _, _, url = heapq.heappop(self.__heap)
+                # Urls which became visible have an earlier entry which was already used
+                if url in self.__pending:
+                    save_location, finish_funcs = self.__pending.pop(url)
+                    return url, save_location, finish_funcs
+
+    @staticmethod
+    def __download(url, save_location):
+        try:
+            response = SESSION.get(url, timeout=30)
+            response.raise_for_status()
+        except RequestException as e:
+            print("Couldn't download thumbnail {}: {}".format(url, e))
+            return False
+        # Write to another file first, so a tile never shows a half written thumbnail
+        os.makedirs(os.path.dirname(save_location), exist_ok=True)
+        part_location = "{}.part".format(save_location)
+        with open(part_location, "wb") as save_file:
+            save_file.write(response.content)
+        os.replace(part_location, save_location)
+        return True
+
+
+ThumbnailFetcher = __ThumbnailFetcher()
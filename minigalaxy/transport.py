@@ -0,0 +1,128 @@
+import random
+import socket
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from minigalaxy.config import Config
+from minigalaxy.constants import MAX_PARALLEL_API_REQUESTS, THUMBNAIL_WORKERS
+
+# The number of hosts connections are kept open for
+POOLED_HOSTS = 20
+# Requests which fail to connect or get one of these status codes are sent again, waiting longer every time
+RETRIES = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+# Idle connections are checked after this many seconds, so connections dropped by a router are noticed
+KEEP_ALIVE_IDLE = 60  # seconds
+
+
+# Keeps track of how the connections of every host are used.
+# Requests which find all pooled connections of a host in use open a new connection, which is closed afterwards
+# instead of being kept for later. When that happens often, the pool of the host is too small.
+class __PoolStatistics:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__hosts = {}
+
+    def connection_taken(self, host, pool_size, exhausted, waited):
+        with self.__lock:
+            statistics = self.__hosts.setdefault(host, {
+                "pool_size": pool_size, "in_use": 0, "peak_in_use": 0, "requests": 0, "exhausted": 0, "wait_seconds": 0
+            })
+            statistics["pool_size"] = pool_size
+            statistics["in_use"] += 1
+            statistics["peak_in_use"] = max(statistics["peak_in_use"], statistics["in_use"])
+            statistics["requests"] += 1
+            statistics["exhausted"] += exhausted
+            statistics["wait_seconds"] += waited
+
+    def connection_returned(self, host):
+        with self.__lock:
+            if host in self.__hosts:
+                self.__hosts[host]["in_use"] -= 1
+
+    def get_statistics(self) -> dict:
+        with self.__lock:
+            return {host: dict(statistics) for host, statistics in self.__hosts.items()}
+
+
+PoolStatistics = __PoolStatistics()
+
+
+# Reports to PoolStatistics whenever a request takes a connection from the pool or gives it back
+class StatisticsPoolMixin:
+    def _get_conn(self, timeout=None):
+        exhausted = self.pool is not None and self.pool.empty()
+        start = time.monotonic()
+        connection = super()._get_conn(timeout)
+        PoolStatistics.connection_taken(self.__get_key(), self.pool.maxsize, exhausted, time.monotonic() - start)
+        return connection
+
+    def _put_conn(self, conn):
+        PoolStatistics.connection_returned(self.__get_key())
+        super()._put_conn(conn)
+
+    def __get_key(self):
+        return "{}://{}:{}".format(self.scheme, self.host, self.port)
+
+
+class StatisticsHTTPConnectionPool(StatisticsPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class StatisticsHTTPSConnectionPool(StatisticsPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+# Servers asking to wait with 429 are left to the rate limiter of the API, which makes all requests to the host wait.
+# The backoff is random, so requests failing at the same time aren't sent again at the same time.
+class JitteredRetry(Retry):
+    RETRY_AFTER_STATUS_CODES = frozenset([413, 503])
+
+    def get_backoff_time(self):
+        return random.uniform(0, super().get_backoff_time())
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    def __init__(self, pool_size):
+        # By default only requests which can safely be sent twice, like GET and HEAD, are retried. The methods aren't
+        # passed, because urllib3 before 1.26 calls the argument method_whitelist instead of allowed_methods.
+        retries = JitteredRetry(
+            total=RETRIES,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_STATUS_CODES,
+            raise_on_status=False
+        )
+        super().__init__(pool_connections=POOLED_HOSTS, pool_maxsize=pool_size, max_retries=retries)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs["socket_options"] = self.get_socket_options()
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": StatisticsHTTPConnectionPool,
+            "https": StatisticsHTTPSConnectionPool
+        }
+
+    @staticmethod
+    def get_socket_options():
+        socket_options = list(HTTPConnection.default_socket_options)
+        socket_options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEP_ALIVE_IDLE))
+        return socket_options
+
+
+# Every download segment, thumbnail worker and parallel API request can use a connection to the same host
+def get_pool_size():
+    downloads_per_host = Config.get("max_downloads_per_host") or Config.get("max_parallel_downloads") or 1
+    download_connections = downloads_per_host * (Config.get("download_segments") or 1)
+    return max(MAX_PARALLEL_API_REQUESTS, THUMBNAIL_WORKERS, download_connections)
+
+
+def configure_session(session, pool_size=None):
+    adapter = PooledHTTPAdapter(pool_size or get_pool_size())
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
@@ -2,14 +2,17 @@ import shutil
 import os
 import threading
 import re
-import time
 import urllib.parse
 from enum import Enum
+from requests.exceptions import RequestException
 from minigalaxy.translation import _
 from minigalaxy.paths import CACHE_DIR, THUMBNAIL_DIR, UI_DIR
 from minigalaxy.config import Config
 from minigalaxy.download import Download
+from minigalaxy.download_progress import DownloadProgress
 from minigalaxy.download_manager import DownloadManager
+from minigalaxy.download_journal import DownloadJournal
+from minigalaxy.thumbnail_fetcher import ThumbnailFetcher
 from minigalaxy.launcher import start_game
 from minigalaxy.installer import uninstall_game, install_game, check_diskspace
 from minigalaxy.css import CSS_PROVIDER
@@ -67,11 +70,11 @@ class GameTile(Gtk.Box):
             os.makedirs(CACHE_DIR, mode=0o755)
 
         self.reload_state()
-        load_thumbnail_thread = threading.Thread(target=self.load_thumbnail)
-        load_thumbnail_thread.start()
+        self.load_thumbnail()
 
         # Start download if Minigalaxy was closed while downloading this game
-        self.resume_download_if_expected()
+        if parent.connected:
+            self.resume_download_if_expected()
 
         # Icon for Windows games
         if self.game.platform == "windows":
@@ -81,26 +84,73 @@ class GameTile(Gtk.Box):
 
     # Downloads if Minigalaxy was closed with this game downloading
     def resume_download_if_expected(self):
-        download_id = Config.get("current_download")
-        if download_id and download_id == self.game.id and self.current_state == self.state.DOWNLOADABLE:
-            download_thread = threading.Thread(target=self.__download_game)
-            download_thread.start()
-
-    # Do not restart the download if Minigalaxy is restarted
-    def prevent_resume_on_startup(self):
-        download_id = Config.get("current_download")
-        if download_id and download_id == self.game.id:
+        journal_entries = DownloadJournal.get_entries(self.game.id)
+        if journal_entries:
+            self.__resume_download(journal_entries)
+        # Start: Code for compatibility with minigalaxy 1.0.2 and older
+        elif Config.get("current_download") == self.game.id:
             Config.unset("current_download")
+            if self.current_state == self.state.DOWNLOADABLE:
+                download_thread = threading.Thread(target=self.__download_game)
+                download_thread.start()
+        # End: Code for compatibility with minigalaxy 1.0.2 and older
+
+    # Queue the downloads from the journal again, without asking the API for the links and checksums
+    def __resume_download(self, journal_entries):
+        resume_info = journal_entries[0]["resume_info"]
+        finish_func, cancel_to_state = self.__get_download_callbacks(resume_info)
+        GLib.idle_add(self.update_to_state, self.state.QUEUED)
+        self.download = []
+        progress = DownloadProgress(self.set_progress)
+        for entry in journal_entries:
+            if entry["number"] == 1:
+                self.download_path = entry["save_location"]
+            if entry["md5"]:
+                self.game.md5sum[os.path.basename(entry["save_location"])] = entry["md5"]
+            download = Download(
+                url=entry["url"],
+                save_location=entry["save_location"],
+                finish_func=finish_func,
+                cancel_func=lambda: self.__cancel(to_state=cancel_to_state),
+                number=entry["number"],
+                out_of_amount=entry["out_of_amount"],
+                size=entry["size"],
+                priority=entry["priority"],
+                md5=entry["md5"],
+                chunks=entry["chunks"],
+                game_id=self.game.id,
+                resume_info=entry["resume_info"],
+                url_resolver=self.__get_url_resolver(entry["resume_info"]["downlink"]),
+                progress=progress
+            )
+            self.download.append(download)
+        # A game which is still being downloaded for a tile from before keeps its downloads
+        self.download = DownloadManager.download(self.download)
+
+    # Returns what to do once a download has finished and to which state to go back when it's cancelled
+    def __get_download_callbacks(self, resume_info):
+        if resume_info["type"] == "update":
+            return self.__update, self.state.UPDATABLE
+        if resume_info["type"] == "dlc":
+            return lambda: self.__install_dlc(dlc_title=resume_info["dlc_title"]), self.state.INSTALLED
+        return self.__install_game, self.state.DOWNLOADABLE
+
+    def __get_url_resolver(self, downlink):
+        return lambda: self.api.get_real_download_link(downlink)
 
     def __str__(self):
         return self.game.name
 
     @Gtk.Template.Callback("on_button_clicked")
     def on_button_click(self, widget) -> None:
-        dont_act_in_states = [self.state.QUEUED, self.state.DOWNLOADING, self.state.INSTALLING, self.state.UNINSTALLING]
+        dont_act_in_states = [self.state.INSTALLING, self.state.UNINSTALLING]
         err_msg = ""
         if self.current_state in dont_act_in_states:
             pass
+        elif self.current_state == self.state.QUEUED:
+            DownloadManager.download_next(self.download)
+        elif self.current_state == self.state.DOWNLOADING:
+            self.__toggle_download_paused()
         elif self.current_state in [self.state.INSTALLED, self.state.UPDATABLE]:
             err_msg = start_game(self.game)
         elif self.current_state == self.state.INSTALLABLE:
@@ -112,6 +162,14 @@ class GameTile(Gtk.Box):
         if err_msg:
             self.parent.parent.show_error(_("Failed to start {}:").format(self.game.name), err_msg)
 
+    def __toggle_download_paused(self):
+        if any(DownloadManager.is_download_paused(download) for download in self.download):
+            DownloadManager.resume_download(self.download)
+            self.button.set_label(_("downloading…"))
+        else:
+            DownloadManager.pause_download(self.download)
+            self.button.set_label(_("paused"))
+
     @Gtk.Template.Callback("on_menu_button_properties_clicked")
     def show_properties(self, button):
         properties_window = Properties(self, self.game, self.api)
@@ -122,7 +180,6 @@ class GameTile(Gtk.Box):
     def on_button_cancel(self, widget):
         question = _("Are you sure you want to cancel downloading {}?").format(self.game.name)
         if self.parent.parent.show_question(question):
-            self.prevent_resume_on_startup()
             DownloadManager.cancel_download(self.download)
             try:
                 for filename in os.listdir(self.download_dir):
@@ -145,23 +202,20 @@ class GameTile(Gtk.Box):
 
     def load_thumbnail(self):
         set_result = self.__set_image()
-        if not set_result:
-            tries = 10
-            performed_try = 0
-            while performed_try < tries:
-                if self.game.image_url and self.game.id:
-                    # Download the thumbnail
-                    image_url = "https:{}_196.jpg".format(self.game.image_url)
-                    thumbnail = os.path.join(THUMBNAIL_DIR, "{}.jpg".format(self.game.id))
-
-                    download = Download(image_url, thumbnail, finish_func=self.__set_image)
-                    DownloadManager.download_now(download)
-                    set_result = True
-                    break
-                performed_try += 1
-                time.sleep(1)
+        thumbnail_url = self.get_thumbnail_url()
+        if not set_result and thumbnail_url:
+            thumbnail = os.path.join(THUMBNAIL_DIR, "{}.jpg".format(self.game.id))
+            ThumbnailFetcher.fetch(thumbnail_url, thumbnail, self.__set_image)
+            set_result = True
+        # The library loads the thumbnail again once it knows the image of the game
+        self.thumbnail_set = set_result
         return set_result
 
+    def get_thumbnail_url(self):
+        if not self.game.image_url or not self.game.id:
+            return None
+        return "https:{}_196.jpg".format(self.game.image_url)
+
     def __set_image(self):
         set_result = False
         self.game.set_install_dir()
@@ -195,10 +249,8 @@ class GameTile(Gtk.Box):
         try:
             download_info = self.api.get_download_info(self.game)
             result = True
-        except NoDownloadLinkFound as e:
+        except (NoDownloadLinkFound, RequestException) as e:
             print(e)
-            if Config.get("current_download") == self.game.id:
-                Config.unset("current_download")
             GLib.idle_add(self.parent.parent.show_error, _("Download error"),
                           _("There was an error when trying to fetch the download link!\n{}".format(e)))
             download_info = False
@@ -206,31 +258,29 @@ class GameTile(Gtk.Box):
         return result, download_info
 
     def __download_game(self) -> None:
-        finish_func = self.__install_game
-        cancel_to_state = self.state.DOWNLOADABLE
+        resume_info = {"type": "game"}
+        finish_func, cancel_to_state = self.__get_download_callbacks(resume_info)
         result, download_info = self.get_download_info()
         if result:
-            result = self.__download(download_info, finish_func, cancel_to_state)
+            result = self.__download(download_info, finish_func, cancel_to_state, resume_info)
         if not result:
             GLib.idle_add(self.update_to_state, cancel_to_state)
 
-    def __download(self, download_info, finish_func, cancel_to_state):
+    def __download(self, download_info, finish_func, cancel_to_state, resume_info):
         download_success = True
         GLib.idle_add(self.update_to_state, self.state.QUEUED)
-        Config.set("current_download", self.game.id)
         # Start the download for all files
         self.download = []
         number_of_files = len(download_info['files'])
         total_file_size = 0
-        for key, file_info in enumerate(download_info['files']):
-            try:
-                download_url = self.api.get_real_download_link(file_info["downlink"])
-            except ValueError as e:
-                print(e)
-                GLib.idle_add(self.parent.parent.show_error, _("Download error"), _(str(e)))
-                download_success = False
-                break
-            total_file_size += int(self.api.get_file_size(file_info["downlink"]))
+        progress = DownloadProgress(self.set_progress)
+        download_files = self.__get_download_files(download_info)
+        if download_files is None:
+            return False
+        for key, (file_info, download_file) in enumerate(zip(download_info['files'], download_files)):
+            download_url = download_file["url"]
+            file_size = download_file["size"]
+            total_file_size += file_size
             try:
                 # Extract the filename from the download url (filename is between %2F and &token)
                 filename = urllib.parse.unquote(re.search('%2F(((?!%2F).)*)&t', download_url).group(1))
@@ -241,20 +291,29 @@ class GameTile(Gtk.Box):
             except AttributeError:
                 if key > 0:
                     download_path = "{}-{}.bin".format(self.download_path, key)
-            self.game.md5sum[os.path.basename(download_path)] = self.api.get_download_file_md5(file_info["downlink"])
+            md5 = download_file["md5"]
+            # Files without a checksum XML can't be checked after downloading
+            if md5:
+                self.game.md5sum[os.path.basename(download_path)] = md5
             download = Download(
                 url=download_url,
                 save_location=download_path,
                 finish_func=finish_func,
-                progress_func=self.set_progress,
                 cancel_func=lambda: self.__cancel(to_state=cancel_to_state),
                 number=key + 1,
-                out_of_amount=number_of_files
+                out_of_amount=number_of_files,
+                size=file_size,
+                md5=md5,
+                chunks=download_file["chunks"],
+                game_id=self.game.id,
+                resume_info=dict(resume_info, downlink=file_info["downlink"]),
+                url_resolver=self.__get_url_resolver(file_info["downlink"]),
+                progress=progress
             )
             self.download.append(download)
 
         if check_diskspace(total_file_size, Config.get("install_dir")):
-            DownloadManager.download(self.download)
+            self.download = DownloadManager.download(self.download)
             ds_msg_title = ""
             ds_msg_text = ""
         else:
@@ -265,11 +324,20 @@ class GameTile(Gtk.Box):
             GLib.idle_add(self.parent.parent.show_error, _(ds_msg_title), _(ds_msg_text))
         return download_success
 
+    def __get_download_files(self, download_info):
+        # The links and checksums of all files are requested at the same time
+        try:
+            return self.api.get_download_files([file_info["downlink"] for file_info in download_info['files']])
+        except (ValueError, RequestException) as e:
+            print(e)
+            GLib.idle_add(self.parent.parent.show_error, _("Download error"), _(str(e)))
+            return None
+
     def __install_game(self):
         self.game.set_install_dir()
         install_success = self.__install()
         if install_success:
-            self.__check_for_dlc(self.api.get_info(self.game))
+            self.__check_for_dlc(self.api.get_info(self.game, ["expanded_dlcs"]))
 
     def __install(self, update=False, dlc_title=""):
         keep_executable_path = self.get_keep_executable_path()
@@ -305,24 +373,20 @@ class GameTile(Gtk.Box):
         GLib.idle_add(self.reload_state)
 
     def __download_update(self) -> None:
-        finish_func = self.__update
-        cancel_to_state = self.state.UPDATABLE
+        resume_info = {"type": "update"}
+        finish_func, cancel_to_state = self.__get_download_callbacks(resume_info)
         result, download_info = self.get_download_info()
         if result:
-            result = self.__download(download_info, finish_func, cancel_to_state)
+            result = self.__download(download_info, finish_func, cancel_to_state, resume_info)
         if not result:
             GLib.idle_add(self.update_to_state, cancel_to_state)
 
-    def __check_for_update_dlc(self):
-        if self.game.is_installed() and self.game.id and not self.offline:
-            game_info = self.api.get_info(self.game)
-            game_version = self.api.get_version(self.game, gameinfo=game_info)
-            update_available = self.game.is_update_available(game_version)
-            if update_available:
-                GLib.idle_add(self.update_to_state, self.state.UPDATABLE)
-            self.__check_for_dlc(game_info)
-        if self.offline:
-            GLib.idle_add(self.menu_button_dlc.hide)
+    def __update_checked(self, game_info, game_version):
+        if not self.game.is_installed():
+            return
+        if self.game.is_update_available(game_version):
+            GLib.idle_add(self.update_to_state, self.state.UPDATABLE)
+        self.__check_for_dlc(game_info)
 
     def __update(self):
         install_success = self.__install(update=True)
@@ -333,16 +397,14 @@ class GameTile(Gtk.Box):
                 self.image.set_tooltip_text(self.game.name)
 
     def __download_dlc(self, dlc_installers) -> None:
-        def finish_func():
-            self.__install_dlc(dlc_title=dlc_title)
-
         download_info = self.api.get_download_info(self.game, dlc_installers=dlc_installers)
         dlc_title = self.game.name
         for dlc in self.game.dlcs:
             if dlc["downloads"]["installers"] == dlc_installers:
                 dlc_title = dlc["title"]
-        cancel_to_state = self.state.INSTALLED
-        result = self.__download(download_info, finish_func, cancel_to_state)
+        resume_info = {"type": "dlc", "dlc_title": dlc_title}
+        finish_func, cancel_to_state = self.__get_download_callbacks(resume_info)
+        result = self.__download(download_info, finish_func, cancel_to_state, resume_info)
         if not result:
             GLib.idle_add(self.update_to_state, cancel_to_state)
 
@@ -350,7 +412,9 @@ class GameTile(Gtk.Box):
         install_success = self.__install(dlc_title=dlc_title)
         if not install_success:
             GLib.idle_add(self.update_to_state, self.state.INSTALLED)
-        self.__check_for_update_dlc()
+        if not self.offline:
+            # The last check is used again to show the new state of the DLC
+            self.parent.update_checker.add(self.game, self.__update_checked)
 
     def __check_for_dlc(self, game_info):
         dlcs = game_info["expanded_dlcs"]
@@ -406,11 +470,24 @@ class GameTile(Gtk.Box):
         pixbuf = GdkPixbuf.Pixbuf.new_from_stream(response)
         self.dlc_dict[user_data][1].set_from_pixbuf(pixbuf)
 
-    def set_progress(self, percentage: int):
+    def set_progress(self, percentage: int, bytes_per_second=0, seconds_left=None):
         if self.current_state == self.state.QUEUED:
             GLib.idle_add(self.update_to_state, self.state.DOWNLOADING)
         if self.progress_bar:
             GLib.idle_add(self.progress_bar.set_fraction, percentage / 100)
+            GLib.idle_add(self.progress_bar.set_text, self.get_progress_text(percentage, bytes_per_second, seconds_left))
+
+    @staticmethod
+    def get_progress_text(percentage, bytes_per_second, seconds_left):
+        progress_text = "{}%".format(percentage)
+        if bytes_per_second > 0:
+            progress_text += " – {:.1f} MB/s".format(bytes_per_second / 1024**2)
+        if seconds_left is not None:
+            minutes, seconds = divmod(int(seconds_left), 60)
+            hours, minutes = divmod(minutes, 60)
+            time_left = "{}:{:02d}:{:02d}".format(hours, minutes, seconds) if hours else "{}:{:02d}".format(minutes, seconds)
+            progress_text += " – " + _("{} left").format(time_left)
+        return progress_text
 
     def __uninstall_game(self):
         GLib.idle_add(self.update_to_state, self.state.UNINSTALLING)
@@ -426,6 +503,8 @@ class GameTile(Gtk.Box):
         self.progress_bar.set_vexpand(False)
         self.set_center_widget(self.progress_bar)
         self.progress_bar.set_fraction(0.0)
+        self.progress_bar.set_show_text(True)
+        self.progress_bar.set_text("")
 
     def reload_state(self):
         self.game.set_install_dir()
@@ -435,8 +514,10 @@ class GameTile(Gtk.Box):
             return
         if self.game.is_installed():
             self.update_to_state(self.state.INSTALLED)
-            check_update_thread = threading.Thread(target=self.__check_for_update_dlc)
-            check_update_thread.start()
+            if self.offline:
+                self.menu_button_dlc.hide()
+            elif self.game.id and self.parent.connected:
+                self.parent.update_checker.add(self.game, self.__update_checked)
         elif self.get_keep_executable_path():
             self.update_to_state(self.state.INSTALLABLE)
         else:
@@ -475,7 +556,8 @@ class GameTile(Gtk.Box):
 
     def __state_queued(self):
         self.button.set_label(_("in queue…"))
-        self.button.set_sensitive(False)
+        self.button.set_tooltip_text(_("Download this game next"))
+        self.button.set_sensitive(True)
         self.image.set_sensitive(False)
         self.menu_button.hide()
         self.button_cancel.show()
@@ -483,7 +565,8 @@ class GameTile(Gtk.Box):
 
     def __state_downloading(self):
         self.button.set_label(_("downloading…"))
-        self.button.set_sensitive(False)
+        self.button.set_tooltip_text(_("Pause or continue downloading this game"))
+        self.button.set_sensitive(True)
         self.image.set_sensitive(False)
         self.menu_button.hide()
         self.button_cancel.show()
@@ -560,5 +643,6 @@ class GameTile(Gtk.Box):
 
     def update_to_state(self, state):
         self.current_state = state
+        self.button.set_tooltip_text(None)
         if state in self.STATE_UPDATE_HANDLERS:
             self.STATE_UPDATE_HANDLERS[state](self)
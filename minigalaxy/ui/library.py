@@ -7,6 +7,8 @@ from minigalaxy.paths import UI_DIR
 from minigalaxy.api import Api
 from minigalaxy.config import Config
 from minigalaxy.game import Game
+from minigalaxy.thumbnail_fetcher import ThumbnailFetcher
+from minigalaxy.update_checker import UpdateChecker
 from minigalaxy.ui.gametile import GameTile
 from minigalaxy.ui.gtk import Gtk, GLib
 from minigalaxy.translation import _
@@ -25,8 +27,14 @@ class Library(Gtk.Viewport):
         self.show_installed_only = Config.get("installed_filter")
         self.search_string = ""
         self.offline = False
+        # Tiles only contact GOG once the window has authenticated
+        self.connected = False
         self.games = []
         self.owned_products_ids = []
+        # Checks the installed games for updates and DLC, for all tiles together
+        self.update_checker = UpdateChecker(api)
+        # Thumbnails of the tiles in view are downloaded first
+        self.flowbox.connect("size-allocate", self.update_visible_tiles)
 
     def reset(self):
         self.games = []
@@ -35,19 +43,35 @@ class Library(Gtk.Viewport):
         self.flowbox.show_all()
         self.update_library()
 
+    def set_connected(self):
+        # Resume the downloads of the tiles which were created from the cached library before authenticating
+        if self.connected:
+            return
+        self.connected = True
+        for child in self.flowbox.get_children():
+            child.get_children()[0].resume_download_if_expected()
+
     def update_library(self) -> None:
         library_update_thread = threading.Thread(target=self.__update_library)
         library_update_thread.daemon = True
         library_update_thread.start()
 
+    def load_cached_library(self):
+        # Show the installed games and the library from the last time it was retrieved, without contacting GOG
+        self.games = self.__get_installed_games()
+        self.__add_retrieved_games(self.api.get_cached_library())
+        self.__create_gametiles()
+        self.filter_library()
+
     def __update_library(self):
         GLib.idle_add(self.__load_tile_states)
-        self.owned_products_ids = self.api.get_owned_products_ids()
-        # Get already installed games first
+        # Get already installed games and the library from the last time it was retrieved first
         self.games = self.__get_installed_games()
+        self.__add_retrieved_games(self.api.get_cached_library())
         GLib.idle_add(self.__create_gametiles)
+        self.owned_products_ids = self.api.get_owned_products_ids()
 
-        # Get games from the API
+        # Get the changes from the API
         self.__add_games_from_api()
         GLib.idle_add(self.__create_gametiles)
         GLib.idle_add(self.filter_library)
@@ -57,6 +81,21 @@ class Library(Gtk.Viewport):
             tile = child.get_children()[0]
             tile.reload_state()
 
+    def update_visible_tiles(self, *args):
+        adjustment = self.get_vadjustment()
+        if adjustment is None:
+            return
+        top = adjustment.get_value()
+        bottom = top + adjustment.get_page_size()
+        visible_urls = []
+        for child in self.flowbox.get_children():
+            if not child.get_mapped():
+                continue
+            allocation = child.get_allocation()
+            if allocation.y < bottom and allocation.y + allocation.height > top:
+                visible_urls.append(child.get_children()[0].get_thumbnail_url())
+        ThumbnailFetcher.set_visible(visible_urls)
+
     def filter_library(self, widget: Gtk.Widget = None):
         if isinstance(widget, Gtk.Switch):
             self.show_installed_only = widget.get_active()
@@ -92,11 +131,21 @@ class Library(Gtk.Viewport):
             tile = child.get_children()[0]
             if tile.game in self.games:
                 games_with_tiles.append(tile.game)
+                if not tile.thumbnail_set:
+                    self.__load_thumbnail(tile)
 
         for game in self.games:
             if game not in games_with_tiles:
                 self.__add_gametile(game)
 
+    def __load_thumbnail(self, tile):
+        # Installed games only get their id and image once the library has been retrieved
+        game = self.games[self.games.index(tile.game)]
+        tile.game.id = tile.game.id or game.id
+        tile.game.image_url = tile.game.image_url or game.image_url
+        if tile.get_thumbnail_url():
+            tile.load_thumbnail()
+
     def __add_gametile(self, game):
         self.flowbox.add(GameTile(self, game))
         self.sort_library()
@@ -144,12 +193,34 @@ class Library(Gtk.Viewport):
         return games
 
     def __add_games_from_api(self):
-        retrieved_games, err_msg = self.api.get_library()
+        changes, err_msg = self.api.sync_library(self.owned_products_ids, self.__add_page_of_games)
         if not err_msg:
             self.offline = False
         else:
             self.offline = True
             GLib.idle_add(self.parent.show_error, _("Failed to retrieve library"), _(err_msg))
+        self.__add_retrieved_games(changes["added"] + changes["changed"])
+        self.__remove_games(changes["removed"])
+
+    def __remove_games(self, removed_games):
+        # Installed games stay in the library, even when they're no longer owned
+        removed_games = [game for game in self.games if game in removed_games and not game.is_installed()]
+        for game in removed_games:
+            self.games.remove(game)
+        if removed_games:
+            GLib.idle_add(self.__remove_gametiles, removed_games)
+
+    def __remove_gametiles(self, games):
+        for child in self.flowbox.get_children():
+            if child.get_children()[0].game in games:
+                self.flowbox.remove(child)
+
+    def __add_page_of_games(self, retrieved_games):
+        # Show the tiles of every page of the library as soon as it has been retrieved
+        self.__add_retrieved_games(retrieved_games)
+        GLib.idle_add(self.__create_gametiles)
+
+    def __add_retrieved_games(self, retrieved_games):
         for game in retrieved_games:
             if game not in self.games:
                 self.games.append(game)
@@ -20,6 +20,7 @@ class Preferences(Gtk.Dialog):
     switch_show_hidden_games = Gtk.Template.Child()
     switch_show_windows_games = Gtk.Template.Child()
     switch_use_dark_theme = Gtk.Template.Child()
+    spin_download_speed_limit = Gtk.Template.Child()
     button_cancel = Gtk.Template.Child()
     button_save = Gtk.Template.Child()
 
@@ -33,6 +34,7 @@ class Preferences(Gtk.Dialog):
         self.switch_use_dark_theme.set_active(Config.get("use_dark_theme"))
         self.switch_show_hidden_games.set_active(Config.get("show_hidden_games"))
         self.switch_show_windows_games.set_active(Config.get("show_windows_games"))
+        self.spin_download_speed_limit.set_value(Config.get("download_speed_limit"))
 
         # Set tooltip for keep installers label
         installer_dir = os.path.join(self.button_file_chooser.get_filename(), "installer")
@@ -111,6 +113,12 @@ class Preferences(Gtk.Dialog):
         Config.set("show_hidden_games", self.switch_show_hidden_games.get_active())
         self.parent.library.filter_library()
 
+        # The new speed limit is used by running downloads as well
+        speed_limit = self.spin_download_speed_limit.get_value_as_int()
+        if speed_limit != Config.get("download_speed_limit"):
+            Config.set("download_speed_limit", speed_limit)
+            DownloadManager.bandwidth_limit_changed()
+
         if self.switch_show_windows_games.get_active() != Config.get("show_windows_games"):
             if self.switch_show_windows_games.get_active() and not shutil.which("wine"):
                 self.parent.show_error(_("Wine wasn't found. Showing Windows games cannot be enabled."))
@@ -84,7 +84,7 @@ class Properties(Gtk.Dialog):
     @Gtk.Template.Callback("on_button_properties_support_clicked")
     def on_menu_button_support(self, widget):
         try:
-            webbrowser.open(self.api.get_info(self.game)['links']['support'], new=2)
+            webbrowser.open(self.api.get_info(self.game, [])['links']['support'], new=2)
         except webbrowser.Error:
             self.parent.parent.show_error(
                 _("Couldn't open support page"),
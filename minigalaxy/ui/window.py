@@ -1,14 +1,18 @@
 import os
+import threading
 
 from minigalaxy.ui.login import Login
 from minigalaxy.ui.preferences import Preferences
 from minigalaxy.ui.about import About
 from minigalaxy.api import Api
+from minigalaxy.catalog import Catalog
 from minigalaxy.config import Config
+from minigalaxy.constants import SESSION
 from minigalaxy.paths import UI_DIR, LOGO_IMAGE_PATH, THUMBNAIL_DIR
+from minigalaxy.transport import configure_session
 from minigalaxy.translation import _
 from minigalaxy.ui.library import Library
-from minigalaxy.ui.gtk import Gtk, Gdk, GdkPixbuf
+from minigalaxy.ui.gtk import Gtk, Gdk, GdkPixbuf, GLib
 
 
 @Gtk.Template.from_file(os.path.join(UI_DIR, "application.ui"))
@@ -26,6 +30,8 @@ class Window(Gtk.ApplicationWindow):
 
     def __init__(self, name="Minigalaxy"):
         Gtk.ApplicationWindow.__init__(self, title=name)
+        # Size the connection pools for the configured number of downloads
+        configure_session(SESSION)
         self.api = Api()
         self.search_string = ""
         self.offline = False
@@ -33,6 +39,7 @@ class Window(Gtk.ApplicationWindow):
         # Set library
         self.library = Library(self, self.api)
         self.window_library.add(self.library)
+        self.window_library.get_vadjustment().connect("value-changed", self.library.update_visible_tiles)
         self.header_installed.set_active(Config.get("installed_filter"))
 
         # Set the icon
@@ -55,10 +62,11 @@ class Window(Gtk.ApplicationWindow):
         if not os.path.exists(THUMBNAIL_DIR):
             os.makedirs(THUMBNAIL_DIR, mode=0o755)
 
-        # Interact with the API
-        self.__authenticate()
-        self.HeaderBar.set_subtitle(self.api.get_user_info())
-        self.sync_library()
+        # Show the library from the last time right away, GOG is contacted in the background
+        self.library.load_cached_library()
+        connect_thread = threading.Thread(target=self.__connect)
+        connect_thread.daemon = True
+        connect_thread.start()
 
     @Gtk.Template.Callback("filter_library")
     def filter_library(self, switch, _=""):
@@ -86,6 +94,7 @@ class Window(Gtk.ApplicationWindow):
             self.HeaderBar.set_subtitle("")
             Config.unset("username")
             Config.unset("refresh_token")
+            Catalog.remove()
             self.hide()
             # Show the login screen
             self.__authenticate()
@@ -147,19 +156,38 @@ class Window(Gtk.ApplicationWindow):
 
     def __authenticate(self):
         url = None
-        if Config.get("stay_logged_in"):
-            token = Config.get("refresh_token")
-        else:
-            Config.unset("username")
-            Config.unset("refresh_token")
-            token = None
+        token = self.__get_refresh_token()
 
         # Make sure there is an internet connection
         if not self.api.can_connect():
             return
 
         authenticated = self.api.authenticate(refresh_token=token, login_code=url)
+        self.__login(authenticated)
+
+    def __connect(self):
+        # Authenticating with the refresh token is done on this thread, only the login page needs the main thread
+        token = self.__get_refresh_token()
+        if self.api.can_connect():
+            GLib.idle_add(self.__connected, self.api.authenticate(refresh_token=token))
+        else:
+            GLib.idle_add(self.__connected, None)
+
+    def __connected(self, authenticated):
+        if authenticated is not None:
+            self.__login(authenticated)
+        self.HeaderBar.set_subtitle(self.api.get_user_info())
+        self.sync_library()
+
+    def __get_refresh_token(self):
+        if Config.get("stay_logged_in"):
+            return Config.get("refresh_token")
+        Config.unset("username")
+        Config.unset("refresh_token")
+        return None
 
+    def __login(self, authenticated):
+        # Show the login page until logging in succeeds
         while not authenticated:
             login_url = self.api.get_login_url()
             redirect_url = self.api.get_redirect_url()
@@ -174,3 +202,5 @@ class Window(Gtk.ApplicationWindow):
                 authenticated = self.api.authenticate(login_code=result)
 
         Config.set("refresh_token", authenticated)
+        # Updates are checked for when the tiles are reloaded by syncing the library
+        self.library.set_connected()
@@ -0,0 +1,88 @@
+import time
+import threading
+from collections import deque
+from requests.exceptions import RequestException
+
+# How many games are checked at the same time
+UPDATE_CHECK_WORKERS = 4
+# How long the result of a check is used before the game is checked again
+UPDATE_CHECK_INTERVAL = 6 * 60 * 60  # seconds
+
+
+# Checks the installed games for updates and DLC on a few worker threads, instead of a thread per game.
+# The result of every check is kept for the interval, after which all games are checked again in the background.
+class UpdateChecker:
+    def __init__(self, api, workers=UPDATE_CHECK_WORKERS, interval=UPDATE_CHECK_INTERVAL):
+        self.__api = api
+        self.__workers = workers
+        self.__interval = interval
+        self.__threads = []
+        self.__timer = None
+        self.__state_changed = threading.Condition()
+        # Maps the id of every game which was added to the game and the function to call with its result
+        self.__games = {}
+        self.__queue = deque()
+        # Maps game ids to the time of their last check, their product info and their latest version
+        self.__results = {}
+
+    # callback is called with the product info and the latest version of the game. That happens right away when the
+    # game was checked recently, otherwise on a worker thread once it has been checked.
+    def add(self, game, callback):
+        with self.__state_changed:
+            self.__games[game.id] = (game, callback)
+            result = self.__results.get(game.id)
+            if result is None or time.time() - result[0] >= self.__interval:
+                result = None
+                self.__enqueue(game.id)
+            self.__start()
+        if result is not None:
+            callback(result[1], result[2])
+
+    def __start(self):
+        while len(self.__threads) < self.__workers:
+            worker = threading.Thread(target=self.__work)
+            worker.daemon = True
+            worker.start()
+            self.__threads.append(worker)
+        if self.__timer is None:
+            self.__schedule()
+
+    def __schedule(self):
+        self.__timer = threading.Timer(self.__interval, self.__check_all)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def __check_all(self):
+        with self.__state_changed:
+            for game_id in self.__games:
+                self.__enqueue(game_id)
+            self.__schedule()
+
+    def __enqueue(self, game_id):
+        if game_id not in self.__queue:
+            self.__queue.append(game_id)
+            self.__state_changed.notify()
+
+    def __work(self):
+        while True:
+            game, callback = self.__get_next()
+            try:
+                game_info = self.__api.get_info(game, ["downloads", "expanded_dlcs"])
+                game_version = self.__api.get_version(game, gameinfo=game_info)
+            except (RequestException, KeyError) as e:
+                # The game is checked again the next time it's added or all games are checked
+                print("Checking {} for updates failed: {}".format(game.name, e))
+                continue
+            with self.__state_changed:
+                self.__results[game.id] = (time.time(), game_info, game_version)
+            # The worker keeps checking the other games when a tile fails to handle the result
+            try:
+                callback(game_info, game_version)
+            except Exception as e:
+                print("Handling the update check of {} failed: {}".format(game.name, e))
+
+    def __get_next(self):
+        with self.__state_changed:
+            while not self.__queue:
+                self.__state_changed.wait()
+            return self.__games[self.__queue.popleft()]
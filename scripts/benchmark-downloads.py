@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Compares the download engine to the chunk loop Minigalaxy used before, by downloading from a local server.
+# Usage: scripts/benchmark-downloads.py [size in MiB] [rounds]
+import os
+import re
+import sys
+import hashlib
+import time
+import tempfile
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Keep the configuration and cache of the benchmark away from the ones of the user
+TEMP_DIR = tempfile.TemporaryDirectory()
+os.environ["HOME"] = TEMP_DIR.name
+os.environ["XDG_CONFIG_HOME"] = os.path.join(TEMP_DIR.name, "config")
+os.environ["XDG_CACHE_HOME"] = os.path.join(TEMP_DIR.name, "cache")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from minigalaxy.config import Config  # noqa: E402
+from minigalaxy.constants import DOWNLOAD_CHUNK_SIZE, SESSION  # noqa: E402
+from minigalaxy.download import Download  # noqa: E402
+from minigalaxy.download_manager import DownloadManager  # noqa: E402
+from minigalaxy.transport import configure_session  # noqa: E402
+
+BLOCK = os.urandom(16 * 1024**2)
+
+
+class BenchmarkRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    file_size = 0
+
+    def do_GET(self):
+        first_byte = 0
+        last_byte = self.file_size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            first_byte = int(match.group(1))
+            if match.group(2):
+                last_byte = min(int(match.group(2)), last_byte)
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(first_byte, last_byte, self.file_size))
+        else:
+            self.send_response(200)
+        self.send_header('ETag', '"benchmark"')
+        self.send_header('Content-Length', str(last_byte + 1 - first_byte))
+        self.end_headers()
+        block = memoryview(BLOCK)
+        position = first_byte
+        try:
+            while position <= last_byte:
+                offset = position % len(BLOCK)
+                data = block[offset:min(len(BLOCK), offset + last_byte + 1 - position)]
+                self.wfile.write(data)
+                position += len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(file_size, port_queue):
+    BenchmarkRequestHandler.file_size = file_size
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BenchmarkRequestHandler)
+    server.daemon_threads = True
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def download_with_chunk_loop(url, save_location):
+    # The loop download_operation used before
+    download_request = SESSION.get(url, headers={'Range': 'bytes=0-'}, stream=True, timeout=30)
+    with open(save_location, 'wb') as save_file:
+        for chunk in download_request.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            save_file.write(chunk)
+
+
+def download_with_chunk_loop_and_md5(url, save_location):
+    # Installers used to be read again to check their md5 after downloading, while the download manager hashes them
+    # while downloading
+    download_with_chunk_loop(url, save_location)
+    hash_md5 = hashlib.md5()
+    with open(save_location, "rb") as installer_file:
+        for chunk in iter(lambda: installer_file.read(4096), b""):
+            hash_md5.update(chunk)
+
+
+def download_with_download_manager(url, save_location):
+    DownloadManager.download_operation(Download(url, save_location), 0, 'wb')
+
+
+def measure(name, function, url, file_size, rounds):
+    save_location = os.path.join(TEMP_DIR.name, "download", "installer.sh")
+    os.makedirs(os.path.dirname(save_location), exist_ok=True)
+    wall_times = []
+    cpu_times = []
+    for _ in range(rounds):
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        function(url, save_location)
+        cpu_times.append(time.process_time() - start_cpu)
+        wall_times.append(time.perf_counter() - start_wall)
+        if os.path.getsize(save_location) != file_size:
+            raise RuntimeError("{} didn't download the whole file".format(name))
+        DownloadManager.remove_download_files(Download(url, save_location))
+    wall_time = min(wall_times)
+    cpu_time = min(cpu_times)
+    print("{:<34} {:>10.1f} MiB/s {:>10.2f} CPU s/GiB".format(
+        name, file_size / 1024**2 / wall_time, cpu_time / (file_size / 1024**3)))
+
+
+def main():
+    file_size = int(sys.argv[1] if len(sys.argv) > 1 else 512) * 1024**2
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(file_size, port_queue), daemon=True)
+    server.start()
+    url = "http://127.0.0.1:{}/installer.sh".format(port_queue.get())
+
+    configure_session(SESSION)
+    print("Downloading {} MiB, best of {} rounds".format(file_size // 1024**2, rounds))
+    measure("chunk loop (before)", download_with_chunk_loop, url, file_size, rounds)
+    measure("chunk loop + md5 check (before)", download_with_chunk_loop_and_md5, url, file_size, rounds)
+    for segments in [1, 4]:
+        Config.set("download_segments", segments)
+        measure("download manager, {} segment(s)".format(segments), download_with_download_manager, url, file_size,
+                rounds)
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
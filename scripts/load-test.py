@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# Syncs a large library and downloads installers from a local fake GOG server, to see how Minigalaxy copes with slow
+# or failing servers without contacting GOG.
+# Usage: scripts/load-test.py [--games N] [--downloads N] [--latency s] [--bandwidth MiB/s] [--failure-rate r]
+#                             [--drop-rate r] [--throttle-rate r]
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Keep the configuration and cache of the load test away from the ones of the user
+TEMP_DIR = tempfile.TemporaryDirectory()
+os.environ["HOME"] = TEMP_DIR.name
+os.environ["XDG_CONFIG_HOME"] = os.path.join(TEMP_DIR.name, "config")
+os.environ["XDG_CACHE_HOME"] = os.path.join(TEMP_DIR.name, "cache")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from minigalaxy.api import Api  # noqa: E402
+from minigalaxy.config import Config  # noqa: E402
+from minigalaxy.constants import SESSION  # noqa: E402
+from minigalaxy.download import Download  # noqa: E402
+from minigalaxy.download_manager import DownloadManager  # noqa: E402
+from minigalaxy.rate_limiter import RateLimiter  # noqa: E402
+from minigalaxy.request_trace import RequestTrace  # noqa: E402
+from minigalaxy.transport import PoolStatistics, configure_session  # noqa: E402
+from tests.fake_gog_server import FakeGogServer  # noqa: E402
+
+
+def download_game(api, game, directory):
+    installer = api.get_download_info(game)
+    download_files = api.get_download_files([file["downlink"] for file in installer["files"]])
+    for number, download_file in enumerate(download_files):
+        save_location = os.path.join(directory, "{}-{}.sh".format(game.id, number))
+        download = Download(download_file["url"], save_location, md5=download_file["md5"],
+                            chunks=download_file["chunks"])
+        if not DownloadManager.download_operation(download, 0, "wb"):
+            raise RuntimeError("Downloading {} failed".format(game.name))
+        size = os.path.getsize(save_location)
+        os.remove(save_location)
+        return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--downloads", type=int, default=4)
+    parser.add_argument("--installer-size", type=int, default=64, help="MiB")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--bandwidth", type=float, default=0, help="MiB/s per download, 0 is unlimited")
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--drop-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    arguments = parser.parse_args()
+
+    fake_gog = FakeGogServer(games=arguments.games, installer_size=arguments.installer_size * 1024**2)
+    fake_gog.latency = arguments.latency
+    fake_gog.bandwidth = arguments.bandwidth * 1024**2
+    fake_gog.failure_rate = arguments.failure_rate
+    fake_gog.drop_rate = arguments.drop_rate
+    fake_gog.throttle_rate = arguments.throttle_rate
+    fake_gog.start()
+    configure_session(SESSION)
+    fake_gog.redirect(SESSION)
+    api = Api()
+    Config.set("refresh_token", api.authenticate(refresh_token="refresh"))
+
+    start = time.perf_counter()
+    changes, err_msg = api.sync_library()
+    print("Synced {} games in {:.2f} s {}".format(len(changes["added"]), time.perf_counter() - start, err_msg))
+
+    directory = os.path.join(TEMP_DIR.name, "downloads")
+    os.makedirs(directory)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=arguments.downloads) as executor:
+        sizes = list(executor.map(lambda game: download_game(api, game, directory),
+                                  changes["added"][:arguments.downloads]))
+    duration = time.perf_counter() - start
+    print("Downloaded {} installers in {:.2f} s, {:.1f} MiB/s".format(
+        len(sizes), duration, sum(sizes) / 1024**2 / duration))
+
+    print("\nRequests per endpoint of the fake server")
+    for endpoint, count in fake_gog.requests.most_common():
+        print("{:>8} {}".format(count, endpoint))
+    print("\nRequest timings")
+    summary = RequestTrace.get_summary()
+    for endpoint in sorted(summary, key=lambda endpoint: summary[endpoint]["p95"], reverse=True):
+        print("{count:>8} p50 {p50:>7.3f} s p95 {p95:>7.3f} s ".format(**summary[endpoint]) + endpoint)
+    print("\nRate limiter")
+    for host, counters in RateLimiter.get_counters().items():
+        print("{} {}".format(host, counters))
+    print("\nConnection pools")
+    for host, statistics in PoolStatistics.get_statistics().items():
+        print("{} {}".format(host, statistics))
+    fake_gog.stop()
+
+
+if __name__ == "__main__":
+    main()
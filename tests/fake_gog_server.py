@@ -0,0 +1,290 @@
+# A local server answering the requests Minigalaxy makes to GOG, so syncing the library and downloading installers
+# can be tested without GOG. The latency, bandwidth and failures of the server can be changed while it runs.
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from minigalaxy.transport import PooledHTTPAdapter
+
+# The hosts of GOG which are answered by the fake server
+GOG_HOSTS = ["auth.gog.com", "embed.gog.com", "api.gog.com", "gamesdb.gog.com"]
+FIRST_GAME_ID = 1000000000
+GAMES_PER_PAGE = 100
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+TOKEN_LIFETIME = 3600  # seconds
+# Installers are sent in blocks of this size, so the bandwidth can be limited
+SEND_BLOCK_SIZE = 64 * 1024
+
+
+class FakeGogServer:
+    def __init__(self, games=10, installer_size=4 * 1024 * 1024, seed=0):
+        self.games = games
+        # randbytes needs Python 3.9
+        self.installer = random.Random(seed).getrandbits(8 * installer_size).to_bytes(installer_size, "little")
+        self.installer_md5 = hashlib.md5(self.installer).hexdigest()
+        # Seconds waited before every response
+        self.latency = 0
+        # Bytes per second every installer download is limited to, 0 means unlimited
+        self.bandwidth = 0
+        # The part of the requests which are answered with 503, whose connection is closed halfway or which are
+        # answered with 429 and a Retry-After header of retry_after seconds
+        self.failure_rate = 0
+        self.drop_rate = 0
+        self.throttle_rate = 0
+        self.retry_after = 1
+        # The next requests are answered with 503, regardless of the failure rate
+        self.failures = 0
+        # The number of requests made to every endpoint
+        self.requests = Counter()
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__token = 0
+        self.__server = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.__server.server_address[1])
+
+    def start(self):
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGogRequestHandler)
+        self.__server.daemon_threads = True
+        self.__server.fake_gog = self
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    # Requests of session to GOG are sent to this server instead
+    def redirect(self, session, pool_size=4):
+        adapter = FakeGogAdapter(self.url, pool_size)
+        for host in GOG_HOSTS:
+            session.mount("https://{}".format(host), adapter)
+
+    # Tokens given out before are rejected from now on
+    def expire_tokens(self):
+        with self.__lock:
+            self.__token += 1
+
+    def get_game_ids(self):
+        return list(range(FIRST_GAME_ID, FIRST_GAME_ID + self.games))
+
+    def get_fault(self):
+        # Returns None, "fail", "drop" or "throttle" for the next request
+        with self.__lock:
+            if self.failures > 0:
+                self.failures -= 1
+                return "fail"
+            chance = self.__random.random()
+        if chance < self.failure_rate:
+            return "fail"
+        if chance < self.failure_rate + self.drop_rate:
+            return "drop"
+        if chance < self.failure_rate + self.drop_rate + self.throttle_rate:
+            return "throttle"
+        return None
+
+    def get_token(self):
+        with self.__lock:
+            return "token-{}".format(self.__token)
+
+    def count(self, endpoint):
+        with self.__lock:
+            self.requests[endpoint] += 1
+
+    def get_product(self, game_id):
+        return {
+            "id": game_id,
+            "title": "Game {}".format(game_id),
+            "url": "/game/game_{}".format(game_id),
+            "image": "//images.gog.com/{}".format(game_id),
+            "worksOn": {"Windows": True, "Mac": False, "Linux": True}
+        }
+
+    def get_installers(self, game_id):
+        installers = []
+        for number, operating_system in enumerate(["windows", "linux"], 1):
+            file_id = "en{}installer0".format(number)
+            installers.append({
+                "id": "installer_{}_en".format(operating_system), "name": "Game {}".format(game_id),
+                "os": operating_system, "language": "en", "language_full": "English", "version": "1.0",
+                "total_size": len(self.installer),
+                "files": [{
+                    "id": file_id, "size": len(self.installer),
+                    "downlink": "https://api.gog.com/products/{}/downlink/installer/{}".format(game_id, file_id)
+                }]
+            })
+        return installers
+
+    def get_checksum_xml(self, game_id):
+        chunks = []
+        for number, first_byte in enumerate(range(0, len(self.installer), CHECKSUM_CHUNK_SIZE)):
+            last_byte = min(first_byte + CHECKSUM_CHUNK_SIZE, len(self.installer)) - 1
+            chunks.append('<chunk id="{}" from="{}" to="{}" method="md5">{}</chunk>'.format(
+                number, first_byte, last_byte, hashlib.md5(self.installer[first_byte:last_byte + 1]).hexdigest()))
+        return '<file name="game_{}.sh" available="1" md5="{}" chunks="{}" total_size="{}">{}</file>'.format(
+            game_id, self.installer_md5, len(chunks), len(self.installer), "".join(chunks))
+
+
+class FakeGogAdapter(PooledHTTPAdapter):
+    def __init__(self, server_url, pool_size):
+        self.__server_url = server_url
+        super().__init__(pool_size)
+
+    def send(self, request, **kwargs):
+        # https://api.gog.com/products/1 becomes http://127.0.0.1:<port>/api.gog.com/products/1
+        parsed_url = urlparse(request.url)
+        request.url = "{}/{}{}".format(self.__server_url, parsed_url.netloc, parsed_url.path)
+        if parsed_url.query:
+            request.url += "?" + parsed_url.query
+        return super().send(request, **kwargs)
+
+
+class FakeGogRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Endpoints which need a token are marked with True
+    endpoints = [
+        (r"/auth\.gog\.com/token", "token", False),
+        (r"/embed\.gog\.com/?", "connect", False),
+        (r"/embed\.gog\.com/user/data/games", "owned", True),
+        (r"/embed\.gog\.com/userData\.json", "user", True),
+        (r"/embed\.gog\.com/account/getFilteredProducts", "library_page", True),
+        (r"/api\.gog\.com/products/(\d+)", "product", True),
+        (r"/api\.gog\.com/products/(\d+)/downlink/installer/\w+", "downlink", True),
+        (r"/gamesdb\.gog\.com/platforms/gog/external_releases/(\d+)", "gamesdb", False),
+        (r"/cdn/(\d+)/installer\.sh", "installer", False),
+        (r"/cdn/(\d+)/installer\.sh\.xml", "checksum", False),
+    ]
+
+    def do_GET(self):
+        fake_gog = self.server.fake_gog
+        parsed_path = urlparse(self.path)
+        for pattern, endpoint, token_needed in self.endpoints:
+            match = re.fullmatch(pattern, parsed_path.path)
+            if match:
+                break
+        else:
+            return self.send_body(404, b"")
+        fake_gog.count(endpoint)
+        time.sleep(fake_gog.latency)
+        fault = fake_gog.get_fault()
+        if fault == "fail":
+            return self.send_body(503, b"Service Unavailable")
+        # Like GOG, only the API throttles requests, not the CDN
+        if fault == "throttle" and not parsed_path.path.startswith("/cdn/"):
+            return self.send_body(429, b"Too Many Requests", retry_after=fake_gog.retry_after)
+        if token_needed and self.headers.get("Authorization") != "Bearer {}".format(fake_gog.get_token()):
+            return self.send_json({"error": "invalid_token"}, 401)
+        query = {key: values[0] for key, values in parse_qs(parsed_path.query).items()}
+        getattr(self, "get_{}".format(endpoint))(fake_gog, query, *match.groups(), dropped=fault == "drop")
+
+    def get_token(self, fake_gog, query, dropped):
+        self.send_json({"access_token": fake_gog.get_token(), "expires_in": TOKEN_LIFETIME,
+                        "refresh_token": "refresh", "user_id": "1"}, dropped=dropped)
+
+    def get_connect(self, fake_gog, query, dropped):
+        self.send_body(200, b"", dropped=dropped)
+
+    def get_owned(self, fake_gog, query, dropped):
+        self.send_json({"owned": fake_gog.get_game_ids()}, dropped=dropped)
+
+    def get_user(self, fake_gog, query, dropped):
+        self.send_json({"username": "tester"}, dropped=dropped)
+
+    def get_library_page(self, fake_gog, query, dropped):
+        game_ids = fake_gog.get_game_ids()
+        page = int(query.get("page", 1))
+        products = game_ids[(page - 1) * GAMES_PER_PAGE:page * GAMES_PER_PAGE]
+        self.send_json({"page": page, "totalPages": max(1, -(-len(game_ids) // GAMES_PER_PAGE)),
+                        "products": [fake_gog.get_product(game_id) for game_id in products]}, dropped=dropped)
+
+    def get_product(self, fake_gog, query, game_id, dropped):
+        game_id = int(game_id)
+        product = {"id": game_id, "title": "Game {}".format(game_id),
+                   "links": {"support": "https://www.gog.com/support/game_{}".format(game_id)}}
+        sections = query.get("expand", "").split(",")
+        if "downloads" in sections:
+            product["downloads"] = {"installers": fake_gog.get_installers(game_id)}
+        if "expanded_dlcs" in sections:
+            product["expanded_dlcs"] = []
+        self.send_json(product, dropped=dropped)
+
+    def get_downlink(self, fake_gog, query, game_id, dropped):
+        installer_url = "{}/cdn/{}/installer.sh".format(fake_gog.url, game_id)
+        self.send_json({"downlink": installer_url, "checksum": installer_url + ".xml"}, dropped=dropped)
+
+    def get_gamesdb(self, fake_gog, query, game_id, dropped):
+        images = {image: {"url_format": "https://images.gog.com/{}_{}{{formatter}}.{{ext}}".format(game_id, image)}
+                  for image in ["cover", "vertical_cover", "background"]}
+        self.send_json({"game": dict(images, summary={"*": "Game {}".format(game_id)},
+                                     genres=[{"name": {"*": "Adventure"}}])}, dropped=dropped)
+
+    def get_checksum(self, fake_gog, query, game_id, dropped):
+        self.send_body(200, fake_gog.get_checksum_xml(game_id).encode(), "application/xml", dropped)
+
+    def get_installer(self, fake_gog, query, game_id, dropped):
+        size = len(fake_gog.installer)
+        first_byte = 0
+        last_byte = size - 1
+        etag = '"{}"'.format(fake_gog.installer_md5)
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and self.headers.get("If-Range", etag) == etag:
+            first_byte = int(match.group(1))
+            if match.group(2):
+                last_byte = min(int(match.group(2)), last_byte)
+            if first_byte >= size:
+                return self.send_body(416, b"")
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(first_byte, last_byte, size))
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(last_byte + 1 - first_byte))
+        self.end_headers()
+        if dropped:
+            last_byte = first_byte + (last_byte - first_byte) // 2
+        self.send_installer(fake_gog, first_byte, last_byte, dropped)
+
+    def send_installer(self, fake_gog, first_byte, last_byte, dropped):
+        installer = memoryview(fake_gog.installer)
+        start = time.monotonic()
+        position = first_byte
+        try:
+            while position <= last_byte:
+                block = installer[position:min(position + SEND_BLOCK_SIZE, last_byte + 1)]
+                self.wfile.write(block)
+                position += len(block)
+                if fake_gog.bandwidth:
+                    # Wait until the bytes sent so far fit in the bandwidth
+                    time.sleep(max(0, (position - first_byte) / fake_gog.bandwidth - (time.monotonic() - start)))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        if dropped:
+            self.close_connection = True
+
+    def send_json(self, body, status=200, dropped=False):
+        self.send_body(status, json.dumps(body).encode(), "application/json", dropped)
+
+    def send_body(self, status, body, content_type="text/plain", dropped=False, retry_after=None):
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            # A dropped connection is closed before the whole body was sent
+            self.wfile.write(body[:len(body) // 2] if dropped else body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        if dropped:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
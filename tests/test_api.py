@@ -2,13 +2,19 @@ from unittest import TestCase, mock
 from unittest.mock import MagicMock
 import sys
 import requests
+import tempfile
+import threading
 import time
 m_constants = MagicMock()
+m_constants.MAX_PARALLEL_API_REQUESTS = 4
 m_config = MagicMock()
 sys.modules['minigalaxy.constants'] = m_constants
 sys.modules['minigalaxy.config'] = m_config
-from minigalaxy.api import Api    # noqa: E402
+from minigalaxy.api import Api, ApiError    # noqa: E402
 from minigalaxy.game import Game  # noqa: E402
+from minigalaxy.http_cache import HttpCache  # noqa: E402
+from minigalaxy.rate_limiter import RateLimiter  # noqa: E402
+from minigalaxy.request_trace import RequestTrace  # noqa: E402
 
 API_GET_INFO_TOONSTRUCK = {'downloads': {'installers': [
     {'id': 'installer_windows_en', 'name': 'Toonstruck', 'os': 'windows', 'language': 'en', 'language_full': 'English', 'version': '1.0', 'total_size': 939524096, 'files': [{'id': 'en1installer0', 'size': 1048576, 'downlink': 'https://api.gog.com/products/1207666633/downlink/installer/en1installer0'}, {'id': 'en1installer1', 'size': 938475520, 'downlink': 'https://api.gog.com/products/1207666633/downlink/installer/en1installer1'}]},
@@ -91,20 +97,84 @@ class TestApi(TestCase):
         obs = api.get_download_info(test_game, dlc_installers=dlc_test_installer)
         self.assertEqual(exp, obs)
 
-    def test1_get_library(self):
+    @mock.patch("minigalaxy.api.Catalog")
+    def test3_sync_library(self, mock_catalog):
+        mock_catalog.is_current.return_value = False
+        mock_catalog.get_products.return_value = []
         api = Api()
         api.active_token = True
         response_dict = {'totalPages': 1, 'products': [{'id': 1097893768, 'title': 'Neverwinter Nights: Enhanced Edition', 'image': '//images-2.gog-statics.com/8706f7fb87a4a41bc34254f3b49f59f96cf13d067b2c8bbfd8d41c327392052a', 'url': '/game/neverwinter_nights_enhanced_edition_pack', 'worksOn': {'Windows': True, 'Mac': True, 'Linux': True}}]}
         api.active_token_expiration_time = time.time() + 10.0
         response_mock = MagicMock()
         response_mock.json.return_value = response_dict
+        m_constants.SESSION.get.side_effect = None
         m_constants.SESSION.get.return_value = response_mock
         exp = "Neverwinter Nights: Enhanced Edition"
-        retrieved_games, err_msg = api.get_library()
-        obs = retrieved_games[0].name
+        changes, err_msg = api.sync_library([1097893768])
+        obs = changes["added"][0].name
         self.assertEqual(exp, obs)
 
-    def test2_get_library(self):
+    @mock.patch("minigalaxy.api.Catalog")
+    def test4_sync_library(self, mock_catalog):
+        # The pages after the first are requested at the same time, the games keep the order of the pages
+        mock_catalog.is_current.return_value = False
+        mock_catalog.get_products.return_value = []
+        api = Api()
+        api.active_token = True
+        api._Api__request = MagicMock()
+        api._Api__request.side_effect = lambda url, params: {'totalPages': 3, 'products': [
+            {'id': params['page'], 'title': 'Game {}'.format(params['page']), 'image': '', 'url': '/game',
+             'worksOn': {'Linux': True}}]}
+        pages = []
+        changes, err_msg = api.sync_library([1, 2, 3], pages.append)
+        self.assertEqual(["Game 1", "Game 2", "Game 3"], [game.name for game in changes["added"]])
+        self.assertEqual(3, len(pages))
+        self.assertEqual("Game 1", pages[0][0].name)
+        self.assertEqual(3, api._Api__request.call_count)
+
+    @mock.patch("minigalaxy.api.Catalog")
+    def test_sync_library(self, mock_catalog):
+        api = Api()
+        api.active_token = True
+        api._Api__request = MagicMock()
+        api._Api__request.return_value = {'totalPages': 1, 'products': [
+            {'id': 1, 'title': 'Kept', 'image': '', 'url': '/kept', 'worksOn': {'Linux': True}, 'isNew': True},
+            {'id': 2, 'title': 'Changed', 'image': 'new', 'url': '/changed', 'worksOn': {'Linux': True}},
+            {'id': 3, 'title': 'Added', 'image': '', 'url': '/added', 'worksOn': {'Linux': True}}]}
+        mock_catalog.get_products.return_value = [
+            {'id': 1, 'title': 'Kept', 'image': '', 'url': '/kept', 'worksOn': {'Linux': True}},
+            {'id': 2, 'title': 'Changed', 'image': 'old', 'url': '/changed', 'worksOn': {'Linux': True}},
+            {'id': 4, 'title': 'Removed', 'image': '', 'url': '/removed', 'worksOn': {'Linux': True}}]
+        # Nothing is retrieved when the owned products didn't change
+        mock_catalog.is_current.return_value = True
+        changes, err_msg = api.sync_library([1, 2, 4])
+        self.assertEqual({"added": [], "removed": [], "changed": []}, changes)
+        self.assertEqual(0, api._Api__request.call_count)
+        mock_catalog.is_current.return_value = False
+        changes, err_msg = api.sync_library([1, 2, 3])
+        self.assertEqual(["Added"], [game.name for game in changes["added"]])
+        self.assertEqual(["Removed"], [game.name for game in changes["removed"]])
+        self.assertEqual(["Changed"], [game.name for game in changes["changed"]])
+        self.assertEqual("", err_msg)
+        saved_ids, saved_products = mock_catalog.save.call_args[0]
+        self.assertEqual([1, 2, 3], saved_ids)
+        self.assertNotIn('isNew', saved_products[0])
+
+    @mock.patch("minigalaxy.api.Catalog")
+    def test2_sync_library(self, mock_catalog):
+        # Without a connection the catalog stays as it is and the cached library is still available
+        api = Api()
+        api.active_token = True
+        api._Api__request = MagicMock(side_effect=requests.exceptions.ConnectionError())
+        mock_catalog.get_products.return_value = [
+            {'id': 1, 'title': 'Cached', 'image': '', 'url': '/cached', 'worksOn': {'Linux': True}}]
+        changes, err_msg = api.sync_library()
+        self.assertEqual({"added": [], "removed": [], "changed": []}, changes)
+        self.assertEqual("Couldn't connect to GOG servers", err_msg)
+        mock_catalog.save.assert_not_called()
+        self.assertEqual(["Cached"], [game.name for game in api.get_cached_library()])
+
+    def test5_sync_library(self):
         api = Api()
         api.active_token = False
         api.active_token_expiration_time = time.time() + 10.0
@@ -112,9 +182,33 @@ class TestApi(TestCase):
         response_mock.json.return_value = {}
         m_constants.SESSION.get.return_value = response_mock
         exp = "Couldn't connect to GOG servers"
-        retrieved_games, obs = api.get_library()
+        changes, obs = api.sync_library([1])
         self.assertEqual(exp, obs)
 
+    @mock.patch.object(m_config.Config, "get", MagicMock(return_value=3600))
+    def test_get_info(self):
+        # Only the sections which aren't cached yet are requested
+        api = Api()
+        api._Api__request = MagicMock()
+        api._Api__request.side_effect = lambda url, params=None, cached=False: dict(
+            {"id": 1, "links": {"support": "https://support"}},
+            **{section: section for section in (params or {}).get("expand", "").split(",") if section})
+        info = api.get_info(Game("Test Game", game_id=1), ["downloads"])
+        self.assertEqual({"id": 1, "links": {"support": "https://support"}, "downloads": "downloads"}, info)
+        api._Api__request.assert_called_with("https://api.gog.com/products/1", params={"expand": "downloads"},
+                                             cached=True)
+        info = api.get_info(Game("Test Game", game_id=1), ["expanded_dlcs", "downloads"])
+        self.assertEqual("expanded_dlcs", info["expanded_dlcs"])
+        self.assertEqual("downloads", info["downloads"])
+        api._Api__request.assert_called_with("https://api.gog.com/products/1", params={"expand": "expanded_dlcs"},
+                                             cached=True)
+        self.assertEqual("https://support", api.get_info(Game("Test Game", game_id=1), [])["links"]["support"])
+        self.assertEqual(2, api._Api__request.call_count)
+        # Expired sections are requested again
+        m_config.Config.get.return_value = 0
+        api.get_info(Game("Test Game", game_id=1), [])
+        api._Api__request.assert_called_with("https://api.gog.com/products/1", params=None, cached=True)
+
     def test1_get_version(self):
         api = Api()
         test_game = Game("Test Game", platform="linux")
@@ -132,9 +226,11 @@ class TestApi(TestCase):
         obs = api.get_version(test_game, gameinfo=API_GET_INFO_TOONSTRUCK, dlc_name=dlc_name)
         self.assertEqual(exp, obs)
 
-    def test_get_download_file_md5(self):
+    def test2_get_download_files(self):
+        # The checksum XML has the md5 and size of the file and of all its chunks
         api = Api()
-        api._Api__request = MagicMock()
+        api.active_token_expiration_time = time.time() + 3600
+        api._Api__request = MagicMock(return_value={"downlink": "https://cdn/file.sh", "checksum": "https://cdn/file.xml"})
         m_constants.SESSION.get.side_effect = MagicMock()
         m_constants.SESSION.get().text = '''<file name="gog_tis_100_2.0.0.3.sh" available="1" notavailablemsg="" md5="8acedf66c0d2986e7dee9af912b7df4f" chunks="4" timestamp="2015-07-30 17:11:12" total_size="36717998">
     <chunk id="0" from="0" to="10485759" method="md5">7e62ce101221ccdae2e9bff5c16ed9e0</chunk>
@@ -142,9 +238,155 @@ class TestApi(TestCase):
     <chunk id="2" from="20971520" to="31457279" method="md5">5464b4499cd4368bb83ea35f895d3560</chunk>
     <chunk id="3" from="31457280" to="36717997" method="md5">0261b9225fc10c407df083f6d254c47b</chunk>
 </file>'''
-        exp = "8acedf66c0d2986e7dee9af912b7df4f"
-        obs = api.get_download_file_md5("url")
-        self.assertEqual(exp, obs)
+        obs = api.get_download_files(["url"])[0]
+        self.assertEqual("8acedf66c0d2986e7dee9af912b7df4f", obs["md5"])
+        self.assertEqual(36717998, obs["size"])
+        self.assertEqual(4, len(obs["chunks"]))
+        self.assertEqual([31457280, 36717997, "0261b9225fc10c407df083f6d254c47b"], obs["chunks"][3])
+
+    def test_get_download_files(self):
+        api = Api()
+        api.active_token_expiration_time = time.time() + 3600
+        api._Api__request = MagicMock()
+        api._Api__request.side_effect = lambda downlink: {
+            "downlink": "https://cdn/{}.bin".format(downlink),
+            "checksum": "https://cdn/{}.xml".format(downlink) if downlink != "no_checksum" else ""
+        }
+        m_constants.SESSION.get.side_effect = lambda url: MagicMock(text='<file md5="{}" total_size="{}"></file>'.format(
+            url[len("https://cdn/"):-len(".xml")], len(url)))
+        obs = api.get_download_files(["part0", "part1", "no_checksum"])
+        m_constants.SESSION.get.side_effect = None
+        self.assertEqual(3, len(obs))
+        self.assertEqual({"url": "https://cdn/part0.bin", "md5": "part0", "size": 21, "chunks": []}, obs[0])
+        self.assertEqual("part1", obs[1]["md5"])
+        self.assertEqual({"url": "https://cdn/no_checksum.bin", "md5": "", "size": 0, "chunks": []}, obs[2])
+
+    def test_request(self):
+        # Requests made while the same request is being made share its result
+        api = Api()
+        api.active_token_expiration_time = time.time() + 3600
+        request_started = threading.Event()
+        release_request = threading.Event()
+
+        def send(url, params=None, extra_headers=None, responses=None):
+            request_started.set()
+            release_request.wait(5)
+            return MagicMock(json=MagicMock(return_value={"url": url}))
+        api._Api__send = MagicMock(side_effect=send)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(api._Api__request("https://api/1"))) for _ in range(3)]
+        threads[0].start()
+        request_started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)
+        release_request.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([{"url": "https://api/1"}] * 3, results)
+        self.assertEqual(1, api._Api__send.call_count)
+        # Once it's done, the request is made again
+        api._Api__request("https://api/1")
+        self.assertEqual(2, api._Api__send.call_count)
+
+    def test2_request(self):
+        # A request rejected with 401 is made again with a new token
+        api = Api()
+        api.active_token = "old"
+        api.active_token_expiration_time = time.time() + 3600
+
+        def refresh_token(refresh_token):
+            api.active_token = "new"
+            return "refresh"
+        api._Api__refresh_token = MagicMock(side_effect=refresh_token)
+        sent_responses = [MagicMock(status_code=401), MagicMock(status_code=200, json=MagicMock(return_value={"id": 1}))]
+
+        def send(url, params=None, extra_headers=None, responses=None):
+            responses.append(sent_responses.pop(0))
+            return responses[-1]
+        api._Api__send = MagicMock(side_effect=send)
+        self.assertEqual({"id": 1}, api._Api__request("https://api/1"))
+        self.assertEqual(1, api._Api__refresh_token.call_count)
+        self.assertEqual(2, api._Api__send.call_count)
+        # The request is traced once with the extra attempt counted as a retry
+        entry = RequestTrace.get_entries()[-1]
+        self.assertEqual(("https://api/{id}", 200, None, 1), (entry["url"], entry["status"], entry["cache"], entry["retries"]))
+
+    def test3_request(self):
+        # Requests which GOG keeps throttling or can't answer raise ApiError
+        api = Api()
+        api.active_token_expiration_time = time.time() + 3600
+        rate_limiter = type(RateLimiter)(retries=1, backoff=0)
+        session = MagicMock()
+        session.get.return_value = MagicMock(status_code=429, headers={"Retry-After": "0"})
+        with mock.patch("minigalaxy.api.SESSION", session), mock.patch("minigalaxy.api.RateLimiter", rate_limiter):
+            self.assertRaises(ApiError, api._Api__request, "https://api/1")
+            self.assertEqual(2, session.get.call_count)
+            session.get.return_value = MagicMock(status_code=503)
+            self.assertRaises(ApiError, api._Api__request, "https://api/1")
+            self.assertEqual(3, session.get.call_count)
+        self.assertEqual(2, rate_limiter.get_counters()["api"]["throttled"])
+        # Throttled requests which were sent again are traced as retries
+        self.assertEqual([1, 0], [entry["retries"] for entry in RequestTrace.get_entries()[-2:]])
+
+    def test4_request(self):
+        # Cached responses are used without a connection, even when the token has expired
+        with tempfile.TemporaryDirectory() as cache_dir:
+            http_cache = type(HttpCache)(cache_dir)
+            response = MagicMock(status_code=200, headers={}, json=MagicMock(return_value={"id": 1}))
+            http_cache.request("https://api/fresh", None, lambda headers: response, 3600)
+            http_cache.request("https://api/stale", None, lambda headers: response, 0)
+            config = MagicMock()
+            config.get.return_value = 3600
+            session = MagicMock()
+            session.get.side_effect = requests.exceptions.ConnectionError()
+            api = Api()
+            with mock.patch("minigalaxy.api.HttpCache", http_cache), mock.patch("minigalaxy.api.Config", config), \
+                    mock.patch("minigalaxy.api.SESSION", session):
+                self.assertEqual({"id": 1}, api._Api__request("https://api/fresh", cached=True))
+                self.assertEqual(0, session.get.call_count)
+                self.assertEqual({"id": 1}, api._Api__request("https://api/stale", cached=True))
+                self.assertRaises(requests.exceptions.ConnectionError, api._Api__request, "https://api/uncached")
+
+    def test_refresh_token_if_expired(self):
+        # Threads finding the token expired at the same time refresh it once
+        api = Api()
+        api.active_token_expiration_time = time.time() - 1
+
+        def refresh_token(refresh_token):
+            time.sleep(0.05)
+            api.active_token_expiration_time = time.time() + 3600
+            return "refresh"
+        api._Api__refresh_token = MagicMock(side_effect=refresh_token)
+        threads = [threading.Thread(target=api._Api__refresh_token_if_expired) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(1, api._Api__refresh_token.call_count)
+        # Refreshing ahead of time only happens close to the expiry
+        api._Api__refresh_token_if_expired(margin=300)
+        self.assertEqual(1, api._Api__refresh_token.call_count)
+        api.active_token_expiration_time = time.time() + 200
+        api._Api__refresh_token_if_expired(margin=300)
+        self.assertEqual(2, api._Api__refresh_token.call_count)
+
+    def test_authenticate(self):
+        # Requests finding the token expired while authenticating use the new token instead of refreshing it again
+        api = Api()
+        api.active_token_expiration_time = time.time() - 1
+
+        def refresh_token(refresh_token):
+            time.sleep(0.05)
+            api.active_token_expiration_time = time.time() + 3600
+            return "refresh"
+        api._Api__refresh_token = MagicMock(side_effect=refresh_token)
+        authenticate_thread = threading.Thread(target=api.authenticate, kwargs={"refresh_token": "refresh"})
+        authenticate_thread.start()
+        time.sleep(0.01)
+        api._Api__refresh_token_if_expired()
+        authenticate_thread.join(5)
+        self.assertEqual(1, api._Api__refresh_token.call_count)
 
     def test1_get_gamesdb_info(self):
         api = Api()
@@ -0,0 +1,54 @@
+from datetime import datetime
+from unittest import TestCase, mock
+
+from minigalaxy.bandwidth_limiter import BandwidthLimiter
+from minigalaxy.download import Download
+
+
+class TestBandwidthLimiter(TestCase):
+    def setUp(self):
+        self.config = {"download_speed_limit": 0, "download_speed_schedule": []}
+        patcher = mock.patch("minigalaxy.bandwidth_limiter.Config")
+        m_config = patcher.start()
+        m_config.get.side_effect = lambda key: self.config[key]
+        self.addCleanup(patcher.stop)
+        self.limiter = type(BandwidthLimiter)()
+
+    def test1_reserve(self):
+        download = Download("https://cdn/file.sh", "/tmp/file.sh")
+        self.limiter.add(download)
+        self.assertEqual(0, self.limiter.reserve(download, 10 * 1024**2))
+
+        self.config["download_speed_limit"] = 1024
+        self.assertAlmostEqual(0.5, self.limiter.reserve(download, 512 * 1024), delta=0.1)
+        self.assertAlmostEqual(2, self.limiter.reserve(download, 1536 * 1024), delta=0.1)
+
+        # After a reset what was received before doesn't count anymore
+        self.limiter.reset()
+        self.assertAlmostEqual(0.5, self.limiter.reserve(download, 512 * 1024), delta=0.1)
+
+        # Downloads which aren't running, like thumbnails, are never slowed down
+        self.limiter.remove(download)
+        self.assertEqual(0, self.limiter.reserve(download, 10 * 1024**2))
+
+    def test2_reserve(self):
+        self.config["download_speed_limit"] = 1024
+        normal = Download("https://cdn/normal.sh", "/tmp/normal.sh")
+        important = Download("https://cdn/important.sh", "/tmp/important.sh", priority=1)
+        self.limiter.add(normal)
+        self.limiter.add(important)
+        # The download with the higher priority gets 2/3 of the bandwidth, the other one 1/3
+        normal_delay = self.limiter.reserve(normal, 2048 * 1024)
+        important_delay = self.limiter.reserve(important, 2048 * 1024)
+        self.assertAlmostEqual(6, normal_delay, delta=0.1)
+        self.assertAlmostEqual(3, important_delay, delta=0.1)
+
+    def test_get_limit(self):
+        self.config["download_speed_limit"] = 2048
+        self.config["download_speed_schedule"] = [["08:00", "18:00", 512], ["22:00", "06:00", 0]]
+        self.assertEqual(512, self.limiter.get_limit(datetime(2024, 1, 1, 8, 0)))
+        self.assertEqual(512, self.limiter.get_limit(datetime(2024, 1, 1, 17, 59)))
+        self.assertEqual(2048, self.limiter.get_limit(datetime(2024, 1, 1, 18, 0)))
+        self.assertEqual(0, self.limiter.get_limit(datetime(2024, 1, 1, 23, 30)))
+        self.assertEqual(0, self.limiter.get_limit(datetime(2024, 1, 1, 5, 59)))
+        self.assertEqual(2048, self.limiter.get_limit(datetime(2024, 1, 1, 6, 0)))
@@ -0,0 +1,31 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from minigalaxy.catalog import Catalog
+
+
+class TestCatalog(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.catalog = type(Catalog)(os.path.join(self.temp_dir.name, "minigalaxy", "catalog.json"))
+
+    def test1_is_current(self):
+        self.assertFalse(self.catalog.is_current([1, 2]))
+        self.assertEqual([], self.catalog.get_products())
+        with mock.patch("minigalaxy.catalog.time.time", return_value=1000):
+            self.catalog.save([2, 1], [{"id": 1}, {"id": 2}])
+        self.assertEqual([{"id": 1}, {"id": 2}], self.catalog.get_products())
+        with mock.patch("minigalaxy.catalog.time.time", return_value=2000):
+            self.assertTrue(self.catalog.is_current([1, 2]))
+            self.assertFalse(self.catalog.is_current([1, 2, 3]))
+        # Old catalogs are retrieved again
+        with mock.patch("minigalaxy.catalog.time.time", return_value=1000 + 2 * 24 * 60 * 60):
+            self.assertFalse(self.catalog.is_current([1, 2]))
+
+    def test2_remove(self):
+        self.catalog.save([1], [{"id": 1}])
+        self.catalog.remove()
+        self.assertEqual([], self.catalog.get_products())
+        self.assertFalse(self.catalog.is_current([1]))
@@ -0,0 +1,106 @@
+import os
+import hashlib
+import tempfile
+from unittest import TestCase
+
+from minigalaxy.checksums import ChunkVerifier, DownloadChecksums, FileHash
+
+TEST_CONTENT = os.urandom(3 * 1024**2 + 5)
+TEST_CHUNK_SIZE = 1024**2
+TEST_CHUNKS = [[first_byte, min(first_byte + TEST_CHUNK_SIZE, len(TEST_CONTENT)) - 1,
+                hashlib.md5(TEST_CONTENT[first_byte:first_byte + TEST_CHUNK_SIZE]).hexdigest()]
+               for first_byte in range(0, len(TEST_CONTENT), TEST_CHUNK_SIZE)]
+
+
+class TestFileHash(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.temp_dir.name, "installer.sh")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test1_update(self):
+        # The second half is written first, so it has to be read back when the first half is done
+        segments = [[0, 999, 0], [1000, len(TEST_CONTENT) - 1, 1000]]
+        file_hash = FileHash(self.location)
+        with open(self.location, 'wb') as file:
+            file.truncate(len(TEST_CONTENT))
+            file.seek(1000)
+            file.write(TEST_CONTENT[1000:])
+        segments[1][2] = len(TEST_CONTENT)
+        file_hash.update(1000, TEST_CONTENT[1000:])
+        file_hash.catch_up(segments)
+        self.assertEqual(0, file_hash.position)
+        with open(self.location, 'r+b') as file:
+            file.write(TEST_CONTENT[:1000])
+        segments[0][2] = 1000
+        file_hash.update(0, TEST_CONTENT[:1000])
+        file_hash.catch_up(segments)
+        self.assertEqual(len(TEST_CONTENT), file_hash.position)
+        self.assertEqual(hashlib.md5(TEST_CONTENT).hexdigest(), file_hash.hexdigest())
+
+    def test2_update(self):
+        # A resumed download starts with hashing what was already written
+        with open(self.location, 'wb') as file:
+            file.write(TEST_CONTENT[:2 * 1024**2])
+        file_hash = FileHash(self.location, 2 * 1024**2)
+        file_hash.update(2 * 1024**2, TEST_CONTENT[2 * 1024**2:])
+        self.assertEqual(hashlib.md5(TEST_CONTENT).hexdigest(), file_hash.hexdigest())
+
+
+class TestChunkVerifier(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.temp_dir.name, "installer.sh")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test1_update(self):
+        content = bytearray(TEST_CONTENT)
+        content[1500000] ^= 0xff
+        chunk_verifier = ChunkVerifier(TEST_CHUNKS)
+        for position in range(0, len(content), 300000):
+            chunk_verifier.update(position, content[position:position + 300000])
+        self.assertEqual({0, 2, 3}, chunk_verifier.verified)
+        self.assertEqual({1}, chunk_verifier.damaged)
+        self.assertEqual([(TEST_CHUNKS[1][0], TEST_CHUNKS[1][1])], chunk_verifier.get_damaged_ranges())
+
+    def test2_update(self):
+        # The second chunk is written by two segments, the second one being faster than the first one.
+        # It can only be checked by reading it back.
+        with open(self.location, 'wb') as file:
+            file.write(TEST_CONTENT)
+        chunk_verifier = ChunkVerifier(TEST_CHUNKS)
+        chunk_verifier.update(1500000, TEST_CONTENT[1500000:])
+        chunk_verifier.update(0, TEST_CONTENT[:1500000])
+        self.assertEqual({0, 2, 3}, chunk_verifier.verified)
+        chunk_verifier.check_file(self.location)
+        self.assertEqual({0, 1, 2, 3}, chunk_verifier.verified)
+        self.assertEqual([], chunk_verifier.get_damaged_ranges())
+
+
+class TestDownloadChecksums(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.temp_dir.name, "installer.sh")
+        self.checksums = type(DownloadChecksums)(os.path.join(self.temp_dir.name, "download", "checksums.json"))
+        with open(self.location, 'wb') as file:
+            file.write(TEST_CONTENT)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test1_get(self):
+        self.checksums.save(self.location, "abcd")
+        self.assertEqual("abcd", self.checksums.get(self.location))
+        self.checksums.remove([self.location])
+        self.assertIsNone(self.checksums.get(self.location))
+
+    def test2_get(self):
+        # The saved checksum can't be trusted anymore when the file changed after the download
+        self.checksums.save(self.location, "abcd")
+        with open(self.location, 'ab') as file:
+            file.write(b"changed")
+        self.assertIsNone(self.checksums.get(self.location))
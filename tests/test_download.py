@@ -51,3 +51,14 @@ class TestDownload(TestCase):
         exp = 2
         obs = len(mock_cancel_function.mock_calls)
         self.assertEqual(exp, obs)
+
+    def test_take_callbacks(self):
+        old_finish_function = MagicMock()
+        new_finish_function = MagicMock()
+        download = Download("test_url", "test_save_location", finish_func=old_finish_function, size=10)
+        new_download = Download("test_url", "test_save_location", finish_func=new_finish_function, size=10)
+        download.take_callbacks(new_download)
+        download.finish()
+        old_finish_function.assert_not_called()
+        new_finish_function.assert_called_once_with()
+        self.assertIs(new_download.progress, download.progress)
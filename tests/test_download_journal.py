@@ -0,0 +1,70 @@
+import os
+import json
+import tempfile
+from unittest import TestCase
+
+from minigalaxy.download import Download
+from minigalaxy.download_journal import DownloadJournal
+
+
+class TestDownloadJournal(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.journal_file = os.path.join(self.temp_dir.name, "download", "journal.json")
+        self.journal = type(DownloadJournal)(self.journal_file)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_add(self):
+        download = Download("https://cdn/file.sh", "/tmp/Game/file.sh", size=1234, md5="abcd", game_id=5,
+                            resume_info={"type": "game", "downlink": "https://api/downlink"})
+        self.journal.add(download)
+        self.journal.update(download, segments=[[0, 1233, 10]], file_size=1234)
+        # A new instance reads what the old one wrote, like Minigalaxy does after a restart
+        restarted_journal = type(DownloadJournal)(self.journal_file)
+        entries = restarted_journal.get_entries(5)
+        self.assertEqual(1, len(entries))
+        self.assertEqual("/tmp/Game/file.sh", entries[0]["save_location"])
+        self.assertEqual("https://cdn/file.sh", entries[0]["url"])
+        self.assertEqual("abcd", entries[0]["md5"])
+        self.assertEqual([[0, 1233, 10]], entries[0]["segments"])
+        self.assertEqual("https://api/downlink", entries[0]["resume_info"]["downlink"])
+        self.assertEqual([], restarted_journal.get_entries(6))
+        self.assertFalse(os.path.exists("{}.tmp".format(self.journal_file)))
+
+    def test2_add(self):
+        # The chunks are kept out of the journal, which is written once for all files of a game
+        chunks = [[0, 9, "aaaa"], [10, 19, "bbbb"]]
+        downloads = [Download("https://cdn/file{}.sh".format(i), "/tmp/Game/file{}.sh".format(i), game_id=5,
+                              number=i + 1, out_of_amount=2, chunks=chunks) for i in range(2)]
+        self.journal.add(downloads)
+        with open(self.journal_file) as file:
+            entries = json.loads(file.read())
+        self.assertEqual(2, len(entries))
+        self.assertNotIn("chunks", entries["/tmp/Game/file0.sh"])
+        restarted_journal = type(DownloadJournal)(self.journal_file)
+        self.assertEqual([chunks, chunks], [entry["chunks"] for entry in restarted_journal.get_entries(5)])
+        restarted_journal.remove(downloads)
+        self.assertEqual([], os.listdir(os.path.join(os.path.dirname(self.journal_file), "chunks")))
+
+    def test_update(self):
+        download = Download("https://cdn/file.sh", "/tmp/Game/file.sh", game_id=5)
+        self.journal.add(download)
+        self.journal.update(download, segments=[[0, 10, 0]])
+        self.journal.update(download, save_now=False, segments=[[0, 10, 5]])
+        with open(self.journal_file) as file:
+            obs = json.loads(file.read())["/tmp/Game/file.sh"]["segments"]
+        self.assertEqual([[0, 10, 0]], obs)
+        self.assertEqual([[0, 10, 5]], self.journal.get(download, "segments"))
+
+    def test_remove(self):
+        downloads = [Download("https://cdn/file{}.sh".format(i), "/tmp/Game/file{}.sh".format(i), game_id=5)
+                     for i in range(2)]
+        for download in downloads:
+            self.journal.add(download)
+        thumbnail = Download("https://cdn/thumbnail.jpg", "/tmp/thumbnail.jpg")
+        self.journal.update(thumbnail, segments=[[0, 10, 5]])
+        self.assertIsNone(self.journal.get(thumbnail, "segments"))
+        self.journal.remove(downloads)
+        self.assertEqual([], type(DownloadJournal)(self.journal_file).get_entries(5))
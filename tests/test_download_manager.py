@@ -0,0 +1,425 @@
+import os
+import re
+import hashlib
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+
+from requests.exceptions import ChunkedEncodingError
+
+from minigalaxy.bandwidth_limiter import BandwidthLimiter
+from minigalaxy.checksums import DownloadChecksums
+from minigalaxy.download import Download
+from minigalaxy.download_journal import DownloadJournal
+from minigalaxy.download_manager import DownloadManager
+
+TEST_CONTENT = os.urandom(1024 * 1024 + 123)
+TEST_MD5 = hashlib.md5(TEST_CONTENT).hexdigest()
+TEST_CHUNK_SIZE = 100000
+TEST_CHUNKS = [[first_byte, min(first_byte + TEST_CHUNK_SIZE, len(TEST_CONTENT)) - 1,
+                hashlib.md5(TEST_CONTENT[first_byte:first_byte + TEST_CHUNK_SIZE]).hexdigest()]
+               for first_byte in range(0, len(TEST_CONTENT), TEST_CHUNK_SIZE)]
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    support_ranges = True
+    requested_ranges = []
+    etag = '"1"'
+    # Bytes which are sent damaged once
+    damaged_bytes = set()
+
+    def do_GET(self):
+        first_byte = 0
+        last_byte = len(TEST_CONTENT) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range', self.etag)
+        if match and self.support_ranges and if_range == self.etag:
+            first_byte = int(match.group(1))
+            if match.group(2):
+                last_byte = min(int(match.group(2)), last_byte)
+            self.requested_ranges.append((first_byte, last_byte))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(first_byte, last_byte, len(TEST_CONTENT)))
+        else:
+            self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(last_byte + 1 - first_byte))
+        self.end_headers()
+        content = bytearray(TEST_CONTENT[first_byte:last_byte + 1])
+        for damaged_byte in [b for b in self.damaged_bytes if first_byte <= b <= last_byte]:
+            self.damaged_bytes.discard(damaged_byte)
+            content[damaged_byte - first_byte] ^= 0xff
+        try:
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestDownloadManager(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        cls.server.daemon_threads = True
+        cls.url = "http://127.0.0.1:{}/installer.sh".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        RangeRequestHandler.support_ranges = True
+        RangeRequestHandler.requested_ranges = []
+        RangeRequestHandler.etag = '"1"'
+        RangeRequestHandler.damaged_bytes = set()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.save_location = os.path.join(self.temp_dir.name, "installer.sh")
+        self.journal = type(DownloadJournal)(os.path.join(self.temp_dir.name, "journal.json"))
+        journal_patch = mock.patch('minigalaxy.download_manager.DownloadJournal', self.journal)
+        journal_patch.start()
+        self.addCleanup(journal_patch.stop)
+        self.checksums = type(DownloadChecksums)(os.path.join(self.temp_dir.name, "checksums.json"))
+        checksums_patch = mock.patch('minigalaxy.download_manager.DownloadChecksums', self.checksums)
+        checksums_patch.start()
+        self.addCleanup(checksums_patch.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @mock.patch('minigalaxy.download_manager.MINIMUM_SEGMENT_SIZE', 64 * 1024)
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test1_download_operation(self, mock_config):
+        mock_config.get.return_value = 4
+        progress = []
+        download = Download(self.url, self.save_location, progress_func=progress.append)
+        obs = DownloadManager.download_operation(download, 0, 'wb')
+        self.assertTrue(obs)
+        self.assertEqual(4, len(RangeRequestHandler.requested_ranges))
+        self.assertFalse(os.path.exists(DownloadManager.get_part_location(download)))
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+        self.assertEqual(100, progress[-1])
+        self.assertEqual(TEST_MD5, self.checksums.get(self.save_location))
+
+    @mock.patch('minigalaxy.download_manager.MINIMUM_SEGMENT_SIZE', 64 * 1024)
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test2_download_operation(self, mock_config):
+        mock_config.get.return_value = 4
+        RangeRequestHandler.support_ranges = False
+        download = Download(self.url, self.save_location)
+        obs = DownloadManager.download_operation(download, 0, 'wb')
+        self.assertTrue(obs)
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test3_download_operation(self, mock_config):
+        mock_config.get.return_value = 4
+        RangeRequestHandler.support_ranges = False
+        with open(self.save_location, 'wb') as save_file:
+            save_file.write(TEST_CONTENT[:1000])
+        download = Download(self.url, self.save_location)
+        obs = DownloadManager.download_operation(download, 1000, 'ab')
+        self.assertTrue(obs)
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+        self.assertEqual(TEST_MD5, self.checksums.get(self.save_location))
+
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test4_download_operation(self, mock_config):
+        mock_config.get.return_value = 4
+        download = Download(self.url, self.save_location)
+        self.journal.add(download)
+        # The first and third segments were partially written before Minigalaxy was closed
+        segments = [[0, 299999, 1000], [300000, 599999, 600000], [600000, len(TEST_CONTENT) - 1, 700000]]
+        with open(DownloadManager.get_part_location(download), 'wb') as part_file:
+            part_file.truncate(len(TEST_CONTENT))
+            part_file.write(TEST_CONTENT[:1000])
+            part_file.seek(300000)
+            part_file.write(TEST_CONTENT[300000:700000])
+        self.journal.update(download, segments=segments, file_size=len(TEST_CONTENT))
+        obs = DownloadManager.download_operation(download, 0, 'wb')
+        self.assertTrue(obs)
+        exp = [(1000, 299999), (700000, len(TEST_CONTENT) - 1)]
+        self.assertEqual(exp, sorted(RangeRequestHandler.requested_ranges))
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+        self.assertEqual(TEST_MD5, self.checksums.get(self.save_location))
+
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test5_download_operation(self, mock_config):
+        mock_config.get.return_value = 1
+        RangeRequestHandler.damaged_bytes = {150000}
+        download = Download(self.url, self.save_location, chunks=TEST_CHUNKS)
+        obs = DownloadManager.download_operation(download, 0, 'wb')
+        self.assertTrue(obs)
+        # Only the damaged chunk is downloaded again
+        self.assertEqual([(0, len(TEST_CONTENT) - 1), (100000, 199999)], RangeRequestHandler.requested_ranges)
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+        self.assertIsNone(self.checksums.get(self.save_location))
+
+    @mock.patch('minigalaxy.download_manager.MINIMUM_SEGMENT_SIZE', 64 * 1024)
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test6_download_operation(self, mock_config):
+        mock_config.get.return_value = 4
+        # Neighbouring damaged chunks are downloaded again with a single request
+        RangeRequestHandler.damaged_bytes = {150000, 250000}
+        download = Download(self.url, self.save_location, chunks=TEST_CHUNKS)
+        obs = DownloadManager.download_operation(download, 0, 'wb')
+        self.assertTrue(obs)
+        self.assertEqual((100000, 299999), RangeRequestHandler.requested_ranges[-1])
+        self.assertEqual(5, len(RangeRequestHandler.requested_ranges))
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test1_download(self, mock_config):
+        # Downloads which can't reach the server are paused and keep their files to continue later
+        mock_config.get.return_value = 1
+        cancel_func = mock.MagicMock()
+        download = Download("http://127.0.0.1:1/installer.sh", self.save_location, cancel_func=cancel_func, game_id=1)
+        part_location = DownloadManager.get_part_location(download)
+        with open(part_location, 'wb') as part_file:
+            part_file.write(TEST_CONTENT[:1000])
+        self.journal.add(download)
+        self.journal.update(download, segments=[[0, len(TEST_CONTENT) - 1, 1000]], file_size=len(TEST_CONTENT))
+        download_manager = type(DownloadManager)()
+        download_manager.download(download)
+        deadline = time.time() + 5
+        while not download_manager.is_download_paused(download) and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(download_manager.is_download_paused(download))
+        self.assertTrue(os.path.isfile(part_location))
+        self.assertEqual(1, len(self.journal.get_entries(1)))
+        cancel_func.assert_not_called()
+
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test2_download(self, mock_config):
+        # Connections dropped in the middle of the file are tried again like connections which couldn't be made
+        mock_config.get.return_value = 1
+        cancel_func = mock.MagicMock()
+        download = Download(self.url, self.save_location, cancel_func=cancel_func)
+        download_manager = type(DownloadManager)()
+        download_manager.download_operation = mock.MagicMock(side_effect=ChunkedEncodingError())
+        download_manager.download(download)
+        deadline = time.time() + 5
+        while not download_manager.is_download_paused(download) and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(download_manager.is_download_paused(download))
+        self.assertEqual(5, download_manager.download_operation.call_count)
+        cancel_func.assert_not_called()
+
+    @mock.patch('minigalaxy.download_manager.MINIMUM_RESUME_SIZE', 1024)
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test1_get_start_point_and_download_mode(self, mock_config):
+        mock_config.get.return_value = 1
+        download = Download(self.url, self.save_location, chunks=TEST_CHUNKS)
+        self.journal.add(download)
+        self.journal.update(download, file_size=len(TEST_CONTENT), validator='"1"')
+        # The end of the file was damaged when Minigalaxy was stopped
+        with open(self.save_location, 'wb') as save_file:
+            save_file.write(TEST_CONTENT[:250000] + bytes(50000))
+        start_point, download_mode = DownloadManager.get_start_point_and_download_mode(download)
+        self.assertEqual((200000, 'ab'), (start_point, download_mode))
+        obs = DownloadManager.download_operation(download, start_point, download_mode)
+        self.assertTrue(obs)
+        self.assertEqual([(200000, len(TEST_CONTENT) - 1)], RangeRequestHandler.requested_ranges)
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+        self.assertEqual(TEST_MD5, self.checksums.get(self.save_location))
+
+    @mock.patch('minigalaxy.download_manager.MINIMUM_RESUME_SIZE', 1024)
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test2_get_start_point_and_download_mode(self, mock_config):
+        mock_config.get.return_value = 1
+        download = Download(self.url, self.save_location, chunks=TEST_CHUNKS)
+        self.journal.add(download)
+        self.journal.update(download, file_size=len(TEST_CONTENT), validator='"1"')
+        with open(self.save_location, 'wb') as save_file:
+            save_file.write(bytes(250000))
+        # The file changed on the server since the download started
+        RangeRequestHandler.etag = '"2"'
+        start_point, download_mode = DownloadManager.get_start_point_and_download_mode(download)
+        self.assertEqual((0, 'wb'), (start_point, download_mode))
+        with open(self.save_location, 'wb') as save_file:
+            save_file.write(TEST_CONTENT[:250000])
+        obs = DownloadManager.download_operation(download, 200000, 'ab')
+        self.assertTrue(obs)
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+        self.assertEqual('"2"', self.journal.get(download, "validator"))
+
+    def test3_get_start_point_and_download_mode(self):
+        # Without a journal entry there's no way to tell if the file is still the same
+        download = Download(self.url, self.save_location)
+        with open(self.save_location, 'wb') as save_file:
+            save_file.write(TEST_CONTENT[:250000])
+        obs = DownloadManager.get_start_point_and_download_mode(download)
+        self.assertEqual((0, 'wb'), obs)
+        self.assertFalse(os.path.exists(self.save_location))
+
+    def test_preallocate(self):
+        with open(self.save_location, 'wb') as save_file:
+            DownloadManager.preallocate(save_file.fileno(), len(TEST_CONTENT))
+            DownloadManager.write_at(save_file.fileno(), memoryview(TEST_CONTENT)[1000:], 1000)
+            DownloadManager.write_at(save_file.fileno(), memoryview(TEST_CONTENT)[:1000], 0)
+        with open(self.save_location, 'rb') as save_file:
+            self.assertEqual(TEST_CONTENT, save_file.read())
+
+    @mock.patch('minigalaxy.download_manager.Config')
+    def test_get_segments(self, mock_config):
+        mock_config.get.return_value = 4
+        exp = [(0, 1023)]
+        obs = DownloadManager.get_segments(0, 1024)
+        self.assertEqual(exp, obs)
+        file_size = 40 * 1024**2 + 1
+        segments = DownloadManager.get_segments(0, file_size)
+        self.assertEqual(2, len(segments))
+        self.assertEqual(0, segments[0][0])
+        self.assertEqual(segments[0][1] + 1, segments[1][0])
+        self.assertEqual(file_size - 1, segments[-1][1])
+
+
+class TestDownloadManagerScheduling(TestCase):
+    def setUp(self):
+        self.config = {"max_parallel_downloads": 2, "max_downloads_per_host": 2, "small_downloads_first": True}
+        config_patch = mock.patch('minigalaxy.download_manager.Config')
+        mock_config = config_patch.start()
+        mock_config.get.side_effect = self.config.get
+        self.addCleanup(config_patch.stop)
+        self.started = []
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        # Count how often the scheduler wakes up to look for a download to start
+        self.wakeups = []
+        get_next_download = type(DownloadManager)._DownloadManger__get_next_download
+
+        def counting_get_next_download(download_manager):
+            self.wakeups.append(time.time())
+            return get_next_download(download_manager)
+        wakeup_patch = mock.patch.object(type(DownloadManager), '_DownloadManger__get_next_download',
+                                         counting_get_next_download)
+        wakeup_patch.start()
+        self.addCleanup(wakeup_patch.stop)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        journal = type(DownloadJournal)(os.path.join(self.temp_dir.name, "journal.json"))
+        journal_patch = mock.patch('minigalaxy.download_manager.DownloadJournal', journal)
+        journal_patch.start()
+        self.addCleanup(journal_patch.stop)
+        self.download_manager = type(DownloadManager)()
+        self.download_manager._DownloadManger__download_file = self.fake_download_file
+
+    def fake_download_file(self, download):
+        self.started.append(download)
+        self.release.wait(5)
+
+    def wait_for_started(self, amount):
+        deadline = time.time() + 5
+        while len(self.started) < amount and time.time() < deadline:
+            time.sleep(0.01)
+        # Give the scheduler the chance to start more downloads than it should
+        time.sleep(0.3)
+
+    def test1_download(self):
+        downloads = [Download("http://host{}/file".format(i), "file{}".format(i)) for i in range(4)]
+        self.download_manager.download(downloads)
+        self.wait_for_started(2)
+        self.assertEqual(downloads[:2], self.started)
+
+    def test2_download(self):
+        self.config["max_downloads_per_host"] = 1
+        downloads = [Download("http://host/file{}".format(i), "file{}".format(i)) for i in range(3)]
+        other_host = Download("http://other_host/file", "file")
+        self.download_manager.download(downloads)
+        self.download_manager.download(other_host)
+        self.wait_for_started(2)
+        self.assertEqual([downloads[0], other_host], self.started)
+
+    def test3_download(self):
+        self.config["max_parallel_downloads"] = 1
+        blocking = Download("http://host/blocking", "blocking")
+        self.download_manager.download(blocking)
+        self.wait_for_started(1)
+        big_game = Download("http://host/big", "big", size=40 * 1024**3)
+        small_game = [Download("http://host/small", "small", size=100 * 1024**2, number=n, out_of_amount=2)
+                      for n in [1, 2]]
+        urgent_game = Download("http://host/urgent", "urgent", size=80 * 1024**3, priority=1)
+        self.download_manager.download(big_game)
+        self.download_manager.download(small_game)
+        self.download_manager.download(urgent_game)
+        self.download_manager.cancel_download(small_game[1])
+        self.release.set()
+        self.wait_for_started(4)
+        self.assertEqual([blocking, urgent_game, small_game[0], big_game], self.started)
+
+    def test4_download(self):
+        self.config["max_parallel_downloads"] = 1
+        blocking = Download("http://host/blocking", "blocking")
+        self.download_manager.download(blocking)
+        self.wait_for_started(1)
+        downloads = [Download("http://host/file{}".format(i), "file{}".format(i)) for i in range(3)]
+        for download in downloads:
+            self.download_manager.download(download)
+        self.download_manager.download_next([downloads[2]])
+        self.download_manager.pause_download([downloads[0]])
+        self.assertTrue(self.download_manager.is_download_paused(downloads[0]))
+        self.release.set()
+        self.wait_for_started(3)
+        self.assertEqual([blocking, downloads[2], downloads[1]], self.started)
+        # Games which are wanted next get more of the bandwidth
+        self.assertEqual(4, BandwidthLimiter.get_weight(downloads[2]) / BandwidthLimiter.get_weight(downloads[1]))
+        self.download_manager.resume_download([downloads[0]])
+        self.wait_for_started(4)
+        self.assertEqual(downloads[0], self.started[-1])
+
+    def test5_download(self):
+        # Files which are already queued or active aren't queued again
+        self.config["max_parallel_downloads"] = 1
+        downloads = [Download("http://host/file{}".format(i), "file{}".format(i)) for i in range(2)]
+        self.assertEqual(downloads, self.download_manager.download(downloads))
+        self.wait_for_started(1)
+        progress = []
+        cancel_func = mock.MagicMock()
+        again = [Download("http://host/file{}".format(i), "file{}".format(i), progress_func=progress.append,
+                          cancel_func=cancel_func) for i in range(2)]
+        self.assertEqual(downloads, self.download_manager.download(again))
+        self.release.set()
+        self.wait_for_started(2)
+        self.assertEqual(downloads, self.started)
+        # The downloads from before report to the owner of the new ones
+        downloads[0].progress.update(downloads[0], 10, 10)
+        self.assertEqual([100], progress)
+        downloads[1].cancel()
+        cancel_func.assert_called_once_with()
+
+    def test1_idle_wakeups(self):
+        time.sleep(0.1)
+        wakeups_before_idling = len(self.wakeups)
+        time.sleep(0.5)
+        self.assertEqual(wakeups_before_idling, len(self.wakeups))
+
+        # Queueing a download wakes the scheduler up right away
+        download = Download("http://host/file", "file")
+        queued_at = time.time()
+        self.download_manager.download(download)
+        self.wait_for_started(1)
+        self.assertEqual([download], self.started)
+        self.assertLess(self.wakeups[wakeups_before_idling] - queued_at, 0.05)
+
+    def test2_idle_wakeups(self):
+        self.download_manager.pause()
+        download = Download("http://host/file", "file")
+        self.download_manager.download(download)
+        time.sleep(0.3)
+        self.assertEqual([], self.started)
+        self.download_manager.resume()
+        self.wait_for_started(1)
+        self.assertEqual([download], self.started)
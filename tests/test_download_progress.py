@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+from minigalaxy.download import Download
+from minigalaxy.download_progress import DownloadProgress
+
+
+class TestDownloadProgress(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.updates = []
+        self.progress = DownloadProgress(lambda *update: self.updates.append(update), clock=lambda: self.now)
+
+    def test1_update(self):
+        # Updates are only reported 5 times a second, however often the progress changes
+        download = Download("url", "file", size=100 * 1024**2, progress=self.progress)
+        for second in range(2):
+            for step in range(100):
+                self.now = second + step / 100
+                self.progress.update(download, (second * 100 + step) * 1024**2 // 4, 100 * 1024**2)
+        self.assertEqual(9, len(self.updates))
+        percentage, bytes_per_second, seconds_left = self.updates[-1]
+        self.assertEqual(46, percentage)
+        self.assertAlmostEqual(25 * 1024**2, bytes_per_second, delta=1024)
+        self.assertAlmostEqual(2.15, seconds_left, delta=0.01)
+
+    def test2_update(self):
+        # The parts of a game count by their size
+        big_part = Download("url", "file", size=300, number=1, out_of_amount=2, progress=self.progress)
+        small_part = Download("url", "file-1.bin", size=100, number=2, out_of_amount=2, progress=self.progress)
+        self.progress.update(small_part, 100, 100)
+        self.assertEqual(25, self.updates[-1][0])
+        self.progress.update(big_part, 300, 300)
+        self.assertEqual(100, self.updates[-1][0])
+
+    def test3_update(self):
+        # What was downloaded before a resume doesn't count for the speed
+        download = Download("url", "file", size=1000, progress=self.progress)
+        self.progress.update(download, 500, 1000)
+        self.now = 1
+        self.progress.update(download, 600, 1000)
+        self.assertEqual((60, 100, 4), self.updates[-1])
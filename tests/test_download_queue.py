@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+from minigalaxy.download_queue import DownloadQueue
+
+
+class TestDownloadQueue(TestCase):
+    def setUp(self):
+        self.queue = DownloadQueue()
+
+    def pop_all(self, is_host_available=lambda host: True):
+        downloads = []
+        download = self.queue.pop(is_host_available)
+        while download is not None:
+            downloads.append(download)
+            download = self.queue.pop(is_host_available)
+        return downloads
+
+    def test1_pop(self):
+        self.queue.put("big", "host", (0, 100))
+        self.queue.put("urgent", "host", (-1, 1000))
+        self.queue.put("small", "other_host", (0, 10))
+        self.queue.put("small too", "host", (0, 10))
+        self.assertEqual(4, len(self.queue))
+        self.assertEqual(["urgent", "small", "small too", "big"], self.pop_all())
+        self.assertEqual(0, len(self.queue))
+
+    def test2_pop(self):
+        # Busy hosts are skipped
+        self.queue.put("first", "busy_host", (0,))
+        self.queue.put("second", "host", (0,))
+        self.assertEqual("second", self.queue.pop(lambda host: host != "busy_host"))
+        self.assertIsNone(self.queue.pop(lambda host: host != "busy_host"))
+        self.assertEqual("first", self.queue.pop(lambda host: True))
+
+    def test_remove(self):
+        for number in range(100):
+            self.queue.put(number, "host", (0,))
+        for number in range(0, 100, 2):
+            self.assertTrue(self.queue.remove(number))
+        self.assertFalse(self.queue.remove(0))
+        self.assertNotIn(0, self.queue)
+        self.assertEqual(list(range(1, 100, 2)), self.pop_all())
+
+    def test_move_to_front(self):
+        for number in range(5):
+            self.queue.put(number, "host", (0,))
+        self.queue.move_to_front([3, 4])
+        self.queue.move_to_front([2])
+        self.queue.move_to_back([0])
+        self.assertEqual([2, 3, 4, 1, 0], self.pop_all())
+
+    def test_set_order(self):
+        for number in range(3):
+            self.queue.put(number, "host", (0,))
+        self.queue.set_order(2, (-1,))
+        self.assertEqual([2, 0, 1], self.pop_all())
+
+    def test_pause(self):
+        for number in range(3):
+            self.queue.put(number, "host", (0,))
+        self.queue.pause(0)
+        self.queue.move_to_front([0])
+        self.assertTrue(self.queue.is_paused(0))
+        self.assertIn(0, self.queue)
+        self.assertEqual([1, 2], self.pop_all())
+        self.queue.resume(0)
+        self.assertEqual([0], self.pop_all())
@@ -0,0 +1,108 @@
+import os
+import sys
+import tempfile
+from unittest import TestCase, mock
+from unittest.mock import MagicMock
+
+import requests
+
+from minigalaxy.api import Api, ApiError
+from minigalaxy.catalog import Catalog
+from minigalaxy.checksums import DownloadChecksums
+from minigalaxy.download import Download
+from minigalaxy.download_journal import DownloadJournal
+from minigalaxy.download_manager import DownloadManager
+from minigalaxy.game import Game
+from minigalaxy.http_cache import HttpCache
+from minigalaxy.transport import configure_session
+from tests.fake_gog_server import FakeGogServer, FIRST_GAME_ID
+
+
+# Makes the requests of Api and DownloadManager to the fake GOG server
+class TestFakeGogServer(TestCase):
+    def setUp(self):
+        self.fake_gog = FakeGogServer(games=250, installer_size=3 * 1024 * 1024 + 123)
+        self.fake_gog.start()
+        self.addCleanup(self.fake_gog.stop)
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+        configure_session(self.session, pool_size=4)
+        self.fake_gog.redirect(self.session)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.config = {"api_cache_ttl": 3600, "refresh_token": "refresh", "lang": "en", "download_segments": 4}
+        config = MagicMock()
+        config.get.side_effect = self.config.get
+        config.set.side_effect = self.config.__setitem__
+        self.patch("minigalaxy.api.SESSION", self.session)
+        self.patch("minigalaxy.api.Config", config)
+        self.patch("minigalaxy.api.HttpCache", type(HttpCache)(os.path.join(self.temp_dir.name, "http")))
+        self.patch("minigalaxy.api.Catalog", type(Catalog)(os.path.join(self.temp_dir.name, "catalog.json")))
+        self.patch("minigalaxy.download_manager.SESSION", self.session)
+        self.patch("minigalaxy.download_manager.Config", config)
+        self.patch("minigalaxy.download_manager.MINIMUM_SEGMENT_SIZE", 64 * 1024)
+        self.patch("minigalaxy.download_manager.DownloadJournal",
+                   type(DownloadJournal)(os.path.join(self.temp_dir.name, "journal.json")))
+        self.patch("minigalaxy.download_manager.DownloadChecksums",
+                   type(DownloadChecksums)(os.path.join(self.temp_dir.name, "checksums.json")))
+        self.api = Api()
+        self.assertEqual("refresh", self.api.authenticate(refresh_token="refresh"))
+
+    def patch(self, target, new):
+        patcher = mock.patch(target, new)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test1_sync_library(self):
+        changes, err_msg = self.api.sync_library()
+        self.assertEqual("", err_msg)
+        self.assertEqual(250, len(changes["added"]))
+        self.assertEqual(3, self.fake_gog.requests["library_page"])
+        # The library is only retrieved again when the owned games change
+        changes, err_msg = self.api.sync_library()
+        self.assertEqual([], changes["added"])
+        self.assertEqual(3, self.fake_gog.requests["library_page"])
+        self.fake_gog.games = 251
+        changes, err_msg = self.api.sync_library()
+        self.assertEqual([FIRST_GAME_ID + 250], [game.id for game in changes["added"]])
+
+    def test2_request(self):
+        # Rejected tokens are refreshed
+        self.fake_gog.expire_tokens()
+        self.assertEqual("tester", self.api.get_user_info())
+        self.assertEqual(2, self.fake_gog.requests["token"])
+
+    @mock.patch("urllib3.util.retry.Retry.sleep")
+    def test3_request(self, mock_sleep):
+        # Requests are sent again while the server is unavailable
+        self.fake_gog.failures = 2
+        info = self.api.get_info(Game("Game", game_id=FIRST_GAME_ID), ["downloads"])
+        self.assertEqual(2, len(info["downloads"]["installers"]))
+        self.assertEqual(3, self.fake_gog.requests["product"])
+
+    @mock.patch("minigalaxy.rate_limiter.random.uniform", return_value=0)
+    def test4_request(self, mock_uniform):
+        # Throttled requests wait as long as the server asks
+        self.fake_gog.throttle_rate = 1
+        self.fake_gog.retry_after = 0
+        self.assertRaises(ApiError, self.api.get_info, Game("Game", game_id=FIRST_GAME_ID), ["downloads"])
+        self.assertEqual(4, self.fake_gog.requests["product"])
+
+    def test5_download(self):
+        game = Game("Game", game_id=FIRST_GAME_ID, platform="linux")
+        installer = self.api.get_download_info(game)
+        self.assertEqual("linux", installer["os"])
+        download_file = self.api.get_download_files([file["downlink"] for file in installer["files"]])[0]
+        self.assertEqual(self.fake_gog.installer_md5, download_file["md5"])
+        self.assertEqual(4, len(download_file["chunks"]))
+        save_location = os.path.join(self.temp_dir.name, "installer.sh")
+        download = Download(download_file["url"], save_location, md5=download_file["md5"],
+                            chunks=download_file["chunks"])
+        self.assertTrue(DownloadManager.download_operation(download, 0, "wb"))
+        with open(save_location, "rb") as save_file:
+            self.assertEqual(self.fake_gog.installer, save_file.read())
+        self.assertEqual(4, self.fake_gog.requests["installer"])
+
+
+# Game is imported again by the tests which replace its configuration
+del sys.modules["minigalaxy.game"]
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from unittest.mock import MagicMock
+
+from requests.exceptions import ConnectionError
+
+from minigalaxy.http_cache import HttpCache
+
+
+class TestHttpCache(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.cache_dir = os.path.join(self.temp_dir.name, "http")
+        self.cache = type(HttpCache)(self.cache_dir)
+        self.sent_headers = []
+
+    def send(self, status_code=200, body=None, headers=None):
+        def send_func(request_headers):
+            self.sent_headers.append(request_headers)
+            response = MagicMock()
+            response.status_code = status_code
+            response.headers = headers or {}
+            response.json.return_value = body
+            return response
+        return send_func
+
+    def test1_request(self):
+        body = self.cache.request("https://api/1", {"b": 2, "a": 1}, self.send(body={"id": 1}), 60)
+        self.assertEqual({"id": 1}, body)
+        # The order of the parameters doesn't matter
+        body = self.cache.request("https://api/1", {"a": 1, "b": 2}, self.send(body={"id": 2}), 60)
+        self.assertEqual({"id": 1}, body)
+        self.assertEqual(1, len(self.sent_headers))
+        self.assertEqual({"hits": 1, "misses": 1, "revalidations": 0, "stale": 0}, self.cache.get_counters())
+
+    def test2_request(self):
+        # Expired responses are revalidated with their ETag
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1000):
+            self.cache.request("https://api/1", None, self.send(body={"id": 1}, headers={"ETag": '"v1"'}), 60)
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1061):
+            body = self.cache.request("https://api/1", None, self.send(status_code=304), 60)
+        self.assertEqual({"id": 1}, body)
+        self.assertEqual({"If-None-Match": '"v1"'}, self.sent_headers[1])
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1100):
+            self.cache.request("https://api/1", None, self.send(body={"id": 2}), 60)
+        self.assertEqual(2, len(self.sent_headers))
+        self.assertEqual({"hits": 1, "misses": 1, "revalidations": 1, "stale": 0}, self.cache.get_counters())
+
+    def test3_request(self):
+        # Cache-Control overrides the ttl
+        self.cache.request("https://api/1", None, self.send(body=1, headers={"Cache-Control": "no-store"}), 60)
+        self.cache.request("https://api/2", None, self.send(body=2, headers={"Cache-Control": "max-age=0"}), 60)
+        self.cache.request("https://api/1", None, self.send(body=1), 60)
+        self.cache.request("https://api/2", None, self.send(body=2), 60)
+        self.assertEqual(4, len(self.sent_headers))
+
+    def test4_request(self):
+        # The cached response is used when the server can't be reached
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1000):
+            self.cache.request("https://api/1", None, self.send(body={"id": 1}), 60)
+        failing_send = MagicMock(side_effect=ConnectionError())
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=2000):
+            self.assertEqual({"id": 1}, self.cache.request("https://api/1", None, failing_send, 60))
+            self.assertRaises(ConnectionError, self.cache.request, "https://api/2", None, failing_send, 60)
+        self.assertEqual(1, self.cache.get_counters()["stale"])
+
+    def test5_request(self):
+        # The least recently used responses are removed when the cache is full
+        body = "x" * 100
+        self.cache = type(HttpCache)(self.cache_dir, maximum_size=400)
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1000):
+            self.cache.request("https://api/0", None, self.send(body=body), 60)
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1001):
+            self.cache.request("https://api/1", None, self.send(body=body), 60)
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1002):
+            self.cache.request("https://api/0", None, self.send(body=body), 60)
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1003):
+            self.cache.request("https://api/2", None, self.send(body=body), 60)
+        self.assertEqual(3, len(self.sent_headers))
+        self.assertEqual(2, len(os.listdir(self.cache_dir)))
+        # A new instance finds the cached responses on disk
+        self.cache = type(HttpCache)(self.cache_dir, maximum_size=400)
+        with mock.patch("minigalaxy.http_cache.time.time", return_value=1004):
+            for number in [0, 2, 1]:
+                self.cache.request("https://api/{}".format(number), None, self.send(body=body), 60)
+        self.assertEqual(4, len(self.sent_headers))
+        self.assertEqual(2, self.cache.get_counters()["hits"])
@@ -45,6 +45,26 @@ class Test(TestCase):
             obs = installer.verify_installer_integrity(game, installer_path)
         self.assertEqual(exp, obs)
 
+    @mock.patch('os.path.exists')
+    @mock.patch('minigalaxy.installer.get_file_md5')
+    @mock.patch('minigalaxy.installer.DownloadChecksums')
+    @mock.patch('os.listdir')
+    def test3_verify_installer_integrity(self, mock_listdir, mock_checksums, mock_get_file_md5, mock_is_file):
+        md5_sum = "5cc68247b61ba31e37e842fd04409d98"
+        installer_name = "beneath_a_steel_sky_en_gog_2_20150.sh"
+        mock_is_file.return_value = True
+        mock_listdir.return_value = [installer_name]
+        # The installer was hashed while it was downloaded
+        mock_checksums.get.return_value = md5_sum
+        game = Game("Beneath A Steel Sky", install_dir="/home/makson/GOG Games/Beneath a Steel Sky",
+                    md5sum={installer_name: md5_sum})
+        installer_path = "/home/user/.cache/minigalaxy/download/" \
+                         "Beneath a Steel Sky/{}".format(installer_name)
+        exp = ""
+        obs = installer.verify_installer_integrity(game, installer_path)
+        self.assertEqual(exp, obs)
+        mock_get_file_md5.assert_not_called()
+
     @mock.patch('os.path.exists')
     @mock.patch('os.listdir')
     @mock.patch('subprocess.Popen')
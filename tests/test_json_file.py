@@ -0,0 +1,27 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from minigalaxy.json_file import load_json_file, save_json_file
+
+
+class TestJsonFile(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, "minigalaxy", "file.json")
+
+    def test1_save_json_file(self):
+        self.assertEqual(len('{"a": [1, 2]}'), save_json_file(self.path, {"a": [1, 2]}))
+        self.assertEqual({"a": [1, 2]}, load_json_file(self.path))
+        save_json_file(self.path, [], sync=True)
+        self.assertEqual([], load_json_file(self.path, {}))
+        self.assertEqual(["file.json"], os.listdir(os.path.dirname(self.path)))
+
+    def test2_load_json_file(self):
+        self.assertEqual({}, load_json_file(self.path, {}))
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w") as file:
+            file.write("{")
+        self.assertIsNone(load_json_file(self.path))
+        self.assertEqual([], load_json_file(self.path, [], "Reading failed"))
@@ -0,0 +1,68 @@
+import time
+import threading
+from unittest import TestCase, mock
+from unittest.mock import MagicMock
+
+from minigalaxy.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(TestCase):
+    def response(self, status_code, retry_after=None):
+        return MagicMock(status_code=status_code, headers={"Retry-After": retry_after} if retry_after else {})
+
+    def test1_request(self):
+        # No more than max_in_flight requests are made at the same time
+        rate_limiter = type(RateLimiter)(max_in_flight=2, requests_per_second=1000)
+        release_requests = threading.Event()
+
+        def send():
+            release_requests.wait(5)
+            return self.response(200)
+        threads = [threading.Thread(target=rate_limiter.request, args=("https://api.gog.com/1", send))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        self.assertEqual(2, rate_limiter.get_counters()["api.gog.com"]["in_flight"])
+        release_requests.set()
+        for thread in threads:
+            thread.join(5)
+        counters = rate_limiter.get_counters()["api.gog.com"]
+        self.assertEqual((4, 0, 2), (counters["requests"], counters["in_flight"], counters["peak_in_flight"]))
+
+    def test2_request(self):
+        # After the first max_in_flight requests, requests are started at the given rate
+        rate_limiter = type(RateLimiter)(max_in_flight=2, requests_per_second=50)
+        start = time.monotonic()
+        for _ in range(7):
+            rate_limiter.request("https://api.gog.com/1", lambda: self.response(200))
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+        # Other hosts have their own limit
+        start = time.monotonic()
+        rate_limiter.request("https://embed.gog.com/1", lambda: self.response(200))
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    @mock.patch("minigalaxy.rate_limiter.random.uniform", return_value=0)
+    def test3_request(self, mock_uniform):
+        # Throttled requests are sent again after the host has been paused for as long as it asks
+        rate_limiter = type(RateLimiter)(requests_per_second=1000, retries=2)
+        send = MagicMock(side_effect=[self.response(429, "0.2"), self.response(200)])
+        start = time.monotonic()
+        responses = []
+        self.assertEqual(200, rate_limiter.request("https://api.gog.com/1", send, responses).status_code)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual([429, 200], [response.status_code for response in responses])
+        send = MagicMock(return_value=self.response(429, "0"))
+        self.assertEqual(429, rate_limiter.request("https://api.gog.com/1", send).status_code)
+        self.assertEqual(3, send.call_count)
+        counters = rate_limiter.get_counters()["api.gog.com"]
+        self.assertEqual((5, 4, 3), (counters["requests"], counters["throttled"], counters["retries"]))
+
+    def test_get_retry_delay(self):
+        rate_limiter = type(RateLimiter)(backoff=1)
+        self.assertTrue(5 <= rate_limiter.get_retry_delay("5", 0) <= 6)
+        retry_date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+        self.assertTrue(28 <= rate_limiter.get_retry_delay(retry_date, 0) <= 31)
+        self.assertTrue(0 <= rate_limiter.get_retry_delay(None, 2) <= 4)
+        self.assertTrue(0 <= rate_limiter.get_retry_delay("soon", 0) <= 1)
+        self.assertEqual(60, rate_limiter.get_retry_delay("86400", 0))
@@ -0,0 +1,41 @@
+import io
+import json
+from unittest import TestCase
+
+from minigalaxy.request_trace import RequestTrace
+
+
+class TestRequestTrace(TestCase):
+    def setUp(self):
+        self.trace = type(RequestTrace)(size=3)
+
+    def test1_record(self):
+        entry = self.trace.record("GET", "https://api.gog.com/products/1207658930?expand=downloads", 200, 512, 0.1,
+                                  0.2, "miss", 1)
+        self.assertEqual("https://api.gog.com/products/{id}", entry["url"])
+        self.assertEqual(512, entry["bytes"])
+        self.assertEqual("miss", entry["cache"])
+        self.assertEqual(1, entry["retries"])
+        # Only the latest entries are kept
+        for number in range(3):
+            self.trace.record("GET", "https://embed.gog.com/user/data/games", 200, 10, 0.1, number)
+        self.assertEqual([0, 1, 2], [entry["duration"] for entry in self.trace.get_entries()])
+
+    def test2_dump(self):
+        self.trace.record("GET", "https://embed.gog.com/user/data/games", 200, 10, 0.1, 0.5)
+        self.trace.record("GET", "https://embed.gog.com/account/gameDetails/1.json", None, None, None, 1.5)
+        trace_file = io.StringIO()
+        self.trace.dump(trace_file)
+        lines = trace_file.getvalue().splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual("https://embed.gog.com/account/gameDetails/{id}", json.loads(lines[1])["url"])
+        self.assertIsNone(json.loads(lines[1])["status"])
+
+    def test3_get_summary(self):
+        self.trace = type(RequestTrace)()
+        for duration in range(1, 21):
+            self.trace.record("GET", "https://api.gog.com/products/{}".format(duration), 200, 10, 0.1, duration)
+        self.trace.record("GET", "https://embed.gog.com/user/data/games", 200, 10, 0.1, 0.5)
+        summary = self.trace.get_summary()
+        self.assertEqual({"count": 20, "p50": 10, "p95": 19}, summary["GET https://api.gog.com/products/{id}"])
+        self.assertEqual({"count": 1, "p50": 0.5, "p95": 0.5}, summary["GET https://embed.gog.com/user/data/games"])
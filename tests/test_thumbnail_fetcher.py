@@ -0,0 +1,76 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+from minigalaxy.thumbnail_fetcher import ThumbnailFetcher
+
+
+class TestThumbnailFetcher(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.requested = []
+        self.first_request_started = threading.Event()
+        self.release_requests = threading.Event()
+        session_patch = mock.patch("minigalaxy.thumbnail_fetcher.SESSION")
+        self.session = session_patch.start()
+        self.session.get.side_effect = self.get
+        self.addCleanup(session_patch.stop)
+        self.addCleanup(self.release_requests.set)
+        self.addCleanup(self.temp_dir.cleanup)
+        # A single worker downloads the thumbnails one after the other
+        self.fetcher = type(ThumbnailFetcher)(1)
+
+    def get(self, url, timeout):
+        self.requested.append(url)
+        self.first_request_started.set()
+        self.release_requests.wait(5)
+        response = mock.MagicMock()
+        response.content = url.encode()
+        return response
+
+    def fetch(self, name, finished):
+        event = threading.Event()
+        save_location = os.path.join(self.temp_dir.name, "thumbnails", name)
+        self.fetcher.fetch(name, save_location, lambda: (finished.append(name), event.set()))
+        return event
+
+    def test1_fetch(self):
+        finished = []
+        first = self.fetch("a", finished)
+        self.first_request_started.wait(5)
+        events = [self.fetch(name, finished) for name in ["b", "c", "d", "e"]]
+        self.fetcher.set_visible(["d", "c"])
+        self.release_requests.set()
+        self.assertTrue(first.wait(5))
+        for event in events:
+            self.assertTrue(event.wait(5))
+        # Visible thumbnails go first, the others follow in the order they were asked for
+        self.assertEqual(["a", "d", "c", "b", "e"], self.requested)
+        self.assertEqual(["a", "d", "c", "b", "e"], finished)
+        with open(os.path.join(self.temp_dir.name, "thumbnails", "c"), "rb") as thumbnail:
+            self.assertEqual(b"c", thumbnail.read())
+
+    def test2_fetch(self):
+        # A thumbnail which is asked for again before being downloaded is only downloaded once
+        finished = []
+        first = self.fetch("a", finished)
+        self.first_request_started.wait(5)
+        self.fetch("b", finished)
+        self.fetch("b", finished)
+        self.fetcher.set_visible(["b"])
+        self.fetcher.set_visible(["b"])
+        self.release_requests.set()
+        self.assertTrue(first.wait(5))
+        self.assertTrue(self.fetch("c", finished).wait(5))
+        self.assertEqual(["a", "b", "c"], self.requested)
+        self.assertEqual(["a", "b", "b", "c"], finished)
+
+    def test3_fetch(self):
+        # The worker goes on with the next thumbnail when a finish function fails
+        finished = []
+        self.release_requests.set()
+        self.fetcher.fetch("a", os.path.join(self.temp_dir.name, "thumbnails", "a"), mock.MagicMock(side_effect=OSError))
+        self.assertTrue(self.fetch("b", finished).wait(5))
+        self.assertEqual(["a", "b"], self.requested)
+        self.assertEqual(["b"], finished)
@@ -0,0 +1,74 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+
+import requests
+
+from minigalaxy.transport import PoolStatistics, configure_session
+
+
+class TransportRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    failures = 0
+
+    def do_GET(self):
+        status = 200
+        if self.path == "/flaky" and TransportRequestHandler.failures > 0:
+            TransportRequestHandler.failures -= 1
+            status = 503
+        if self.path == "/throttled":
+            status = 429
+        body = str(status).encode()
+        self.send_response(status)
+        self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestTransport(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), TransportRequestHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+        configure_session(self.session, pool_size=2)
+
+    def test1_configure_session(self):
+        # Connections are reused and their use is counted
+        for _ in range(3):
+            self.assertEqual(200, self.session.get(self.url + "/").status_code)
+        statistics = PoolStatistics.get_statistics()[self.url]
+        self.assertEqual({"pool_size": 2, "in_use": 0, "peak_in_use": 1, "requests": 3, "exhausted": 0},
+                         {key: value for key, value in statistics.items() if key != "wait_seconds"})
+        # A streamed response keeps its connection until it's read
+        responses = [self.session.get(self.url + "/", stream=True) for _ in range(3)]
+        statistics = PoolStatistics.get_statistics()[self.url]
+        self.assertEqual(3, statistics["in_use"])
+        self.assertEqual(1, statistics["exhausted"])
+        for response in responses:
+            response.content
+        self.assertEqual(0, PoolStatistics.get_statistics()[self.url]["in_use"])
+
+    @mock.patch("urllib3.util.retry.Retry.sleep")
+    def test2_configure_session(self, mock_sleep):
+        # Requests are sent again when the server is temporarily unavailable
+        TransportRequestHandler.failures = 2
+        response = self.session.get(self.url + "/flaky")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, mock_sleep.call_count)
+        TransportRequestHandler.failures = 10
+        response = self.session.get(self.url + "/flaky")
+        self.assertEqual(503, response.status_code)
+        TransportRequestHandler.failures = 0
+        # Throttled requests are left to the rate limiter of the API
+        response = self.session.get(self.url + "/throttled")
+        self.assertEqual(429, response.status_code)
+        self.assertEqual(5, mock_sleep.call_count)
@@ -42,7 +42,9 @@ class UnitTestGiRepository:
         pass
 
     class GLib:
-        pass
+        @staticmethod
+        def idle_add(function, *args):
+            pass
 
 
 u_gi_repository = UnitTestGiRepository()
@@ -76,7 +78,7 @@ class TestLibrary(TestCase):
             api_games.append(Game(name=game, game_id=int(API_GAMES[game]),))
         err_msg = ""
         api_mock = MagicMock()
-        api_mock.get_library.return_value = api_games, err_msg
+        api_mock.sync_library.return_value = {"added": api_games, "removed": [], "changed": []}, err_msg
         test_library = Library(MagicMock(), api_mock)
         test_library.games = self_games
         test_library._Library__add_games_from_api()
@@ -93,7 +95,7 @@ class TestLibrary(TestCase):
             api_games.append(Game(name=game, game_id=int(API_GAMES[game]),))
         err_msg = ""
         api_mock = MagicMock()
-        api_mock.get_library.return_value = api_games, err_msg
+        api_mock.sync_library.return_value = {"added": api_games, "removed": [], "changed": []}, err_msg
         test_library = Library(MagicMock(), api_mock)
         test_library.games = self_games
         test_library._Library__add_games_from_api()
@@ -113,7 +115,7 @@ class TestLibrary(TestCase):
         api_games.append(api_gmae_with_id)
         err_msg = ""
         api_mock = MagicMock()
-        api_mock.get_library.return_value = api_games, err_msg
+        api_mock.sync_library.return_value = {"added": api_games, "removed": [], "changed": []}, err_msg
         test_library = Library(MagicMock(), api_mock)
         test_library.games = self_games
         test_library._Library__add_games_from_api()
@@ -135,7 +137,7 @@ class TestLibrary(TestCase):
             url_nr += 1
         err_msg = ""
         api_mock = MagicMock()
-        api_mock.get_library.return_value = api_games, err_msg
+        api_mock.sync_library.return_value = {"added": api_games, "removed": [], "changed": []}, err_msg
         test_library = Library(MagicMock(), api_mock)
         test_library.games = self_games
         test_library._Library__add_games_from_api()
@@ -143,6 +145,24 @@ class TestLibrary(TestCase):
         obs = test_library.games[0].url
         self.assertEqual(exp, obs)
 
+    def test5_add_games_from_api(self):
+        # The games which were added, changed or removed since the library was cached are applied
+        cached_games = [Game(name=game, game_id=int(API_GAMES[game])) for game in API_GAMES]
+        added_game = Game(name="Added Game", game_id=1)
+        changed_game = Game(name=cached_games[0].name, game_id=cached_games[0].id, url="http://changed_url")
+        removed_game = cached_games[1]
+        api_mock = MagicMock()
+        api_mock.sync_library.return_value = {"added": [added_game], "removed": [removed_game],
+                                              "changed": [changed_game]}, ""
+        test_library = Library(MagicMock(), api_mock)
+        test_library.games = cached_games
+        test_library._Library__add_games_from_api()
+        self.assertEqual(len(API_GAMES), len(test_library.games))
+        self.assertIn(added_game, test_library.games)
+        self.assertNotIn(removed_game, test_library.games)
+        self.assertEqual("http://changed_url", test_library.games[0].url)
+        self.assertFalse(test_library.offline)
+
 
 del sys.modules['gi']
 del sys.modules['gi.repository']
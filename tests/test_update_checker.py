@@ -0,0 +1,91 @@
+import threading
+import time
+from unittest import TestCase, mock
+from unittest.mock import MagicMock
+
+from requests.exceptions import ConnectionError
+
+from minigalaxy.game import Game
+from minigalaxy.update_checker import UpdateChecker
+
+
+class TestUpdateChecker(TestCase):
+    def setUp(self):
+        self.api = MagicMock()
+        self.api.get_info.side_effect = lambda game, sections: {"id": game.id}
+        self.api.get_version.side_effect = lambda game, gameinfo: "version {}".format(game.id)
+        self.results = {}
+        self.checked = threading.Semaphore(0)
+
+    def callback(self, game_id):
+        def callback_func(game_info, game_version):
+            self.results[game_id] = (game_info, game_version)
+            self.checked.release()
+        return callback_func
+
+    def test1_add(self):
+        checker = UpdateChecker(self.api, workers=2)
+        games = [Game("Game {}".format(game_id), game_id=game_id) for game_id in range(1, 6)]
+        for game in games:
+            checker.add(game, self.callback(game.id))
+        for _ in games:
+            self.assertTrue(self.checked.acquire(timeout=5))
+        self.assertEqual(({"id": 3}, "version 3"), self.results[3])
+        self.assertEqual(5, self.api.get_info.call_count)
+        # Games which were checked recently get the last result right away
+        self.results = {}
+        checker.add(games[0], self.callback(1))
+        self.assertEqual(({"id": 1}, "version 1"), self.results[1])
+        self.assertEqual(5, self.api.get_info.call_count)
+
+    def test2_add(self):
+        # The number of games checked at the same time is limited
+        running = []
+        maximum_running = []
+        lock = threading.Lock()
+
+        def get_info(game, sections):
+            with lock:
+                running.append(game)
+                maximum_running.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(game)
+            return {"id": game.id}
+        self.api.get_info.side_effect = get_info
+        checker = UpdateChecker(self.api, workers=3)
+        for game_id in range(1, 21):
+            checker.add(Game("Game {}".format(game_id), game_id=game_id), self.callback(game_id))
+        for _ in range(20):
+            self.assertTrue(self.checked.acquire(timeout=5))
+        self.assertLessEqual(max(maximum_running), 3)
+
+    def test3_add(self):
+        # Failed checks and old results are checked again
+        failed = threading.Event()
+
+        def get_info(game, sections):
+            if not failed.is_set():
+                failed.set()
+                raise ConnectionError()
+            return {"id": game.id}
+        self.api.get_info.side_effect = get_info
+        checker = UpdateChecker(self.api, workers=1, interval=3600)
+        game = Game("Game", game_id=1)
+        checker.add(game, self.callback(1))
+        self.assertTrue(failed.wait(5))
+        self.assertFalse(self.checked.acquire(timeout=0.05))
+        checker.add(game, self.callback(1))
+        self.assertTrue(self.checked.acquire(timeout=5))
+        with mock.patch("minigalaxy.update_checker.time.time", return_value=time.time() + 3600):
+            checker.add(game, self.callback(1))
+        self.assertTrue(self.checked.acquire(timeout=5))
+        self.assertEqual(3, self.api.get_info.call_count)
+
+    def test4_add(self):
+        # The worker goes on with the next game when a callback fails
+        checker = UpdateChecker(self.api, workers=1)
+        checker.add(Game("Game", game_id=1), MagicMock(side_effect=ValueError))
+        checker.add(Game("Other game", game_id=2), self.callback(2))
+        self.assertTrue(self.checked.acquire(timeout=5))
+        self.assertEqual(({"id": 2}, "version 2"), self.results[2])